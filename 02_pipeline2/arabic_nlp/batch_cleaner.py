@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Batch Cleaner — تنظيف دفعي متعدد العمليات
+==========================================
+يوزّع قوائم نصوص (أو ملفات) كبيرة على عدة عمليات بدفعات بحجم chunk_size:
+  - النتائج بنفس ترتيب المدخلات.
+  - الذاكرة محدودة: المدخلات تُستهلك بكسل، ولا يتجاوز ما في الطيران
+    max_pending دفعة — وفي وضع الملفات يقرأ العامل ويكتب بنفسه.
+  - توقيت لكل دفعة (BatchTiming) في .timings وعبر on_batch.
+
+يعمل مع أي منظّف قابل للـ pickle: BaseCleaner (quick_clean فقط — بلا deep_clean)
+أو OpenITICleaner (clean). يُنقل المنظّف مرة واحدة لكل عامل (initializer).
+
+الاستخدام:
+    batch = BatchCleaner(OpenITICleaner(), workers=8, chunk_size=64)
+    for cleaned in batch.clean_texts(texts):
+        ...
+    batch.clean_files(paths, output_dir="/data/openiti-clean")
+
+    python -m arabic_nlp.batch_cleaner SRC_DIR OUT_DIR --openiti --workers 8
+"""
+import logging
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Deque, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("pipeline.cleaner.batch")
+
+DEFAULT_CHUNK_SIZE = 256
+
+# ملفات نصوص OpenITI: 0255Jahiz.Hayawan.Shamela0001234-ara1(.mARkdown|.inProgress|.completed)
+OPENITI_TEXT_RE = re.compile(r"^\d{4}\w+\.\w+\.\w+-[a-z]{3}\d(\.(mARkdown|inProgress|completed))?$")
+
+
+@dataclass
+class BatchTiming:
+    """توقيت دفعة واحدة — يُقاس داخل العامل"""
+    batch_index: int
+    items: int
+    chars_in: int
+    chars_out: int
+    seconds: float
+    worker_pid: int = 0
+
+    @property
+    def mb_per_sec(self) -> float:
+        return self.chars_in / (1024 * 1024) / self.seconds if self.seconds else 0.0
+
+
+@dataclass
+class FileCleanResult:
+    """نتيجة ملف في clean_files — text فارغ إذا كُتب الناتج إلى output_path"""
+    source_path: str
+    output_path: str = ""
+    text: str = ""
+    chars_in: int = 0
+    chars_out: int = 0
+    error: str = ""
+
+
+@dataclass
+class BatchSummary:
+    batches: int = 0
+    items: int = 0
+    chars_in: int = 0
+    chars_out: int = 0
+    worker_seconds: float = 0.0
+    wall_seconds: float = 0.0
+    timings: List[BatchTiming] = field(default_factory=list)
+
+    @property
+    def mb_per_sec(self) -> float:
+        return self.chars_in / (1024 * 1024) / self.wall_seconds if self.wall_seconds else 0.0
+
+
+class BatchCleaner:
+    """
+    Args:
+        cleaner: منظّف (ArabicCleaner / OpenITICleaner / ...)
+        workers: عدد العمليات — 1 = في نفس العملية (بلا pool)، None = os.cpu_count()
+        chunk_size: عدد النصوص/الملفات في كل دفعة
+        max_pending: حد الدفعات في الطيران (افتراضي workers × 2)
+        on_batch: دالة تُستدعى بـ BatchTiming عند اكتمال كل دفعة (بالترتيب)
+    """
+
+    def __init__(
+        self,
+        cleaner,
+        workers: Optional[int] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_pending: Optional[int] = None,
+        on_batch: Optional[Callable[[BatchTiming], None]] = None,
+    ):
+        if chunk_size < 1:
+            raise ValueError("chunk_size يجب أن يكون ≥ 1")
+        self.cleaner = cleaner
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.chunk_size = chunk_size
+        self.max_pending = max(1, max_pending or self.workers * 2)
+        self.on_batch = on_batch
+        self.summary = BatchSummary()
+
+    @property
+    def timings(self) -> List[BatchTiming]:
+        return self.summary.timings
+
+    def clean_texts(self, texts: Iterable[str]) -> Iterator[str]:
+        """تنظيف نصوص — مولّد بنفس ترتيب المدخلات"""
+        for batch in self._run(_clean_text_batch, texts):
+            yield from batch
+
+    def clean_files(
+        self,
+        paths: Iterable,
+        output_dir: Optional[str] = None,
+        suffix: str = "",
+        encoding: str = "utf-8",
+        source_dir: Optional[str] = None,
+    ) -> Iterator[FileCleanResult]:
+        """
+        تنظيف ملفات — العامل يقرأ الملف ويكتب الناتج إلى output_dir.
+        مع source_dir يُحفظ المسار النسبي: output_dir/<relative_to(source_dir)><suffix>؛
+        بدونه output_dir/<name><suffix> — وتكرار الاسم يرفع ValueError بدل الكتابة فوقه.
+        بدون output_dir يُعاد النص المنظَّف في FileCleanResult.text.
+        """
+        if output_dir:
+            Path(output_dir).mkdir(parents=True, exist_ok=True)
+        jobs = _file_jobs(paths, output_dir or "", suffix, encoding, source_dir)
+        for batch in self._run(_clean_file_batch, jobs):
+            yield from batch
+
+    # ── التنفيذ ──
+
+    def _run(self, batch_fn, items: Iterable) -> Iterator[list]:
+        self.summary = BatchSummary()
+        started = time.perf_counter()
+        batches = _batched(items, self.chunk_size)
+        try:
+            if self.workers == 1:
+                _init_worker(self.cleaner)
+                for index, batch in enumerate(batches):
+                    yield self._collect(batch_fn(index, batch))
+                return
+            with ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.cleaner,),
+            ) as pool:
+                pending: Deque[Future] = deque()
+                for index, batch in enumerate(batches):
+                    pending.append(pool.submit(batch_fn, index, batch))
+                    if len(pending) >= self.max_pending:
+                        yield self._collect(pending.popleft().result())
+                while pending:
+                    yield self._collect(pending.popleft().result())
+        finally:
+            self.summary.wall_seconds = time.perf_counter() - started
+
+    def _collect(self, outcome: Tuple[list, BatchTiming]) -> list:
+        results, timing = outcome
+        s = self.summary
+        s.batches += 1
+        s.items += timing.items
+        s.chars_in += timing.chars_in
+        s.chars_out += timing.chars_out
+        s.worker_seconds += timing.seconds
+        s.timings.append(timing)
+        logger.debug(
+            "دفعة %d: %d عنصر، %.2f ث (%.1f MB/s، pid=%d)",
+            timing.batch_index, timing.items, timing.seconds, timing.mb_per_sec, timing.worker_pid,
+        )
+        if self.on_batch:
+            self.on_batch(timing)
+        return results
+
+
+def _file_jobs(
+    paths: Iterable,
+    output_dir: str,
+    suffix: str,
+    encoding: str,
+    source_dir: Optional[str],
+) -> Iterator[tuple]:
+    """(source, out_path, encoding) — مسارات الإخراج تُحسب هنا ليُكشف التكرار قبل الكتابة"""
+    seen = {}
+    for p in paths:
+        source = Path(p)
+        if not output_dir:
+            yield str(source), "", encoding
+            continue
+        relative = source.relative_to(source_dir) if source_dir else Path(source.name)
+        out = Path(output_dir) / relative.with_name(relative.name + suffix)
+        if out in seen:
+            raise ValueError("تعارض في أسماء الإخراج: {} و {} → {}".format(seen[out], source, out))
+        seen[out] = source
+        yield str(source), str(out), encoding
+
+
+# ─────────────────────────────────────────────
+# Worker — على مستوى الوحدة ليُنقل بالـ pickle
+# ─────────────────────────────────────────────
+
+_WORKER_CLEAN: Optional[Callable[[str], str]] = None
+
+
+def _init_worker(cleaner) -> None:
+    """يُنفَّذ مرة واحدة لكل عملية عامل — quick_clean للمنظّفات اللغوية، clean لـ OpenITI"""
+    global _WORKER_CLEAN
+    _WORKER_CLEAN = getattr(cleaner, "quick_clean", None) or cleaner.clean
+
+
+def _clean_text_batch(index: int, texts: List[str]) -> Tuple[List[str], BatchTiming]:
+    t0 = time.perf_counter()
+    cleaned = [_WORKER_CLEAN(t) for t in texts]
+    timing = BatchTiming(
+        batch_index=index,
+        items=len(texts),
+        chars_in=sum(len(t) for t in texts if t),
+        chars_out=sum(len(t) for t in cleaned if t),
+        seconds=time.perf_counter() - t0,
+        worker_pid=os.getpid(),
+    )
+    return cleaned, timing
+
+
+def _clean_file_batch(index: int, jobs: List[tuple]) -> Tuple[List[FileCleanResult], BatchTiming]:
+    t0 = time.perf_counter()
+    results = []
+    for source, out_path, encoding in jobs:
+        result = FileCleanResult(source_path=source)
+        try:
+            text = Path(source).read_text(encoding=encoding)
+            cleaned = _WORKER_CLEAN(text)
+            result.chars_in, result.chars_out = len(text), len(cleaned)
+            if out_path:
+                out = Path(out_path)
+                out.parent.mkdir(parents=True, exist_ok=True)
+                tmp = out.with_name(out.name + ".tmp")
+                tmp.write_text(cleaned, encoding=encoding)
+                os.replace(tmp, out)
+                result.output_path = str(out)
+            else:
+                result.text = cleaned
+        except Exception as e:
+            result.error = str(e)
+            logger.error("فشل تنظيف %s: %s", source, e)
+        results.append(result)
+    timing = BatchTiming(
+        batch_index=index,
+        items=len(jobs),
+        chars_in=sum(r.chars_in for r in results),
+        chars_out=sum(r.chars_out for r in results),
+        seconds=time.perf_counter() - t0,
+        worker_pid=os.getpid(),
+    )
+    return results, timing
+
+
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    it = iter(items)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+# ─────────────────────────────────────────────
+# CLI — تنظيف مجلد كامل (مثل إصدار OpenITI)
+# ─────────────────────────────────────────────
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="تنظيف دفعي متعدد العمليات لمجلد نصوص")
+    parser.add_argument("source_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument(
+        "--glob", default=None,
+        help="نمط الملفات داخل المجلد (بحث متكرر) — الافتراضي *.txt، أو ملفات نصوص OpenITI مع --openiti",
+    )
+    parser.add_argument("--openiti", action="store_true", help="OpenITICleaner بدل get_cleaner(--lang)")
+    parser.add_argument("--aggressive", action="store_true")
+    parser.add_argument("--lang", default="ar", choices=["ar", "en", "mixed"])
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=16)
+    parser.add_argument("--suffix", default=".clean.txt")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    if args.openiti:
+        from .openiti_cleaner import OpenITICleaner
+        cleaner = OpenITICleaner(aggressive=args.aggressive)
+    else:
+        from .text_cleaner import get_cleaner
+        cleaner = get_cleaner(args.lang)
+
+    if args.glob:
+        candidates = Path(args.source_dir).rglob(args.glob)
+    elif args.openiti:
+        candidates = (p for p in Path(args.source_dir).rglob("*") if OPENITI_TEXT_RE.match(p.name))
+    else:
+        candidates = Path(args.source_dir).rglob("*.txt")
+    paths = (p for p in sorted(candidates) if p.is_file())
+    batch = BatchCleaner(
+        cleaner, workers=args.workers, chunk_size=args.chunk_size,
+        on_batch=lambda t: logger.info(
+            "دفعة %d: %d ملف، %.1f ث، %.1f MB/s", t.batch_index, t.items, t.seconds, t.mb_per_sec),
+    )
+    results = batch.clean_files(paths, args.output_dir, suffix=args.suffix, source_dir=args.source_dir)
+    failed = [r for r in results if r.error]
+    s = batch.summary
+    logger.info(
+        "اكتمل: %d ملف في %d دفعة، %.1f ث (%.1f MB/s)، أخطاء: %d",
+        s.items, s.batches, s.wall_seconds, s.mb_per_sec, len(failed),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Cleaning Engine — محرك تنظيف مُجمَّع
+=====================================
+يحوّل قائمة قواعد المنظّف (sub / translate / delete_chars / func) إلى أرخص
+تسلسل مرورات ممكن، بمخرجات مطابقة حرفاً بحرف للتطبيق التسلسلي:
+
+  - قواعد translate/delete_chars المتجاورة تُركَّب في جدول واحد (تركيب دوال
+    دقيق)، ثم يُنفَّذ الجدول كصنف حروف لكل قيمة هدف (re.sub باستبدال حرفي
+    أو str.replace لحرف واحد) — في CPython هذا أسرع بكثير من str.translate
+    بقاموس. إن تداخلت الأهداف مع المصادر أو كثرت الأهداف: str.translate.
+  - كل قاعدة sub تحمل حارساً: أطول نص حرفي يجب أن يظهر في أي تطابق
+    (مثل "#META#" أو "___"). إن غاب من النص يُتخطّى المرور كاملاً — فحص
+    `in` أسرع بعشرات المرات من مسح sre.
+  - قواعد func (مثل strip لكل سطر) تبقى مروراً مستقلاً.
+
+ملاحظة: دمج قواعد sub في بديل واحد (p1|p2|...) قيس وكان أبطأ في محرك re
+(يفقد مسح البادئة الحرفية ويضيف استدعاء Python لكل تطابق) — لذلك لا يُستخدم.
+
+الاستخدام:
+    rules = [delete_chars(INVISIBLE), sub(MULTI_SPACES, " "), sub(MULTI_NEWLINES, "\\n\\n")]
+    pipeline = CleaningPipeline(rules)
+    pipeline(text)
+"""
+import logging
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence
+
+try:
+    import re._parser as _sre_parse          # Python ≥ 3.11
+except ImportError:                          # pragma: no cover
+    import sre_parse as _sre_parse
+
+logger = logging.getLogger("pipeline.cleaner.engine")
+
+# حد عدد قيم الهدف المختلفة لتنفيذ الجدول كأصناف حروف بدل str.translate
+MAX_CHARMAP_SUBS = 8
+
+_BMP = "".join(chr(cp) for cp in range(0x10000) if not 0xD800 <= cp <= 0xDFFF)
+_REPEATS = tuple(
+    getattr(_sre_parse, name) for name in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT")
+    if hasattr(_sre_parse, name)
+)
+
+
+@dataclass(frozen=True)
+class Rule:
+    """قاعدة تنظيف واحدة — تُنشأ عبر sub() / translate() / delete_chars() / func()"""
+    kind: str                                   # sub | translate | func
+    pattern: Optional[re.Pattern] = None
+    repl: str = ""
+    table: Optional[Dict[int, Optional[str]]] = None
+    func: Optional[Callable[[str], str]] = None
+
+
+def sub(pattern, repl: str) -> Rule:
+    if isinstance(pattern, str):
+        pattern = re.compile(pattern)
+    return Rule(kind="sub", pattern=pattern, repl=repl)
+
+
+def translate(table: Dict[int, object]) -> Rule:
+    return Rule(kind="translate", table=_normalize_table(table))
+
+
+def delete_chars(char_class: re.Pattern) -> Rule:
+    """
+    نمط صنف حروف (مثل INVISIBLE_CHARS) → قاعدة حذف.
+
+    النمط يبقى للتطبيق المرجعي (re.sub كما في المنظّفات الأصلية)، والجدول
+    (نقاط BMP فقط) للتركيب مع قواعد translate المجاورة.
+    """
+    chars = char_class.findall(_BMP)
+    if any(len(c) != 1 for c in chars):
+        raise ValueError("delete_chars يتطلب نمط حرف واحد: {}".format(char_class.pattern))
+    return Rule(kind="translate", pattern=char_class, table=dict.fromkeys(map(ord, chars)))
+
+
+def func(fn: Callable[[str], str]) -> Rule:
+    return Rule(kind="func", func=fn)
+
+
+# ─────────────────────────────────────────────
+# Steps — كائنات قابلة للـ pickle (للتنظيف متعدد العمليات)
+# ─────────────────────────────────────────────
+
+class _SubStep:
+    def __init__(self, pattern: re.Pattern, repl: str, required: str = ""):
+        self.pattern = pattern
+        self.repl = repl
+        self.required = required
+
+    def __call__(self, text: str) -> str:
+        if self.required and self.required not in text:
+            return text
+        return self.pattern.sub(self.repl, text)
+
+
+class _ReplaceStep:
+    def __init__(self, old: str, new: str):
+        self.old = old
+        self.new = new
+
+    def __call__(self, text: str) -> str:
+        return text.replace(self.old, self.new)
+
+
+class _TranslateStep:
+    def __init__(self, table: Dict[int, Optional[str]]):
+        self.table = table
+
+    def __call__(self, text: str) -> str:
+        return text.translate(self.table)
+
+
+# ─────────────────────────────────────────────
+# Pipeline
+# ─────────────────────────────────────────────
+
+class CleaningPipeline:
+    """
+    خط تنظيف مُجمَّع.
+
+    Args:
+        rules: القواعد بترتيب التطبيق
+        optimize: False = مرور لكل قاعدة بلا حراس (السلوك المرجعي، يُستخدم في القياس والتحقق)
+    """
+
+    def __init__(self, rules: Sequence[Rule], optimize: bool = True):
+        self.rules = list(rules)
+        self.optimize = optimize
+        self.steps: List[Callable[[str], str]] = (
+            self._compile(self.rules) if optimize else [self._compile_one(r) for r in self.rules]
+        )
+
+    def __call__(self, text: str) -> str:
+        for step in self.steps:
+            text = step(text)
+        return text
+
+    @property
+    def passes(self) -> int:
+        return len(self.steps)
+
+    def verify(self, texts: Sequence[str]) -> List[int]:
+        """مواضع النصوص التي يختلف فيها الناتج المُجمَّع عن التسلسلي — قائمة فارغة = مطابق"""
+        reference = CleaningPipeline(self.rules, optimize=False)
+        return [i for i, t in enumerate(texts) if self(t) != reference(t)]
+
+    @staticmethod
+    def _compile_one(rule: Rule) -> Callable[[str], str]:
+        if rule.kind == "sub":
+            return _SubStep(rule.pattern, rule.repl)
+        if rule.kind == "translate":
+            return _SubStep(rule.pattern, "") if rule.pattern is not None else _TranslateStep(rule.table)
+        return rule.func
+
+    @classmethod
+    def _compile(cls, rules: Sequence[Rule]) -> List[Callable[[str], str]]:
+        steps = []
+        i = 0
+        while i < len(rules):
+            rule = rules[i]
+            j = i + 1
+            if rule.kind == "translate":
+                table = rule.table
+                while j < len(rules) and rules[j].kind == "translate":
+                    table = _compose_tables(table, rules[j].table)
+                    j += 1
+                steps.extend(_charmap_steps(table))
+            elif rule.kind == "sub":
+                steps.append(_SubStep(rule.pattern, rule.repl, _required_literal(rule.pattern)))
+            else:
+                steps.append(cls._compile_one(rule))
+            i = j
+        return steps
+
+
+# ─────────────────────────────────────────────
+# Helpers
+# ─────────────────────────────────────────────
+
+def _normalize_table(table: Dict[int, object]) -> Dict[int, Optional[str]]:
+    """قيم str.maketrans قد تكون int أو str أو None — توحيدها إلى str | None"""
+    return {k: chr(v) if isinstance(v, int) else v for k, v in table.items()}
+
+
+def _compose_tables(first: Dict[int, Optional[str]], second: Dict[int, Optional[str]]) -> Dict[int, Optional[str]]:
+    """جدول يكافئ text.translate(first).translate(second)"""
+    composed = {k: (v.translate(second) if v else v) for k, v in first.items()}
+    for k, v in second.items():
+        composed.setdefault(k, v)
+    return composed
+
+
+def _charmap_steps(table: Dict[int, Optional[str]]) -> List[Callable[[str], str]]:
+    """
+    تنفيذ جدول translate كمرور لكل قيمة هدف.
+
+    يكافئ str.translate فقط إذا لم يحتوِ أي هدف حرفاً من المصادر (فلا يعيد
+    مرورٌ لاحق تحويل ناتج مرور سابق) — وإلا يبقى str.translate.
+    """
+    by_target: Dict[str, List[str]] = {}
+    for code, target in table.items():
+        if target is None or target != chr(code):
+            by_target.setdefault(target or "", []).append(chr(code))
+    sources = {chr(code) for code in table}
+    if len(by_target) > MAX_CHARMAP_SUBS or any(ch in sources for t in by_target for ch in t):
+        return [_TranslateStep(table)]
+    steps = []
+    for target, chars in by_target.items():
+        if len(chars) == 1:
+            steps.append(_ReplaceStep(chars[0], target))
+        else:
+            pattern = re.compile("[{}]".format("".join(re.escape(c) for c in sorted(chars))))
+            steps.append(_SubStep(pattern, target.replace("\\", "\\\\")))
+    return steps
+
+
+def _required_literal(pattern: re.Pattern) -> str:
+    """
+    أطول نص حرفي يظهر في كل تطابق للنمط — "" إن تعذّر الاستنتاج.
+
+    يُقرأ المستوى الأعلى من شجرة sre فقط: LITERAL وتكرار حرف واحد (حدّه الأدنى)
+    والمرساة (عرض صفري) تُكمل السلسلة؛ أي عقدة أخرى تقطعها.
+    """
+    if pattern.flags & re.IGNORECASE:
+        return ""
+    try:
+        parsed = _sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:
+        return ""
+    state = getattr(parsed, "state", None) or getattr(parsed, "pattern", None)
+    if state is not None and state.flags & re.IGNORECASE:
+        return ""
+    best, run = "", []
+    for op, av in parsed:
+        if op is _sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+        if op is _sre_parse.AT:
+            continue
+        if op in _REPEATS and len(av[2]) == 1 and av[2][0][0] is _sre_parse.LITERAL:
+            low, high, item = av
+            run.append(chr(item[0][1]) * low)
+            if high == low:
+                continue
+        candidate = "".join(run)
+        best = candidate if len(candidate) > len(best) else best
+        run = []
+    candidate = "".join(run)
+    return candidate if len(candidate) > len(best) else best
@@ -1,6 +1,15 @@
 import re
 from typing import Optional
 
+from .batch_cleaner import DEFAULT_CHUNK_SIZE, BatchCleaner
+from .cleaning_engine import CleaningPipeline, func, sub
+
+PARAGRAPH_RUNS = re.compile(r'\n\s*\n\s*\n')
+
+
+def _finalize(text: str) -> str:
+    return PARAGRAPH_RUNS.sub('\n\n', text.strip())
+
 
 class OpenITICleaner:
     """ينظف نصوص OpenITI من الرموز والميتاداتا غير الضرورية"""
@@ -35,19 +44,22 @@ class OpenITICleaner:
                 (re.compile(r'\(\d+/\d+\)'), ''),
                 (re.compile(r'\[\d+\]'),      ''),
             ]
+        self.pipeline = CleaningPipeline(self.engine_rules())
+
+    def engine_rules(self) -> list:
+        """القواعد بصيغة cleaning_engine — بما فيها خطوة الإنهاء"""
+        return [sub(p, r) for p, r in self.patterns] + [func(_finalize)]
 
     def clean(self, text: str) -> str:
         if not text:
             return text
-        result = text
-        for pattern, replacement in self.patterns:
-            result = pattern.sub(replacement, result)
-        result = result.strip()
-        result = re.sub(r'\n\s*\n\s*\n', '\n\n', result)
-        return result
+        return self.pipeline(text)
 
-    def clean_batch(self, texts: list) -> list:
-        return [self.clean(t) for t in texts]
+    def clean_batch(self, texts: list, workers: int = 1, chunk_size: int = DEFAULT_CHUNK_SIZE) -> list:
+        """workers > 1: توزيع على عمليات عبر BatchCleaner (بنفس الترتيب)"""
+        if workers == 1:
+            return [self.clean(t) for t in texts]
+        return list(BatchCleaner(self, workers=workers, chunk_size=chunk_size).clean_texts(texts))
 
     def stats(self, original: str, cleaned: str) -> dict:
         orig_len  = len(original)
@@ -8,17 +8,25 @@ DEC-P1-027: LanguageAwareCleaner
   - EnglishCleaner: تطبيع Unicode NFC + تنظيف عام
   - MixedCleaner: تنظيف آمن للغتين (عام فقط)
 
+القواعد تُجمَّع عبر CleaningPipeline (cleaning_engine) في أقل عدد من
+المرورات بمخرجات مطابقة — engine_rules() تُرجع القائمة المرجعية لكل منظّف.
+
 الاستخدام:
-    from text_cleaner import get_cleaner
+    from arabic_nlp.text_cleaner import get_cleaner
     cleaner = get_cleaner("ar")  # أو "en" أو "mixed"
     result = cleaner.clean(text)
+    texts = cleaner.clean_batch(texts, workers=8, chunk_size=256)  # دفعي متعدد العمليات
 """
 import logging
 import re
 import unicodedata
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
-from typing import Optional
+from functools import lru_cache
+from typing import List, Optional
+
+from .batch_cleaner import DEFAULT_CHUNK_SIZE, BatchCleaner
+from .cleaning_engine import CleaningPipeline, Rule, delete_chars, func, sub, translate
 
 logger = logging.getLogger("pipeline.cleaner")
 
@@ -55,6 +63,41 @@ DIACRITICS = re.compile(
 )
 
 
+def _strip_lines(text: str) -> str:
+    return "\n".join(line.strip() for line in text.split("\n")).strip()
+
+
+def _nfc(text: str) -> str:
+    return unicodedata.normalize("NFC", text)
+
+
+COMMON_RULES: List[Rule] = [
+    delete_chars(INVISIBLE_CHARS),
+    sub(MULTI_SPACES, " "),
+    sub(REPEATED_PUNCT, r"\1"),
+    sub(MULTI_NEWLINES, "\n\n"),
+    func(_strip_lines),
+]
+COMMON_PIPELINE = CleaningPipeline(COMMON_RULES)
+
+
+def arabic_rules(remove_diacritics: bool = True, normalize_alef: bool = True, normalize_ya_ta: bool = True) -> List[Rule]:
+    """قواعد ArabicCleaner بالترتيب — التشكيل والألف والياء/التاء تُركَّب في جدول واحد"""
+    rules = list(COMMON_RULES)
+    if remove_diacritics:
+        rules.append(delete_chars(DIACRITICS))
+    if normalize_alef:
+        rules.append(translate(ALEF_MAP))
+    if normalize_ya_ta:
+        rules.append(translate(YA_TA_MAP))
+    return rules
+
+
+@lru_cache(maxsize=None)
+def _arabic_pipeline(remove_diacritics: bool, normalize_alef: bool, normalize_ya_ta: bool) -> CleaningPipeline:
+    return CleaningPipeline(arabic_rules(remove_diacritics, normalize_alef, normalize_ya_ta))
+
+
 class BaseCleaner(ABC):
     """واجهة مجرّدة لكل المنظّفات."""
 
@@ -64,13 +107,20 @@ class BaseCleaner(ABC):
     def _common_clean(self, text: str) -> str:
         if not text:
             return ""
-        text = INVISIBLE_CHARS.sub("", text)
-        text = MULTI_SPACES.sub(" ", text)
-        text = REPEATED_PUNCT.sub(r"\1", text)
-        text = MULTI_NEWLINES.sub("\n\n", text)
-        lines = text.split("\n")
-        lines = [line.strip() for line in lines]
-        return "\n".join(lines).strip()
+        return COMMON_PIPELINE(text)
+
+    def engine_rules(self) -> List[Rule]:
+        """قائمة قواعد quick_clean المرجعية (بالترتيب، قبل التجميع)"""
+        return list(COMMON_RULES)
+
+    def clean_batch(self, texts: list, workers: int = 1, chunk_size: int = DEFAULT_CHUNK_SIZE) -> list:
+        """
+        quick_clean لقائمة نصوص — workers > 1: توزيع على عمليات عبر BatchCleaner.
+        لا يمر بـ clean() ولا deep_clean مهما كانت الجودة؛ للتنظيف العميق استدعِ clean() لكل نص.
+        """
+        if workers == 1:
+            return [self.quick_clean(t) for t in texts]
+        return list(BatchCleaner(self, workers=workers, chunk_size=chunk_size).clean_texts(texts))
 
     @abstractmethod
     def quick_clean(self, text: str) -> str: ...
@@ -106,16 +156,12 @@ class ArabicCleaner(BaseCleaner):
         self._deep_available = None
 
     def quick_clean(self, text: str) -> str:
-        text = self._common_clean(text)
         if not text:
             return ""
-        if self.remove_diacritics:
-            text = DIACRITICS.sub("", text)
-        if self.normalize_alef:
-            text = text.translate(ALEF_MAP)
-        if self.normalize_ya_ta:
-            text = text.translate(YA_TA_MAP)
-        return text
+        return _arabic_pipeline(self.remove_diacritics, self.normalize_alef, self.normalize_ya_ta)(text)
+
+    def engine_rules(self) -> List[Rule]:
+        return arabic_rules(self.remove_diacritics, self.normalize_alef, self.normalize_ya_ta)
 
     def _check_deep_available(self) -> bool:
         if self._deep_available is None:
@@ -149,6 +195,9 @@ class EnglishCleaner(BaseCleaner):
         text = unicodedata.normalize("NFC", text) if text else ""
         return self._common_clean(text)
 
+    def engine_rules(self) -> List[Rule]:
+        return [func(_nfc)] + COMMON_RULES
+
     def deep_clean(self, text: str) -> str:
         return text
 
@@ -160,6 +209,9 @@ class MixedCleaner(BaseCleaner):
         text = unicodedata.normalize("NFC", text) if text else ""
         return self._common_clean(text)
 
+    def engine_rules(self) -> List[Rule]:
+        return [func(_nfc)] + COMMON_RULES
+
     def deep_clean(self, text: str) -> str:
         return text
 
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark — المنظّفات: خط مُجمَّع مقابل مرور لكل قاعدة
+======================================================
+لكل صنف منظّف: عدد الخطوات وMB/s للتطبيق التسلسلي (CleaningPipeline بـ
+optimize=False — نفس سلوك المنظّفات قبل المحرك) وللخط المُجمَّع، مع التحقق من
+تطابق المخرجات حرفاً بحرف.
+
+Usage:
+  python benchmarks/bench_cleaners.py                       # نص OpenITI مُولَّد ~4MB
+  python benchmarks/bench_cleaners.py --file 0310Tabari.Tarikh-ara1 --repeat 3
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from arabic_nlp.cleaning_engine import CleaningPipeline  # noqa: E402
+from arabic_nlp.openiti_cleaner import OpenITICleaner  # noqa: E402
+from arabic_nlp.text_cleaner import ArabicCleaner, EnglishCleaner, MixedCleaner  # noqa: E402
+
+WORDS = (
+    "قَالَ الشيخ الإمام رحمه الله تعالى في كتاب العلم والفقه حدثنا أخبرنا عن أبي "
+    "هريرة رضي الله عنه أن النبي صلى الله عليه وسلم مسألة فصل باب إلى على الذى "
+    "الصلاة الزكاة القرآن المدينة (12) (¬3) ... !!! ؟؟؟ ‌ ms12 PageV01P023"
+).split()
+HEADER = (
+    "######OpenITI#\n\n#META# 000.SortField :: Shamela_0001\n"
+    "#META# 010.AuthorNAME :: الطبري\n#META# 020.BookTITLE :: تاريخ الرسل والملوك\n"
+    "#META#Header#End#\n\n"
+)
+
+
+def make_sample(target_mb: float, seed: int = 11) -> str:
+    rng = random.Random(seed)
+    parts, size = [HEADER], 0
+    while size < target_mb * 1024 * 1024:
+        kind = rng.random()
+        if kind < 0.05:
+            line = "### | {} {}".format(rng.randint(1, 40), " ".join(rng.sample(WORDS, 3)))
+        elif kind < 0.15:
+            line = "~~" + " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 15)))
+        else:
+            line = "# " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(10, 40)))
+        if rng.random() < 0.2:
+            line += " PageV{:02d}P{:03d}".format(rng.randint(1, 9), rng.randint(1, 400))
+        parts.append(line + rng.choice(["\n", "\n\n", "\n\n\n\n"]))
+        size += len(line.encode("utf-8")) + 1
+    return "".join(parts)
+
+
+def best_of(fn, text: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", type=Path, help="ملف OpenITI حقيقي بدل النص المُولَّد")
+    parser.add_argument("--size-mb", type=float, default=4.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    text = args.file.read_text(encoding="utf-8") if args.file else make_sample(args.size_mb)
+    mb = len(text.encode("utf-8")) / (1024 * 1024)
+    print("النص: {:.2f} MB".format(mb))
+    print("{:<28} {:>7} {:>10} {:>7} {:>10} {:>7}".format("المنظّف", "خطوات", "قبل MB/s", "خطوات", "بعد MB/s", "×"))
+
+    cleaners = [
+        ("ArabicCleaner", ArabicCleaner()),
+        ("ArabicCleaner(diacritics)", ArabicCleaner(remove_diacritics=False)),
+        ("EnglishCleaner", EnglishCleaner()),
+        ("MixedCleaner", MixedCleaner()),
+        ("OpenITICleaner", OpenITICleaner()),
+        ("OpenITICleaner(aggressive)", OpenITICleaner(aggressive=True)),
+    ]
+    for name, cleaner in cleaners:
+        rules = cleaner.engine_rules()
+        sequential = CleaningPipeline(rules, optimize=False)
+        compiled = CleaningPipeline(rules)
+        assert compiled(text) == sequential(text), "مخرجات مختلفة: {}".format(name)
+        before = best_of(sequential, text, args.repeat)
+        after = best_of(compiled, text, args.repeat)
+        print("{:<28} {:>7} {:>10.2f} {:>7} {:>10.2f} {:>7.2f}".format(
+            name, sequential.passes, mb / before, compiled.passes, mb / after, before / after))
+    print("التطابق: كل المخرجات مطابقة للتطبيق التسلسلي")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark — عدّ الرموز في OpenITI: count_toks
+=============================================
+يقارن التطبيق السابق (re.split ثم re.findall مرتين لكل رمز) بـ count_toks
+الحالي (تقسيم واحد + Counter + تصنيف كل رمز مختلف مرة واحدة) على كتاب كامل:
+نص في الذاكرة، وقراءة متدفقة (stream)، وذاكرة مُعيَّنة (mmap) — مع التحقق من
+تطابق عدد الرموز والحروف ومجموعة الرموز.
+
+النص المُولَّد له مفردات بتوزيع Zipf (كما في كتاب حقيقي) لا قائمة كلمات قصيرة،
+حتى لا يُضخَّم أثر تصنيف الرموز المختلفة مرة واحدة.
+
+Usage:
+  python benchmarks/bench_count_toks.py                       # كتاب مُولَّد ~8MB
+  python benchmarks/bench_count_toks.py --file 0310Tabari.Tarikh-ara1 --repeat 3
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "openiti"))
+
+import openiti_helper_funcs as funcs  # noqa: E402
+from openiti_helper_rgx import do_not_count, tok_splitter  # noqa: E402
+
+LETTERS = "ابتثجحخدذرزسشصضطظعغفقكلمنهويءأإآةىؤئ"
+TAGS = ["ms{}", "PageV01P{:03d}", "@QB@", "@QE@", "Y{}", "({})", "{}.", "![img](p{}.png)"]
+HEADER = (
+    "######OpenITI#\n\n#META# 000.SortField :: Shamela_0001\n"
+    "#META# 010.AuthorNAME :: الطبري\n#META# 020.BookTITLE :: تاريخ الرسل والملوك\n"
+    "#META#Header#End#\n\n"
+)
+
+
+def make_book(target_mb: float, vocabulary: int = 80000, seed: int = 13) -> str:
+    rng = random.Random(seed)
+    words = ["".join(rng.choice(LETTERS) for _ in range(rng.randint(2, 9))) for _ in range(vocabulary)]
+    weights = [1 / rank for rank in range(1, vocabulary + 1)]
+    parts, size = [HEADER], 0
+    while size < target_mb * 1024 * 1024:
+        toks = rng.choices(words, weights, k=rng.randint(10, 60))
+        if rng.random() < 0.3:
+            toks.insert(rng.randrange(len(toks)), rng.choice(TAGS).format(rng.randint(1, 999)))
+        if rng.random() < 0.05:
+            toks[-1] += "-"
+        line = rng.choice(["# ", "~~", "### | ", "### |EDITOR| ", ""]) + " ".join(toks)
+        parts.append(line + rng.choice(["\n", "\n\n", "\n~~"]))
+        size += len(line.encode("utf-8")) + 1
+    return "".join(parts)
+
+
+def count_toks_reference(text):
+    """التطبيق السابق لـ count_toks(text, incl_chars=True, return_tok_set=True)"""
+    n_toks, n_chars, tok_set = 0, 0, set()
+    for tok in re.split(tok_splitter, text):
+        if re.findall(r"\w", tok) and not re.findall(do_not_count, tok):
+            if not tok.endswith("-"):
+                n_toks += 1
+            n_chars += len(re.findall(r"\w", tok))
+            tok_set.add(tok)
+    return n_toks, n_chars, set([re.sub(r"\W+", "", tok) for tok in tok_set])
+
+
+def best_of(fn, repeat: int):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", type=Path, help="ملف OpenITI حقيقي بدل الكتاب المُولَّد")
+    parser.add_argument("--size-mb", type=float, default=8.0)
+    parser.add_argument("--chunk-mb", type=float, default=4.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.file:
+        fp, tmp = str(args.file), None
+    else:
+        tmp = tempfile.NamedTemporaryFile("w", encoding="utf-8", suffix="-ara1", delete=False)
+        with tmp:
+            tmp.write(make_book(args.size_mb))
+        fp = tmp.name
+    try:
+        body = funcs.read_text(fp, remove_header=True)
+        mb = os.path.getsize(fp) / (1024 * 1024)
+        chunk = int(args.chunk_mb * 1024 * 1024)
+        print("الكتاب: {:.2f} MB".format(mb))
+
+        before, expected = best_of(lambda: count_toks_reference(body), args.repeat)
+        print("{:<22} {:>9} {:>10} {:>7}".format("الطريقة", "ث", "MB/s", "×"))
+        print("{:<22} {:>9.3f} {:>10.2f} {:>7}".format("السابق (نص)", before, mb / before, "1.00"))
+        runs = [
+            ("count_toks (نص)", lambda: funcs.count_toks(body, incl_chars=True, return_tok_set=True)),
+            ("count_toks (ملف)", lambda: funcs.count_toks(fp, incl_chars=True, return_tok_set=True)),
+            ("count_toks (stream)", lambda: funcs.count_toks(
+                fp, incl_chars=True, return_tok_set=True, stream=True, chunk_size=chunk)),
+            ("count_toks (mmap)", lambda: funcs.count_toks(
+                fp, incl_chars=True, return_tok_set=True, use_mmap=True, chunk_size=chunk)),
+        ]
+        for name, fn in runs:
+            seconds, result = best_of(fn, args.repeat)
+            assert result == expected, "نتيجة مختلفة: {} {} != {}".format(name, result[:2], expected[:2])
+            print("{:<22} {:>9.3f} {:>10.2f} {:>7.2f}".format(name, seconds, mb / seconds, before / seconds))
+        print("التطابق: {:,} رمز، {:,} حرف، {:,} رمز مختلف — في كل الطرق".format(
+            expected[0], expected[1], len(expected[2])))
+    finally:
+        if tmp:
+            os.remove(tmp.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark — QualityGate: مرور موحّد مقابل الدوال المنفصلة
+==========================================================
+يقيس MB/s لحساب المقاييس الحرفية قبل (الدوال المنفصلة _arabic_ratio /
+_latin_ratio / _unicode_valid_ratio) وبعد (_char_ratios)، ومقياس التكرار (مرور
+الأسطر المنفصل) قبل وبعد، ويتحقق من تطابق QualityResult بالكامل.
+
+Usage:
+  python benchmarks/bench_quality_gate.py                 # نص عربي مُولَّد ~4MB
+  python benchmarks/bench_quality_gate.py --file book.txt --repeat 3
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from quality_gate import QualityFlag, QualityGate, QualityResult  # noqa: E402
+
+SAMPLE_WORDS = (
+    "قال الشيخ الإمام رحمه الله تعالى في كتاب العلم والفقه والحديث "
+    "حدثنا أخبرنا عن أبي هريرة رضي الله عنه أن النبي صلى الله عليه وسلم "
+    "وَقَالَ الْمُصَنِّفُ مَسْأَلَةٌ فَصْلٌ بَابُ 123 (ص) «كذا» PageV01P002 ms12 Ibn"
+).split()
+NOISE = ["�", "﻿", "͸", "\U0001F600", "\n", "\n\n"]
+
+
+def make_sample(target_mb: float, seed: int = 7) -> str:
+    rng = random.Random(seed)
+    parts, size = [], 0
+    while size < target_mb * 1024 * 1024:
+        line = " ".join(rng.choice(SAMPLE_WORDS) for _ in range(rng.randint(5, 25)))
+        if rng.random() < 0.05:
+            line += rng.choice(NOISE)
+        parts.append(line)
+        size += len(line.encode("utf-8")) + 1
+    return "\n".join(parts)
+
+
+def legacy_check(gate: QualityGate, text: str) -> QualityResult:
+    """نسخة check قبل الدمج — كل مقياس بمرور مستقل"""
+    flags = []
+    length = len(text.strip())
+    flags.append(QualityFlag("length", length >= gate.min_length, length, gate.min_length))
+    ar = gate._arabic_ratio(text)
+    if gate.language == "ar":
+        flags.append(QualityFlag("arabic_ratio", ar >= gate.min_arabic_ratio, ar, gate.min_arabic_ratio))
+    elif gate.language == "en":
+        lr = gate._latin_ratio(text)
+        flags.append(QualityFlag("latin_ratio", lr >= gate.min_latin_ratio, lr, gate.min_latin_ratio))
+    else:
+        flags.append(QualityFlag("language_ratio", True, 1.0, 0.0, "mixed — skipped"))
+    uv = gate._unicode_valid_ratio(text)
+    flags.append(QualityFlag("unicode_valid", uv >= gate.min_unicode_valid, uv, gate.min_unicode_valid))
+    rr = gate._repetition_ratio(text)
+    flags.append(QualityFlag("repetition", rr <= gate.max_repetition_ratio, rr, gate.max_repetition_ratio))
+    weights = {"length": 0.15, "arabic_ratio": 0.35, "latin_ratio": 0.35, "language_ratio": 0.35, "unicode_valid": 0.25, "repetition": 0.25}
+    score = min(1.0, sum(weights.get(f.name, 0.25) * (1.0 if f.passed else max(0, f.value / f.threshold if f.threshold > 0 else 0)) for f in flags))
+    return QualityResult(passed=all(f.passed for f in flags), score=score, flags=flags, text_length=length,
+                         arabic_ratio=ar, unicode_valid_ratio=uv, repetition_ratio=rr)
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", type=Path, help="نص عربي حقيقي بدل النص المُولَّد")
+    parser.add_argument("--size-mb", type=float, default=4.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    text = args.file.read_text(encoding="utf-8") if args.file else make_sample(args.size_mb)
+    mb = len(text.encode("utf-8")) / (1024 * 1024)
+    print("النص: {:.2f} MB، {:,} حرف".format(mb, len(text)))
+
+    for language in ("ar", "en", "mixed"):
+        gate = QualityGate(language=language)
+        assert gate.check(text) == legacy_check(gate, text), "QualityResult مختلف ({})".format(language)
+    print("التطابق: QualityResult مطابق للنسخة المنفصلة (ar / en / mixed)")
+
+    gate = QualityGate(language="ar")
+    gate._char_ratios("تهيئة الجدول")  # بناء جدول الأصناف خارج القياس
+
+    rows = [
+        ("المقاييس الحرفية — قبل", lambda: (gate._arabic_ratio(text), gate._latin_ratio(text), gate._unicode_valid_ratio(text))),
+        ("المقاييس الحرفية — بعد", lambda: gate._char_ratios(text)),
+        ("التكرار (أسطر) — قبل", lambda: gate._repetition_ratio(text)),
+        ("التكرار (أسطر) — بعد", lambda: gate._line_repetition_ratio(text)),
+        ("check() — قبل", lambda: legacy_check(gate, text)),
+        ("check() — بعد", lambda: gate.check(text)),
+    ]
+    timings = {}
+    for name, fn in rows:
+        timings[name] = best_of(fn, args.repeat)
+        print("{:<28} {:8.3f}s  {:8.2f} MB/s".format(name, timings[name], mb / timings[name]))
+    print("التسريع (check): ×{:.1f}".format(timings["check() — قبل"] / timings["check() — بعد"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,18 @@
 """
 Arabic Chunker — تقطيع 300 كلمة + تداخل
 DEC-P1-007
+
+iter_chunks يقطّع تدفقاً من المقاطع ("".join(pieces) == المصدر) دون تحميل
+قائمة كلمات للنص كاملاً، وكل قطعة تحمل start_char/end_char في المصدر:
+  source[chunk.start_char:chunk.end_char] يبدأ بأول كلمة وينتهي بآخر كلمة.
 """
 import hashlib
 import logging
 import re
+from bisect import bisect_left
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional
+from itertools import accumulate
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 logger = logging.getLogger("pipeline.chunker")
 
@@ -15,6 +21,9 @@ DEFAULT_CHUNK_SIZE = 300
 DEFAULT_OVERLAP = 30
 MIN_CHUNK_SIZE = 20
 PARAGRAPH_BOUNDARIES = re.compile(r'\n\s*\n')
+WHITESPACE_RUN = re.compile(r'(\s+)')
+TOKEN_BLOCK = 1 << 16
+PARAGRAPH_BREAK = "\n\n"
 
 @dataclass
 class Chunk:
@@ -27,6 +36,8 @@ class Chunk:
     content_hash: str
     has_overlap: bool
     metadata: Dict = field(default_factory=dict)
+    start_char: int = 0
+    end_char: int = 0
 
 @dataclass
 class ChunkingResult:
@@ -48,39 +59,118 @@ class ArabicChunker:
 
     def chunk(self, text: str, source_path: str = "", metadata: Optional[Dict] = None) -> ChunkingResult:
         if not text or not text.strip(): return ChunkingResult(chunks=[], source_path=source_path)
-        source_hash = self._hash(text)
+        chunks = list(self.iter_chunks([text], metadata=metadata))
+        return ChunkingResult(chunks=chunks, source_path=source_path, source_hash=self._hash(text))
+
+    def iter_chunks(self, pieces: Iterable[str], metadata: Optional[Dict] = None) -> Iterator[Chunk]:
+        """
+        تقطيع متدفق — يحتفظ فقط بنافذة chunk_size+1 كلمة (مع إزاحاتها)
+        وقطعة واحدة معلّقة قد تُدمج فيها قطعة قصيرة تالية.
+
+        Args:
+            pieces: مقاطع متتالية من المصدر (أسطر ملف، فقرات...) بلا فواصل مضافة
+            metadata: بيانات تُنسخ إلى كل قطعة
+        """
         base_meta = metadata or {}
-        paragraphs = PARAGRAPH_BOUNDARIES.split(text.strip())
-        paragraphs = [p.strip() for p in paragraphs if p.strip()]
-        all_words = []
-        for para in paragraphs:
-            all_words.extend(para.split())
-            all_words.append("\n\n")
-        if all_words and all_words[-1] == "\n\n": all_words.pop()
-        chunks = []
+        batches = self._iter_token_batches(pieces)
+        # قوائم متوازية: الكلمة وبدايتها ونهايتها في المصدر — buf_words[0] هي الكلمة رقم base
+        buf_words: List[str] = []
+        buf_starts: List[int] = []
+        buf_ends: List[int] = []
+        base = 0
+        exhausted = False
         word_pos = 0
         chunk_index = 0
-        while word_pos < len(all_words):
-            end_pos = min(word_pos + self.chunk_size, len(all_words))
-            window = all_words[word_pos:end_pos]
-            if end_pos < len(all_words):
+        pending: Optional[Chunk] = None
+        while True:
+            while not exhausted and base + len(buf_words) <= word_pos + self.chunk_size:
+                batch = next(batches, None)
+                if batch is None: exhausted = True
+                else: buf_words.extend(batch[0]); buf_starts.extend(batch[1]); buf_ends.extend(batch[2])
+            total = base + len(buf_words)
+            if word_pos >= total: break
+            end_pos = min(word_pos + self.chunk_size, total)
+            is_last = exhausted and end_pos == total
+            window = buf_words[word_pos - base:end_pos - base]
+            if not is_last:
                 adj = self._find_sentence_boundary(window)
                 if adj > 0: window = window[:adj]; end_pos = word_pos + adj
             chunk_text = self._words_to_text(window)
-            wc = len([w for w in window if w != "\n\n"])
-            if wc < self.min_chunk_size and chunk_index > 0 and end_pos < len(all_words) and chunks:
-                prev = chunks[-1]
+            wc = len([w for w in window if w != PARAGRAPH_BREAK])
+            first, last = word_pos - base, end_pos - base - 1
+            if buf_words[first] == PARAGRAPH_BREAK and first < last: first += 1
+            if buf_words[last] == PARAGRAPH_BREAK and last > first: last -= 1
+            start_char, end_char = buf_starts[first], buf_ends[last]
+            if wc < self.min_chunk_size and chunk_index > 0 and not is_last and pending is not None:
+                prev = pending
                 merged = prev.text + "\n\n" + chunk_text
-                chunks[-1] = Chunk(text=merged, chunk_index=prev.chunk_index, word_count=prev.word_count+wc,
+                pending = Chunk(text=merged, chunk_index=prev.chunk_index, word_count=prev.word_count+wc,
                     char_count=len(merged), start_word=prev.start_word, end_word=end_pos,
-                    content_hash=self._hash(merged), has_overlap=prev.has_overlap, metadata={**base_meta, **prev.metadata})
-                word_pos = end_pos; continue
-            chunks.append(Chunk(text=chunk_text, chunk_index=chunk_index, word_count=wc, char_count=len(chunk_text),
-                start_word=word_pos, end_word=end_pos, content_hash=self._hash(chunk_text),
-                has_overlap=chunk_index > 0 and word_pos < (chunks[-1].end_word if chunks else 0), metadata=base_meta.copy()))
-            chunk_index += 1
-            word_pos += max(1, len(window) - self.overlap)
-        return ChunkingResult(chunks=chunks, source_path=source_path, source_hash=source_hash)
+                    content_hash=self._hash(merged), has_overlap=prev.has_overlap, metadata={**base_meta, **prev.metadata},
+                    start_char=prev.start_char, end_char=end_char)
+                word_pos = end_pos
+            else:
+                chunk = Chunk(text=chunk_text, chunk_index=chunk_index, word_count=wc, char_count=len(chunk_text),
+                    start_word=word_pos, end_word=end_pos, content_hash=self._hash(chunk_text),
+                    has_overlap=chunk_index > 0 and word_pos < (pending.end_word if pending else 0), metadata=base_meta.copy(),
+                    start_char=start_char, end_char=end_char)
+                if pending is not None: yield pending
+                pending = chunk
+                chunk_index += 1
+                word_pos += max(1, len(window) - self.overlap)
+            # تحرير الكلمات التي تجاوزتها النافذة
+            if word_pos > base:
+                drop = word_pos - base
+                del buf_words[:drop], buf_starts[:drop], buf_ends[:drop]
+                base = word_pos
+        if pending is not None: yield pending
+
+    @staticmethod
+    def _iter_token_batches(pieces: Iterable[str]) -> Iterator[Tuple[List[str], List[int], List[int]]]:
+        """
+        دفعات (كلمات، بدايات، نهايات) — مع PARAGRAPH_BREAK لكل فراغ بين كلمتين
+        يحوي سطرين جديدين أو أكثر، مطابقةً لـ PARAGRAPH_BOUNDARIES + split().
+
+        المقاطع الكبيرة تُقسَّم إلى كتل TOKEN_BLOCK حرف، وكلمة عند نهاية كتلة
+        تُرحَّل إلى الكتلة التالية لأنها قد تكتمل فيها. الإزاحات تُحسب بـ
+        accumulate على أطوال أجزاء WHITESPACE_RUN.split — بلا حلقة لكل كلمة.
+        """
+        def blocks():
+            for piece in pieces:
+                for i in range(0, len(piece), TOKEN_BLOCK): yield piece[i:i + TOKEN_BLOCK]
+            yield None
+        carry, offset, seen_word = "", 0, False
+        for block in blocks():
+            final = block is None
+            buf = carry if final else carry + block
+            # أجزاء متناوبة: كلمة، فراغ، كلمة... (الأولى والأخيرة قد تكونان فارغتين)
+            parts = WHITESPACE_RUN.split(buf)
+            bounds = list(accumulate(map(len, parts), initial=offset))
+            words, starts, ends = parts[0::2], bounds[0:-1:2], bounds[1::2]
+            if words[0] == "":
+                del words[0], starts[0], ends[0]
+            if words and words[-1] == "":
+                del words[-1], starts[-1], ends[-1]
+            elif words and not final:
+                del words[-1], starts[-1], ends[-1]
+            if not words:
+                carry = buf; continue
+            breaks = sorted({
+                bisect_left(starts, offset + m.end())
+                for m in PARAGRAPH_BOUNDARIES.finditer(buf, 0, starts[-1] - offset)
+            } - ({0} if not seen_word else set()))
+            if breaks:
+                out_w, out_s, out_e, prev = [], [], [], 0
+                for i in breaks:
+                    out_w.extend(words[prev:i]); out_s.extend(starts[prev:i]); out_e.extend(ends[prev:i])
+                    out_w.append(PARAGRAPH_BREAK); out_s.append(ends[i-1] if i else offset); out_e.append(starts[i])
+                    prev = i
+                out_w.extend(words[prev:]); out_s.extend(starts[prev:]); out_e.extend(ends[prev:])
+                words, starts, ends = out_w, out_s, out_e
+            yield words, starts, ends
+            seen_word = True
+            carry = buf[ends[-1] - offset:]
+            offset = ends[-1]
 
     def _find_sentence_boundary(self, words):
         start = max(len(words) * 2 // 3, 1)
@@ -91,13 +181,14 @@ class ArabicChunker:
 
     @staticmethod
     def _words_to_text(words):
-        parts = []
-        for w in words:
-            if w == "\n\n": parts.append("\n\n")
-            else:
-                if parts and parts[-1] != "\n\n": parts.append(" ")
-                parts.append(w)
-        return "".join(parts).strip()
+        # الكلمات لا تحوي فراغات، فـ " \n\n " لا ينشأ إلا حول فاصل فقرة
+        return " ".join(words).replace(" \n\n ", "\n\n").strip()
 
     @staticmethod
     def _hash(text): return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def iter_text_file(path, encoding: str = "utf-8") -> Iterator[str]:
+    """أسطر ملف كما هي (newline="" يحفظ \r\n) — لتغذية iter_chunks بإزاحات مطابقة للملف"""
+    with open(path, encoding=encoding, newline="") as fh:
+        yield from fh
@@ -0,0 +1,373 @@
+"""
+═══════════════════════════════════════════════════════════════════════════
+IQRA-12 Alias Store — مخزن الأسماء البديلة للعلماء
+═══════════════════════════════════════════════════════════════════════════
+قاعدة SQLite لملايين صيغ الأسماء (اسم، كنية، نسبة، لقب...) مع فهارس للبحث:
+  - exact: الاسم كما هو
+  - normalized: بعد التطبيع (التشكيل، التطويل، الألفات، الياء/الألف المقصورة،
+    التاء المربوطة) — "الغزالى" = "الغزاليّ" = "الغزالي"
+  - prefix: كل الأسماء التي تبدأ ببادئة (مطبّعة) — نطاق على الفهرس
+
+إعادة التحميل دون إعادة تشغيل الوكيل: reload_if_changed() (مرة كل
+reload_interval ثانية على الأكثر) تكتشف
+  - استبدال الملف (build_alias_db يكتب ملفاً مؤقتاً ثم os.replace) → إعادة فتح
+  - تعديلات من اتصال آخر (PRAGMA data_version) → تفريغ الذاكرة المؤقتة
+وفي الحالتين يزيد store.version (ليعيد الوكيل بناء ما يعتمد على الأسماء).
+
+زمن كل بحث يُسجَّل في نافذة محدودة: latency_percentiles() → p50/p95/p99 بالملّي ثانية.
+
+الاستخدام:
+    build_alias_db("/data/aliases.sqlite", records)      # records من JSONL
+    store = AliasStore("/data/aliases.sqlite")
+    store.exact("حجة الإسلام"); store.normalized("الغزالى"); store.prefix("ابن تيم")
+
+    python -m ner.alias_store aliases.jsonl /data/aliases.sqlite
+═══════════════════════════════════════════════════════════════════════════
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Sequence
+
+logger = logging.getLogger("pipeline.ner.alias_store")
+
+# أنواع الأسماء: key = الاسم المرجعي القصير (مفاتيح ALIAS_DB)، alias = اسم بديل عام
+ALIAS_KINDS = ("key", "canonical", "alias", "ism", "kunya", "nisba", "laqab")
+
+_DIACRITICS = re.compile("[\u064B-\u065F\u0670\u0640]")   # تشكيل + ألف خنجرية + تطويل
+_NORMALIZE_TABLE = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي", "ی": "ي", "ک": "ك",
+    "ة": "ه",
+})
+_SPACES = re.compile(r"\s+")
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS scholars (
+        scholar_id TEXT PRIMARY KEY,
+        canonical  TEXT NOT NULL,
+        death_year INTEGER,
+        data       TEXT
+    );
+    CREATE TABLE IF NOT EXISTS aliases (
+        id         INTEGER PRIMARY KEY,
+        name       TEXT NOT NULL,
+        normalized TEXT NOT NULL,
+        kind       TEXT NOT NULL,
+        scholar_id TEXT NOT NULL
+    );
+"""
+_INDEXES = """
+    CREATE INDEX IF NOT EXISTS idx_aliases_name ON aliases(name);
+    CREATE INDEX IF NOT EXISTS idx_aliases_normalized ON aliases(normalized);
+"""
+
+
+def normalize_name(name: str) -> str:
+    """تطبيع اسم للبحث — حذف التشكيل والتطويل وتوحيد الألفات والياء والتاء المربوطة"""
+    name = _DIACRITICS.sub("", name).translate(_NORMALIZE_TABLE)
+    return _SPACES.sub(" ", name).strip()
+
+
+@dataclass
+class AliasMatch:
+    scholar_id: str
+    canonical: str
+    death_year: Optional[int]
+    name: str
+    kind: str
+    data: Optional[Dict[str, Any]] = None
+
+
+class AliasStore:
+    """
+    Args:
+        path: ملف SQLite (":memory:" = مخزن مؤقت في الذاكرة، بلا إعادة تحميل)
+        reload_interval: أقل فاصل (ثوانٍ) بين فحوص التغيّر
+        cache_size: عدد نتائج البحث المحفوظة (LRU) — 0 = بلا ذاكرة مؤقتة
+        latency_window: عدد أزمنة البحث الأخيرة المحفوظة للنسب المئوية
+    """
+
+    def __init__(
+        self,
+        path: str = ":memory:",
+        reload_interval: float = 5.0,
+        cache_size: int = 50_000,
+        latency_window: int = 10_000,
+    ):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.cache_size = cache_size
+        self.version = 0
+        self._lock = threading.RLock()
+        self._cache: "OrderedDict[tuple, List[AliasMatch]]" = OrderedDict()
+        self._latencies: Deque[float] = deque(maxlen=latency_window)
+        self._lookups = 0
+        self._cache_hits = 0
+        self._last_check = time.monotonic()
+        self._open()
+
+    @classmethod
+    def from_alias_db(cls, alias_db: Dict[str, Dict], path: str = ":memory:", **kwargs) -> "AliasStore":
+        """مخزن من قاموس بصيغة ALIAS_DB (المفتاح → canonical, scholar_id, death_year, aliases)"""
+        store = cls(path, **kwargs)
+        store.add_records(alias_db_records(alias_db))
+        return store
+
+    # ── الكتابة ──
+
+    def add_records(self, records: Iterable[Dict], batch_size: int = 10_000) -> int:
+        """
+        إضافة سجلات علماء: {"scholar_id", "canonical", "death_year"?,
+        "names": [{"name", "kind"}, ...], ...بقية الحقول تُحفظ في data}
+        """
+        with self._lock:
+            count = _insert_records(self._conn, records, batch_size)
+            self._conn.executescript(_INDEXES)
+            self._conn.commit()
+            self._changed()
+        return count
+
+    # ── البحث ──
+
+    def exact(self, name: str, kinds: Optional[Sequence[str]] = None) -> List[AliasMatch]:
+        """الأسماء المطابقة حرفياً — الأنواع key أولاً ثم بترتيب الإدخال"""
+        return self._lookup("exact", name, kinds, "a.name = ?", (name,))
+
+    def normalized(self, name: str, kinds: Optional[Sequence[str]] = None) -> List[AliasMatch]:
+        """الأسماء المطابقة بعد التطبيع (normalize_name)"""
+        return self._lookup("normalized", name, kinds, "a.normalized = ?", (normalize_name(name),))
+
+    def prefix(self, prefix: str, limit: int = 20, kinds: Optional[Sequence[str]] = None) -> List[AliasMatch]:
+        """الأسماء التي يبدأ شكلها المطبّع بالبادئة المطبّعة — نطاق على فهرس normalized"""
+        norm = normalize_name(prefix)
+        if not norm:
+            return []
+        return self._lookup(
+            "prefix", prefix, kinds, "a.normalized >= ? AND a.normalized < ?",
+            (norm, norm + "\U0010FFFF"), limit=limit, order="a.normalized, a.id",
+        )
+
+    def names(self, kinds: Optional[Sequence[str]] = None) -> Iterator[str]:
+        """كل الأسماء (المختلفة) من الأنواع المطلوبة — لبناء Gazetteer"""
+        sql, params = "SELECT name FROM aliases", ()
+        if kinds:
+            sql += " WHERE kind IN ({})".format(",".join("?" for _ in kinds))
+            params = tuple(kinds)
+        with self._lock:
+            rows = self._conn.execute(sql + " GROUP BY name ORDER BY MIN(id)", params).fetchall()
+        return (r[0] for r in rows)
+
+    def count(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT kind, COUNT(*) FROM aliases GROUP BY kind").fetchall()
+        return dict(rows)
+
+    # ── إعادة التحميل ──
+
+    def reload_if_changed(self, force: bool = False) -> bool:
+        """فحص التغيّر (مرة كل reload_interval) — True إن أُعيد التحميل"""
+        now = time.monotonic()
+        if self.path == ":memory:" or (not force and now - self._last_check < self.reload_interval):
+            return False
+        self._last_check = now
+        with self._lock:
+            if self._file_id() != self._opened_file_id:
+                logger.info("مخزن الأسماء استُبدل — إعادة فتح %s", self.path)
+                self._conn.close()
+                self._open()
+                self._changed()
+                return True
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._data_version:
+                self._data_version = data_version
+                self._changed()
+                return True
+        return False
+
+    # ── المقاييس ──
+
+    def latency_percentiles(self, percentiles: Sequence[float] = (50, 95, 99)) -> Dict[str, float]:
+        """النسب المئوية لزمن البحث (ملّي ثانية) على آخر latency_window بحث"""
+        with self._lock:
+            samples = sorted(self._latencies)
+            stats: Dict[str, float] = {
+                "lookups": self._lookups,
+                "cache_hit_rate": round(self._cache_hits / self._lookups, 4) if self._lookups else 0.0,
+            }
+        for p in percentiles:
+            key = "p{:g}".format(p)
+            if not samples:
+                stats[key] = 0.0
+                continue
+            rank = min(len(samples) - 1, max(0, math.ceil(p / 100 * len(samples)) - 1))
+            stats[key] = round(samples[rank] * 1000, 4)
+        return stats
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # ── التنفيذ ──
+
+    def _open(self) -> None:
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        if self.path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA + _INDEXES)
+        self._conn.commit()
+        self._opened_file_id = self._file_id()
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _file_id(self):
+        if self.path == ":memory:":
+            return None
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_dev, st.st_ino
+
+    def _changed(self) -> None:
+        self._cache.clear()
+        self.version += 1
+
+    def _lookup(self, op, name, kinds, where, params, limit=None, order=None) -> List[AliasMatch]:
+        t0 = time.perf_counter()
+        self.reload_if_changed()
+        key = (op, name, tuple(kinds) if kinds else None, limit)
+        with self._lock:
+            self._lookups += 1
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+                self._cache_hits += 1
+            else:
+                result = self._query(where, params, kinds, limit, order)
+                if self.cache_size:
+                    self._cache[key] = result
+                    if len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+            self._latencies.append(time.perf_counter() - t0)
+        return list(result)
+
+    def _query(self, where, params, kinds, limit, order) -> List[AliasMatch]:
+        sql = (
+            "SELECT a.scholar_id, s.canonical, s.death_year, a.name, a.kind, s.data"
+            " FROM aliases a JOIN scholars s ON s.scholar_id = a.scholar_id WHERE " + where
+        )
+        if kinds:
+            sql += " AND a.kind IN ({})".format(",".join("?" for _ in kinds))
+            params = tuple(params) + tuple(kinds)
+        sql += " ORDER BY " + (order or "a.kind != 'key', a.id")
+        if limit:
+            sql += " LIMIT {:d}".format(limit)
+        return [
+            AliasMatch(sid, canonical, death_year, name, kind, json.loads(data) if data else None)
+            for sid, canonical, death_year, name, kind, data in self._conn.execute(sql, params)
+        ]
+
+
+# ─────────────────────────────────────────────
+# البناء والاستيراد
+# ─────────────────────────────────────────────
+
+def alias_db_records(alias_db: Dict[str, Dict]) -> Iterator[Dict]:
+    """تحويل قاموس ALIAS_DB إلى سجلات — المفتاح key، الاسم الكامل canonical، والبقية alias"""
+    for key, entry in alias_db.items():
+        names = [{"name": key, "kind": "key"}, {"name": entry["canonical"], "kind": "canonical"}]
+        names += [{"name": alias, "kind": "alias"} for alias in entry.get("aliases", [])]
+        yield {
+            "scholar_id": entry["scholar_id"],
+            "canonical": entry["canonical"],
+            "death_year": entry.get("death_year"),
+            "names": names,
+        }
+
+
+def build_alias_db(path: str, records: Iterable[Dict], batch_size: int = 50_000) -> int:
+    """
+    بناء مخزن كامل في ملف مؤقت ثم استبداله ذرّياً (os.replace) — المخازن
+    المفتوحة على path تكتشف الاستبدال في reload_if_changed وتعيد الفتح.
+    الفهارس تُبنى بعد الإدخال (أسرع بكثير لملايين الصفوف).
+    """
+    tmp = path + ".building"
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(tmp + suffix):
+            os.remove(tmp + suffix)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.executescript(_SCHEMA)
+        count = _insert_records(conn, records, batch_size)
+        conn.executescript(_INDEXES)
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp, path)
+    logger.info("مخزن الأسماء: %d اسم → %s", count, path)
+    return count
+
+
+def _insert_records(conn: sqlite3.Connection, records: Iterable[Dict], batch_size: int) -> int:
+    scholars, aliases, count = [], [], 0
+    for record in records:
+        data = {k: v for k, v in record.items() if k not in ("scholar_id", "canonical", "death_year", "names")}
+        scholars.append((
+            record["scholar_id"], record["canonical"], record.get("death_year"),
+            json.dumps(data, ensure_ascii=False) if data else None,
+        ))
+        for entry in record.get("names", []):
+            name = entry["name"].strip()
+            if name:
+                aliases.append((name, normalize_name(name), entry.get("kind", "alias"), record["scholar_id"]))
+        if len(aliases) >= batch_size:
+            count += _flush(conn, scholars, aliases)
+    return count + _flush(conn, scholars, aliases)
+
+
+def _flush(conn: sqlite3.Connection, scholars: list, aliases: list) -> int:
+    conn.executemany("INSERT OR REPLACE INTO scholars VALUES (?, ?, ?, ?)", scholars)
+    conn.executemany(
+        "INSERT INTO aliases (name, normalized, kind, scholar_id) VALUES (?, ?, ?, ?)", aliases
+    )
+    count = len(aliases)
+    scholars.clear()
+    aliases.clear()
+    return count
+
+
+# ─────────────────────────────────────────────
+# CLI — بناء مخزن من JSONL (سجل عالم في كل سطر)
+# ─────────────────────────────────────────────
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="بناء مخزن الأسماء البديلة من ملف JSONL")
+    parser.add_argument("records_jsonl")
+    parser.add_argument("output_db")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+
+    def records():
+        with open(args.records_jsonl, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    build_alias_db(args.output_db, records())
+
+
+if __name__ == "__main__":
+    main()
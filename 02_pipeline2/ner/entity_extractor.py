@@ -6,12 +6,13 @@ IQRA-12 Entity Extractor Agent (LINK-001)
 ═══════════════════════════════════════════════════════════════════════════
 """
 
-import re
 from typing import Dict, Any, List, Optional
 from dataclasses import dataclass
 
 from backend.agents.base.agent import LinkAgent, AgentConfig, AgentResult, AgentCategory
 
+from .gazetteer import Gazetteer, GazetteerHit
+
 
 @dataclass
 class Entity:
@@ -40,6 +41,8 @@ class EntityExtractorAgent(LinkAgent):
     CONCEPT_PATTERNS = [
         r'(?:الإيمان|التوحيد|الفقه|الحديث|التفسير|العقيدة|الأصول|المنطق|الاجتهاد|الإجماع|القياس)',
     ]
+
+    CONFIDENCE = {"PERSON": 0.8, "BOOK": 0.75, "CONCEPT": 0.85}
     
     def __init__(self):
         config = AgentConfig(
@@ -52,6 +55,20 @@ class EntityExtractorAgent(LinkAgent):
             description="اكتشاف الأشخاص والكتب والمفاهيم في النص"
         )
         super().__init__(config)
+        self._gazetteer = self._build_gazetteer()
+
+    @classmethod
+    def _build_gazetteer(cls) -> Gazetteer:
+        """كل الأنماط في آلة واحدة — مرور واحد على النص لكل الأنواع"""
+        gazetteer = Gazetteer()
+        for entity_type, patterns in (
+            ("PERSON", cls.PERSON_PATTERNS),
+            ("BOOK", cls.BOOK_PATTERNS),
+            ("CONCEPT", cls.CONCEPT_PATTERNS),
+        ):
+            for pattern in patterns:
+                gazetteer.add_pattern(pattern, value=entity_type)
+        return gazetteer
     
     async def execute(self, input_data: Dict[str, Any]) -> AgentResult:
         text = input_data.get("text", "")
@@ -61,13 +78,14 @@ class EntityExtractorAgent(LinkAgent):
             return AgentResult.fail("النص قصير جداً")
         
         entities = []
+        hits = self._gazetteer.find(text)
         
         if "PERSON" in entity_types:
-            entities.extend(self._extract_persons(text))
+            entities.extend(self._extract_persons(text, hits))
         if "BOOK" in entity_types:
-            entities.extend(self._extract_books(text))
+            entities.extend(self._extract_books(text, hits))
         if "CONCEPT" in entity_types:
-            entities.extend(self._extract_concepts(text))
+            entities.extend(self._extract_concepts(text, hits))
         
         # إزالة التكرار
         seen = set()
@@ -89,43 +107,27 @@ class EntityExtractorAgent(LinkAgent):
             }
         })
     
-    def _extract_persons(self, text: str) -> List[Dict]:
-        results = []
-        for pattern in self.PERSON_PATTERNS:
-            for match in re.finditer(pattern, text):
-                results.append({
-                    "text": match.group().strip(),
-                    "type": "PERSON",
-                    "start": match.start(),
-                    "end": match.end(),
-                    "confidence": 0.8
-                })
-        return results
+    def _extract_persons(self, text: str, hits: Optional[List[GazetteerHit]] = None) -> List[Dict]:
+        return self._extract(text, "PERSON", hits)
     
-    def _extract_books(self, text: str) -> List[Dict]:
-        results = []
-        for pattern in self.BOOK_PATTERNS:
-            for match in re.finditer(pattern, text):
-                results.append({
-                    "text": match.group().strip(),
-                    "type": "BOOK",
-                    "start": match.start(),
-                    "end": match.end(),
-                    "confidence": 0.75
-                })
-        return results
+    def _extract_books(self, text: str, hits: Optional[List[GazetteerHit]] = None) -> List[Dict]:
+        return self._extract(text, "BOOK", hits)
     
-    def _extract_concepts(self, text: str) -> List[Dict]:
+    def _extract_concepts(self, text: str, hits: Optional[List[GazetteerHit]] = None) -> List[Dict]:
+        return self._extract(text, "CONCEPT", hits)
+    
+    def _extract(self, text: str, entity_type: str, hits: Optional[List[GazetteerHit]] = None) -> List[Dict]:
+        """نتائج نوع واحد — بترتيب الأنماط ثم المواضع (كما في finditer لكل نمط)"""
+        if hits is None:
+            hits = self._gazetteer.find(text)
         results = []
-        for pattern in self.CONCEPT_PATTERNS:
-            for match in re.finditer(pattern, text):
+        for hit in sorted(hits, key=lambda h: (h.index, h.start)):
+            if hit.value == entity_type:
                 results.append({
-                    "text": match.group().strip(),
-                    "type": "CONCEPT",
-                    "start": match.start(),
-                    "end": match.end(),
-                    "confidence": 0.85
+                    "text": hit.text.strip(),
+                    "type": entity_type,
+                    "start": hit.start,
+                    "end": hit.end,
+                    "confidence": self.CONFIDENCE[entity_type]
                 })
         return results
-
-
@@ -0,0 +1,289 @@
+"""
+═══════════════════════════════════════════════════════════════════════════
+IQRA-12 Gazetteer — مطابقة متعددة الأنماط (Aho-Corasick)
+═══════════════════════════════════════════════════════════════════════════
+يجد كل الأسماء (الأسماء البديلة، قوائم الكتب...) وكل مواضع أنماط regex
+في مرور واحد على النص، مع المواضع:
+
+  - الأسماء: آلة Aho-Corasick واحدة — الزمن يتناسب مع طول النص وعدد
+    التطابقات، لا مع عدد الأسماء (5 أو 500,000).
+  - الأنماط: تُستخرج من كل نمط الكلمات الحرفية التي يجب أن يبدأ بها أي
+    تطابق (مثل الإمام|الشيخ|...) وتُضاف إلى نفس الآلة؛ عند كل موضع مرشّح
+    يُجرَّب النمط مُرسًى (pattern.match) — بنفس نتائج re.finditer وترتيبها.
+    النمط الذي لا تُستخرج له بادئات حرفية يُنفَّذ بـ finditer كاملاً.
+
+pyahocorasick (ahocorasick) يُستخدم إن وُجد، وإلا تطبيق Python خالص بنفس النتائج.
+
+الاستخدام:
+    gaz = Gazetteer()
+    gaz.add("الغزالي", value="SCH-0505")
+    gaz.add_pattern(r"(?:الإمام|الشيخ)\\s+[\\u0600-\\u06FF]+", value="PERSON")
+    for hit in gaz.find(text):
+        hit.start, hit.end, hit.text, hit.value
+═══════════════════════════════════════════════════════════════════════════
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import re._parser as _sre_parse          # Python ≥ 3.11
+except ImportError:                          # pragma: no cover
+    import sre_parse as _sre_parse
+
+
+@dataclass
+class GazetteerHit:
+    start: int
+    end: int
+    text: str
+    value: Any
+    index: int                          # ترتيب إضافة الاسم/النمط
+    match: Optional[re.Match] = None    # للأنماط فقط (للمجموعات)
+
+
+class Gazetteer:
+    """
+    آلة مطابقة للأسماء والأنماط — تُبنى عند أول بحث بعد أي إضافة.
+
+    Args:
+        native: استخدام pyahocorasick إن كان مثبتاً (False = Python خالص دائماً)
+    """
+
+    def __init__(self, native: bool = True):
+        self.native = native
+        self._entries: List[Tuple[str, Any, Optional[re.Pattern]]] = []   # (key, value, pattern)
+        self._literals: Dict[str, List[int]] = {}                          # نص حرفي → مداخل
+        self._scan_patterns: List[int] = []                                # أنماط بلا بادئات
+        self._automaton = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, key: str, value: Any = None) -> None:
+        """إضافة اسم — يُطابَق كنص حرفي (أي موضع في النص، كـ key in text)"""
+        if not key:
+            return
+        self._register(key, len(self._entries))
+        self._entries.append((key, value, None))
+
+    def add_many(self, items: Iterable[Tuple[str, Any]]) -> None:
+        for key, value in items:
+            self.add(key, value)
+
+    def add_pattern(self, pattern, value: Any = None) -> None:
+        """إضافة نمط regex — نتائجه مطابقة لـ re.finditer(pattern, text)"""
+        if isinstance(pattern, str):
+            pattern = re.compile(pattern)
+        index = len(self._entries)
+        self._entries.append((pattern.pattern, value, pattern))
+        prefixes = _prefix_literals(pattern)
+        if prefixes:
+            for prefix in prefixes:
+                self._register(prefix, index)
+        else:
+            self._scan_patterns.append(index)
+            self._automaton = None
+
+    def find(self, text: str) -> List[GazetteerHit]:
+        """كل التطابقات مرتبة بـ (start, index) — الأسماء المتداخلة كلها تُعاد"""
+        if not text or not self._entries:
+            return []
+        starts: Dict[int, set] = {}          # نمط → مواضع بداية مرشّحة
+        hits = []
+        for end, literal in self._scan(text):
+            start = end - len(literal)
+            for index in self._literals[literal]:
+                key, value, pattern = self._entries[index]
+                if pattern is None:
+                    hits.append(GazetteerHit(start, end, key, value, index))
+                else:
+                    starts.setdefault(index, set()).add(start)
+        for index, positions in starts.items():
+            hits.extend(self._anchored(text, index, sorted(positions)))
+        for index in self._scan_patterns:
+            _, value, pattern = self._entries[index]
+            hits.extend(
+                GazetteerHit(m.start(), m.end(), m.group(), value, index, m)
+                for m in pattern.finditer(text)
+            )
+        hits.sort(key=lambda h: (h.start, h.index))
+        return hits
+
+    # ── التنفيذ ──
+
+    def _register(self, literal: str, index: int) -> None:
+        self._literals.setdefault(literal, []).append(index)
+        self._automaton = None
+
+    def _anchored(self, text: str, index: int, positions: List[int]) -> List[GazetteerHit]:
+        """محاكاة finditer: تطابق مُرسًى عند كل موضع مرشّح لا يقع داخل تطابق سابق"""
+        _, value, pattern = self._entries[index]
+        hits, last_end = [], 0
+        for pos in positions:
+            if pos < last_end:
+                continue
+            m = pattern.match(text, pos)
+            if m:
+                hits.append(GazetteerHit(m.start(), m.end(), m.group(), value, index, m))
+                last_end = m.end()
+        return hits
+
+    def _scan(self, text: str) -> Iterator[Tuple[int, str]]:
+        """(نهاية التطابق، النص الحرفي) لكل ظهور لنص حرفي مسجّل"""
+        if not self._literals:
+            return iter(())
+        if self._automaton is None:
+            self._automaton = (self.native and _build_native(self._literals)) or _Automaton(self._literals)
+        if isinstance(self._automaton, _Automaton):
+            return self._automaton.iter(text)
+        return ((end + 1, literal) for end, literal in self._automaton.iter(text))
+
+
+# ─────────────────────────────────────────────
+# Aho-Corasick — Python خالص
+# ─────────────────────────────────────────────
+
+class _Automaton:
+    """
+    روابط الفشل والمخرجات تُحسب عند أول زيارة للحالة (memoized) لا عند
+    البناء: البناء = بناء الشجرة فقط، وأغلب حالات قاموس كبير لا يزورها نص واحد.
+    """
+
+    def __init__(self, literals: Iterable[str]):
+        goto: List[Dict[str, int]] = [{}]
+        parent = [0]
+        chars = [""]
+        own: List[tuple] = [()]
+        for literal in literals:
+            state = 0
+            for ch in literal:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    parent.append(state)
+                    chars.append(ch)
+                    own.append(())
+                state = nxt
+            own[state] = (literal,)
+        self.goto = goto
+        self.parent = parent
+        self.chars = chars
+        self.own = own
+        self.fail = [0] + [-1] * (len(goto) - 1)
+        self.outputs: List[Optional[tuple]] = [()] + [None] * (len(goto) - 1)
+
+    def _fail(self, state: int) -> int:
+        f = self.fail[state]
+        if f < 0:
+            f, ch = self.parent[state], self.chars[state]
+            if f:
+                f = self._fail(f)
+                while ch not in self.goto[f] and f:
+                    f = self._fail(f)
+                f = self.goto[f].get(ch, 0)
+            self.fail[state] = f
+        return f
+
+    def _outputs(self, state: int) -> tuple:
+        out = self.outputs[state]
+        if out is None:
+            # النصوص المنتهية عند حالة الفشل (لواحق أقصر) تنتهي هنا أيضاً
+            out = self.own[state] + self._outputs(self._fail(state))
+            self.outputs[state] = out
+        return out
+
+    def iter(self, text: str) -> Iterator[Tuple[int, str]]:
+        goto, outputs = self.goto, self.outputs
+        state = 0
+        for i, ch in enumerate(text):
+            nxt = goto[state].get(ch)
+            while nxt is None and state:
+                state = self._fail(state)
+                nxt = goto[state].get(ch)
+            state = nxt or 0
+            out = outputs[state]
+            if out is None:
+                out = self._outputs(state)
+            for literal in out:
+                yield i + 1, literal
+
+
+def _build_native(literals: Iterable[str]):
+    """آلة pyahocorasick إن كانت مثبتة — وإلا None"""
+    try:
+        import ahocorasick
+    except ImportError:
+        return None
+    automaton = ahocorasick.Automaton()
+    for literal in literals:
+        automaton.add_word(literal, literal)
+    automaton.make_automaton()
+    return automaton
+
+
+# ─────────────────────────────────────────────
+# بادئات الأنماط الحرفية
+# ─────────────────────────────────────────────
+
+# حد عدد البادئات المستخرجة من نمط واحد
+MAX_PATTERN_PREFIXES = 1000
+
+_prefix_cache: Dict[Tuple[str, int], Optional[List[str]]] = {}
+
+
+def _prefix_literals(pattern: Optional[re.Pattern]) -> Optional[List[str]]:
+    """
+    نصوص حرفية يبدأ بأحدها كل تطابق للنمط — None إن تعذّر الاستنتاج.
+
+    تُقرأ بداية شجرة sre: LITERAL والمجموعات والبدائل (a|b|...) التي كل
+    فروعها حرفية تُمدّد البادئات، وأي عقدة أخرى توقفها؛ المراسي (عرض صفري)
+    تُتخطّى. (sre يستخرج البادئة المشتركة للبدائل: الإيمان|التوحيد → ال(إيمان|توحيد)
+    — لذلك تُمدَّد البادئة عبر البديل بعدها.)
+    """
+    if pattern is None:
+        return None
+    cache_key = (pattern.pattern, pattern.flags)
+    if cache_key not in _prefix_cache:
+        prefixes = None
+        if not pattern.flags & re.IGNORECASE:
+            try:
+                prefixes, _ = _seq_prefixes(_sre_parse.parse(pattern.pattern, pattern.flags))
+            except Exception:
+                prefixes = None
+        _prefix_cache[cache_key] = prefixes if prefixes and all(prefixes) else None
+    return _prefix_cache[cache_key]
+
+
+def _seq_prefixes(items) -> Tuple[List[str], bool]:
+    """(البادئات، هل التسلسل حرفي بالكامل) لتسلسل عقد sre"""
+    prefixes = [""]
+    for op, av in items:
+        if op is _sre_parse.AT:
+            continue
+        if op is _sre_parse.LITERAL:
+            prefixes = [p + chr(av) for p in prefixes]
+            continue
+        sub = None
+        if op is _sre_parse.SUBPATTERN and not (len(av) == 4 and av[1] & re.IGNORECASE):
+            sub = _seq_prefixes(av[-1])
+        elif op is _sre_parse.BRANCH:
+            sub = _branch_prefixes(av[1])
+        if sub is None or not all(sub[0]) or len(prefixes) * len(sub[0]) > MAX_PATTERN_PREFIXES:
+            return prefixes, False
+        prefixes = [p + q for p in prefixes for q in sub[0]]
+        if not sub[1]:
+            return prefixes, False
+    return prefixes, True
+
+
+def _branch_prefixes(alternatives) -> Optional[Tuple[List[str], bool]]:
+    prefixes, complete = [], True
+    for alternative in alternatives:
+        sub, sub_complete = _seq_prefixes(alternative)
+        prefixes.extend(sub)
+        complete = complete and sub_complete
+    return prefixes, complete
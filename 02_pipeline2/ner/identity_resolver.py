@@ -6,12 +6,15 @@ IQRA-12 Identity Resolver Agent (LINK-002)
 ═══════════════════════════════════════════════════════════════════════════
 """
 
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 from backend.agents.base.agent import LinkAgent, AgentConfig, AgentResult, AgentCategory
 
+from .alias_store import AliasMatch, AliasStore
+from .gazetteer import Gazetteer
 
-# قاعدة بيانات الأسماء البديلة
+
+# قاعدة بيانات الأسماء البديلة — البيانات الافتراضية حين لا يُمرَّر AliasStore
 ALIAS_DB = {
     "الغزالي": {"canonical": "أبو حامد الغزالي", "scholar_id": "SCH-0505", "death_year": 505, "aliases": ["حجة الإسلام", "الغزالي", "أبو حامد"]},
     "ابن تيمية": {"canonical": "تقي الدين ابن تيمية", "scholar_id": "SCH-0728", "death_year": 728, "aliases": ["شيخ الإسلام", "ابن تيمية", "تقي الدين"]},
@@ -24,7 +27,18 @@ ALIAS_DB = {
 class IdentityResolverAgent(LinkAgent):
     """حل التباس هويات العلماء والكيانات"""
     
-    def __init__(self):
+    MENTION_PATTERNS = [
+        r'(?:الإمام|الشيخ|العلامة)\s+([\u0600-\u06FF]+)',
+        r'(?:قال|ذكر)\s+([\u0600-\u06FF]+)',
+    ]
+    
+    # أنواع الأسماء التي يُبحث عنها حرفياً في النص (مفاتيح ALIAS_DB)
+    MENTION_KINDS = ("key",)
+    
+    # الثقة حسب طريقة المطابقة
+    CONFIDENCE = {"key": 0.95, "alias": 0.85, "normalized": 0.75, "prefix": 0.6}
+    
+    def __init__(self, alias_store: Optional[AliasStore] = None):
         config = AgentConfig(
             agent_id="LINK-002",
             agent_name="IdentityResolver",
@@ -34,6 +48,29 @@ class IdentityResolverAgent(LinkAgent):
             daily_budget_usd=1.0,
         )
         super().__init__(config)
+        self.alias_store = alias_store or AliasStore.from_alias_db(ALIAS_DB)
+        self._gazetteer: Optional[Gazetteer] = None
+        self._gazetteer_version = -1
+
+    def _mention_gazetteer(self) -> Gazetteer:
+        """الأنماط + أسماء MENTION_KINDS من المخزن في آلة واحدة — يُعاد بناؤها إذا أُعيد تحميل المخزن"""
+        self.alias_store.reload_if_changed()
+        if self._gazetteer is None or self._gazetteer_version != self.alias_store.version:
+            gazetteer = Gazetteer()
+            for pattern in self.MENTION_PATTERNS:
+                gazetteer.add_pattern(pattern, value="pattern")
+            for name in self.alias_store.names(self.MENTION_KINDS):
+                gazetteer.add(name, value="alias")
+            self._gazetteer, self._gazetteer_version = gazetteer, self.alias_store.version
+        return self._gazetteer
+
+    def lookup_stats(self) -> Dict[str, Any]:
+        """زمن البحث في مخزن الأسماء (p50/p95/p99 بالملّي ثانية) وعدد الأسماء"""
+        return {
+            "store_version": self.alias_store.version,
+            "names": self.alias_store.count(),
+            "latency_ms": self.alias_store.latency_percentiles(),
+        }
     
     async def execute(self, input_data: Dict[str, Any]) -> AgentResult:
         text = input_data.get("text", "")
@@ -43,8 +80,10 @@ class IdentityResolverAgent(LinkAgent):
             return AgentResult.fail("النص أو قائمة الإشارات مطلوبة")
         
         # استخراج الإشارات من النص إذا لم تُقدم
+        offsets = []
         if not mentions and text:
-            mentions = self._extract_mentions(text)
+            offsets = self._find_mentions(text)
+            mentions = list({o["mention"] for o in offsets})
         
         resolved = []
         for mention in mentions:
@@ -55,51 +94,64 @@ class IdentityResolverAgent(LinkAgent):
             "resolved_count": len([r for r in resolved if r["resolved"]]),
             "total_mentions": len(mentions),
             "results": resolved,
+            "mention_offsets": offsets,
         })
     
     def _extract_mentions(self, text: str) -> List[str]:
-        import re
-        patterns = [
-            r'(?:الإمام|الشيخ|العلامة)\s+([\u0600-\u06FF]+)',
-            r'(?:قال|ذكر)\s+([\u0600-\u06FF]+)',
-        ]
-        mentions = []
-        for p in patterns:
-            for m in re.finditer(p, text):
-                mentions.append(m.group(1))
-        
-        # فحص مباشر
-        for key in ALIAS_DB:
-            if key in text:
-                mentions.append(key)
-        
-        return list(set(mentions))
+        return list({o["mention"] for o in self._find_mentions(text)})
+    
+    def _find_mentions(self, text: str) -> List[Dict]:
+        """
+        كل الإشارات مع مواضعها في مرور واحد: المجموعة الأولى لأنماط
+        MENTION_PATTERNS، وكل ظهور لاسم من MENTION_KINDS (كـ key in text).
+        """
+        found = []
+        for hit in self._mention_gazetteer().find(text):
+            if hit.match is not None:
+                found.append({"mention": hit.match.group(1), "start": hit.match.start(1),
+                              "end": hit.match.end(1), "source": hit.value})
+            else:
+                found.append({"mention": hit.text, "start": hit.start, "end": hit.end,
+                              "source": hit.value})
+        return found
     
     def _resolve(self, mention: str) -> Dict:
-        # بحث مباشر
-        if mention in ALIAS_DB:
-            data = ALIAS_DB[mention]
-            return {
-                "mention": mention,
-                "resolved": True,
-                "canonical_name": data["canonical"],
-                "scholar_id": data["scholar_id"],
-                "death_year": data["death_year"],
-                "confidence": 0.95,
-            }
+        store = self.alias_store
+        # بحث مباشر: المفتاح المرجعي أولاً ثم بقية الأسماء
+        matches = store.exact(mention)
+        if matches:
+            match = matches[0]
+            return self._resolved(mention, match, "key" if match.kind == "key" else "alias")
         
-        # بحث في الأسماء البديلة
-        for key, data in ALIAS_DB.items():
-            if mention in data["aliases"]:
-                return {
-                    "mention": mention,
-                    "resolved": True,
-                    "canonical_name": data["canonical"],
-                    "scholar_id": data["scholar_id"],
-                    "death_year": data["death_year"],
-                    "confidence": 0.85,
-                }
+        # بعد التطبيع (التشكيل، الألفات، الياء، التاء المربوطة)
+        matches = store.normalized(mention)
+        if matches:
+            return self._resolved(mention, matches[0], "normalized")
         
+        # لا بحث بالبادئة هنا: الإشارات كلمات مفردة، و"أبو" أو "تقي" بادئة لاسم
+        # عالم واحد أحياناً — استخدم resolve_prefix صراحةً (إكمال تلقائي مثلاً)
         return {"mention": mention, "resolved": False, "confidence": 0.0}
-
-
+    
+    def resolve_prefix(self, prefix: str, min_length: int = 4, limit: int = 50) -> Dict:
+        """
+        حل بادئة اسم تخص عالماً واحداً فقط (ثقة 0.6) — للاستدعاء الصريح لا لإشارات النص.
+        البادئة أقصر من min_length حرفاً (بلا مسافات) لا تُحل.
+        """
+        unresolved = {"mention": prefix, "resolved": False, "confidence": 0.0}
+        if len(prefix.replace(" ", "")) < min_length:
+            return unresolved
+        matches = self.alias_store.prefix(prefix, limit=limit)
+        if matches and len(matches) < limit and len({m.scholar_id for m in matches}) == 1:
+            return self._resolved(prefix, matches[0], "prefix")
+        return unresolved
+    
+    def _resolved(self, mention: str, match: AliasMatch, match_type: str) -> Dict:
+        return {
+            "mention": mention,
+            "resolved": True,
+            "canonical_name": match.canonical,
+            "scholar_id": match.scholar_id,
+            "death_year": match.death_year,
+            "confidence": self.CONFIDENCE[match_type],
+            "match_type": match_type,
+        }
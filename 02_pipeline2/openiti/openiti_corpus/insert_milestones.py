@@ -1,19 +1,78 @@
 # inserting milestones of a fixed len () into the texts
+import io
 import re
 import os
 import math
 import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
 from itertools import groupby
 import openiti.helper.ara as ara
-
-
-def milestones(file, length, last_ms_cnt):
-    # ara_regex = re.compile("^[ذ١٢٣٤٥٦٧٨٩٠ّـضصثقفغعهخحجدًٌَُلإإشسيبلاتنمكطٍِلأأـئءؤرلاىةوزظْلآآ]+$")
-    # new char list without ZERO WIDTH NON-JOINER and ZERO WIDTH JOINER
-    # ara_regex = re.compile("[ءآأؤإئابةتثجحخدذرزسشصضطظعغـفقكلمنهوىيًٌٍَُِّْ٠١٢٣٤٥٦٧٨٩ٮٰٹپچژکگیے۱۲۳۴۵]+")
-    splitter = "#META#Header#End#"
+from openiti.helper.rgx import ar_chars
+
+splitter = "#META#Header#End#"
+
+# A token is a run of word characters or a run of non-word characters (r"\w+|\W+");
+# it counts towards the milestone length if it contains an Arabic character
+# (NB: Arabic diacritics are non-word characters, so a run of non-word characters
+# that contains a diacritic also counts).
+# This single pattern finds only the counting tokens, with the same boundaries:
+# a word run that contains an Arabic word character, or a non-word run
+# that contains an Arabic non-word character.
+_ar_word_chars = "".join(re.escape(c) for c in ar_chars if re.match(r"\w", c))
+_ar_non_word_chars = "".join(re.escape(c) for c in ar_chars if not re.match(r"\w", c))
+ar_token_runs = re.compile(r"(?<!\w)\w*[{}]\w*|(?<!\W)\W*[{}]\W*".format(_ar_word_chars,
+                                                                        _ar_non_word_chars))
+
+
+def insert_milestones_in_text(text, length, last_ms_cnt=0, letter=""):
+    """Insert a milestone tag after every `length` Arabic tokens and at the end of the text.
+
+    Args:
+        text (str): text without header and without old milestones
+        length (int): number of Arabic tokens per milestone
+        last_ms_cnt (int): number of the last milestone of the previous part
+            of the book (0 if the book is not split into parts)
+        letter (str): letter of the part of the book ("" if the book is not split)
+
+    Returns:
+        tuple (text with milestones, number of the last milestone)
+    """
+    ms_tag_str_len = len(str(math.floor(ara.ar_tok_cnt(text) / length)))
+    ms_count = last_ms_cnt
+    new_data = []
+    last_end = 0
+    for i, m in enumerate(ar_token_runs.finditer(text), start=1):
+        if i % length == 0:
+            ms_count += 1
+            new_data.append(text[last_end:m.end()])
+            new_data.append(" ms" + letter + str(ms_count).zfill(ms_tag_str_len))
+            last_end = m.end()
+    # the last token of the text always closes a milestone:
+    if text and last_end < len(text):
+        ms_count += 1
+        new_data.append(text[last_end:])
+        new_data.append(" ms" + letter + str(ms_count).zfill(ms_tag_str_len))
+    return "".join(new_data), ms_count
+
+
+def milestones(file, length, last_ms_cnt, dry_run=False, verbose=True):
+    """Insert milestones into a file (atomically: the file is replaced only when the result is complete)
+
+    Args:
+        file (str): path to the file
+        length (int): number of Arabic tokens per milestone
+        last_ms_cnt (int): number of the last milestone of the previous part of the book
+        dry_run (bool): if True, the milestones are counted but the file is not changed
+        verbose (bool): if True, the file name and the number of milestones are printed
+
+    Returns:
+        number of the last milestone in the file, or -1 in case of an error
+    """
     file_name = re.split("-[a-z]{3}\d{1}(\.(mARkdown|inProgress|completed))?$", file.split("/")[-1])[0]
-    print(file_name)
+    if verbose:
+        print(file_name)
     if re.search("[A-Z]{1}$", file_name):
         continuous = True
     else:
@@ -22,67 +81,50 @@ def milestones(file, length, last_ms_cnt):
     with open(file, "r", encoding="utf8") as f:
         data = f.read()
 
-        # splitter test
-        if splitter in data:
-            data_parts = re.split("\n*#META#Header#End#\n*", data)
-            head = data_parts[0]
-            # remove the final new line and spaces to avoid having the milestone tag in a new empty line
-            text = data_parts[1].rstrip()
-            # remove old milestone ids. Fixed strings, until we make them as user input, if required!
-            text = re.sub(" Milestone300", "", text)
-            text = re.sub(" ms[A-Z]?\d+", "", text)
-
-            # insert Milestones
-            ara_toks_count = ara.ar_tok_cnt(text)
-            # ara_toks_count = len(ara_regex.findall(text))
-
-            ms_tag_str_len = len(str(math.floor(ara_toks_count / length)))
-            # find all tokens to check the Arabic tokens in their positions
-            all_toks = re.findall(r"\w+|\W+", text)
-
-            token_count = 0
-            ms_count = last_ms_cnt
-
-            new_data = []
-            for i in range(0, len(all_toks)):
-                # check each token at its position
-                # if ara.ar_tok.search(all_toks[i]):
-                # if ara_regex.search(all_toks[i]):
-                if re.search(ara.ar_tok, all_toks[i]):
-                    token_count += 1
-                    new_data.append(all_toks[i])
-                else:
-                    new_data.append(all_toks[i])
-
-                if token_count == length or i == len(all_toks) - 1:
-                    ms_count += 1
-                    if continuous:
-                        milestone = " ms" + file_name[-1] + str(ms_count).zfill(ms_tag_str_len)
-                    else:
-                        milestone = " ms" + str(ms_count).zfill(ms_tag_str_len)
-                    new_data.append(milestone)
-                    token_count = 0
-
-            ms_text = "".join(new_data)
-
-            test = re.sub(" ms[A-Z]?\d+", "", ms_text)
-            if test == text:
-                # print("\t\tThe file has not been damaged!")
-                # Milestones TEST
-                ms = re.findall("ms[A-Z]?\d+", ms_text)
-                print("\t\t%d milestones (%d words)" % (len(ms), length))
-                ms_text = head.rstrip() + "\n\n" + splitter + "\n\n" + ms_text
-                with open(file, "w", encoding="utf8") as f9:
-                    f9.write(ms_text)
-                return ms_count
-            else:
-                print("\t\tSomething got messed up...")
-                return -1
-
-        else:
-            print("The file is missing the splitter!")
-            print(file)
-            return -1
+    # splitter test
+    if splitter not in data:
+        print("The file is missing the splitter!")
+        print(file)
+        return -1
+
+    data_parts = re.split("\n*#META#Header#End#\n*", data)
+    head = data_parts[0]
+    # remove the final new line and spaces to avoid having the milestone tag in a new empty line
+    text = data_parts[1].rstrip()
+    # remove old milestone ids. Fixed strings, until we make them as user input, if required!
+    text = re.sub(" Milestone300", "", text)
+    text = re.sub(" ms[A-Z]?\d+", "", text)
+
+    # insert Milestones
+    ms_text, ms_count = insert_milestones_in_text(text, length, last_ms_cnt,
+                                                  file_name[-1] if continuous else "")
+
+    test = re.sub(" ms[A-Z]?\d+", "", ms_text)
+    if test != text:
+        print("\t\tSomething got messed up...")
+        return -1
+
+    # print("\t\tThe file has not been damaged!")
+    # Milestones TEST
+    if verbose:
+        ms = re.findall("ms[A-Z]?\d+", ms_text)
+        print("\t\t%d milestones (%d words)%s" % (len(ms), length, " [dry run]" if dry_run else ""))
+    if not dry_run:
+        ms_text = head.rstrip() + "\n\n" + splitter + "\n\n" + ms_text
+        write_atomically(file, ms_text)
+    return ms_count
+
+
+def write_atomically(file, text):
+    """Write to a temporary file in the same folder, then replace the original file"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(file) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf8") as f9:
+            f9.write(text)
+        os.replace(tmp, file)
+    except BaseException:
+        os.remove(tmp)
+        raise
 
 
 def groupby_books(name):
@@ -93,7 +135,80 @@ def groupby_books(name):
         return b_id
 
 
-def process_files(main_folder, ms_len):
+def milestone_jobs(main_folder):
+    """Group the book files in a folder into jobs.
+
+    The parts of a book that is split into several files (…BookA-ara1, …BookB-ara1)
+    must be processed in order, because the milestone numbers continue
+    from one part to the next: they form one job. Every other file is a job of its own.
+
+    Returns:
+        list of lists of file paths
+    """
+    jobs = []
+    for root, dirs, files in os.walk(main_folder):
+        book_files = [f for f in files if
+                      re.search("^\d{4}\w+\.\w+\.\w+-[a-z]{3}\d{1}(\.(mARkdown|inProgress|completed))?$", f)]
+        # books = map(lambda x: re.split("-[a-z]{3}\d{1}", x)[0], book_files)
+        grouped_books = [list(items) for gr, items in groupby(sorted(book_files), key=lambda name: groupby_books(name))]
+
+        for group in grouped_books:
+            if not all(re.search("[A-Z]$", re.split("-[a-z]{3}\d{1}", x)[0]) for x in sorted(group)):
+                for g in group:
+                    jobs.append([os.path.join(root, g)])
+
+            elif any(re.search("[A-Z]$", re.split("-[a-z]{3}\d{1}", x)[0]) for x in sorted(group)):
+                group.sort(key=lambda f: f.split("-")[1])
+                grouped_extensions = [list(items) for gr, items in groupby(group,
+                                                                           key=lambda name: name.split("-")[1])]
+                for sub_g in grouped_extensions:
+                    jobs.append([os.path.join(root, f) for f in sorted(sub_g)])
+    return jobs
+
+
+def process_job(job, ms_len, dry_run=False, verbose=True):
+    """Insert milestones into the files of a job (see `milestone_jobs`)
+
+    Returns:
+        list of (file path, number of milestones inserted; -1 in case of an error)
+    """
+    results = []
+    prev_ms_cnt = 0
+    for fp in job:
+        ms_count = milestones(fp, ms_len, prev_ms_cnt, dry_run=dry_run, verbose=verbose)
+        results.append((fp, ms_count - prev_ms_cnt if ms_count >= 0 else -1))
+        # as before: after an error, the next part restarts from -1
+        prev_ms_cnt = ms_count
+    return results
+
+
+def _process_job_quietly(job, ms_len, dry_run=False):
+    """process_job in a worker process: the verbose report is returned, not printed,
+    so that the parent prints the reports in job order, exactly as the sequential run does
+
+    Returns:
+        (results of process_job, report text)
+    """
+    out = io.StringIO()
+    with redirect_stdout(out):
+        results = process_job(job, ms_len, dry_run=dry_run)
+    return results, out.getvalue()
+
+
+def process_files(main_folder, ms_len, workers=1, dry_run=False):
+    """Insert milestones into all OpenITI book files in a folder.
+
+    Args:
+        main_folder (str): path to the folder
+        ms_len (int): number of Arabic tokens per milestone
+        workers (int): number of processes; each process handles whole jobs
+            (a single file, or all parts of a split book)
+        dry_run (bool): if True, report the number of milestones
+            each file would get without changing any file
+
+    Returns:
+        dict (key: file path, value: number of milestones; -1 in case of an error)
+    """
 # main_folder = sys.argv[1]
 #     ms_len = 300
 
@@ -106,37 +221,30 @@ def process_files(main_folder, ms_len):
     if not os.path.exists(main_folder):
             print("invalid path: ", main_folder)
             sys.exit(1)
+
+    # process all texts in OpenITI
+    jobs = milestone_jobs(main_folder)
+    report = dict()
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_process_job_quietly, job, ms_len, dry_run) for job in jobs]
+            for future in futures:
+                results, printed = future.result()
+                sys.stdout.write(printed)
+                report.update(results)
     else:
-        # process all texts in OpenITI
-        for root, dirs, files in os.walk(main_folder):
-            book_files = [f for f in files if
-                          re.search("^\d{4}\w+\.\w+\.\w+-[a-z]{3}\d{1}(\.(mARkdown|inProgress|completed))?$", f)]
-            # books = map(lambda x: re.split("-[a-z]{3}\d{1}", x)[0], book_files)
-            grouped_books = [list(items) for gr, items in groupby(sorted(book_files), key=lambda name: groupby_books(name))]
-
-            for group in grouped_books:
-                if not all(re.search("[A-Z]$", re.split("-[a-z]{3}\d{1}", x)[0]) for x in sorted(group)):
-                    for g in group:
-                        milestones(os.path.join(root, g), ms_len, 0)
-
-                elif any(re.search("[A-Z]$", re.split("-[a-z]{3}\d{1}", x)[0]) for x in sorted(group)):
-                    # prev_ms_cnt = 0
-                    group.sort(key=lambda f: f.split("-")[1])
-                    grouped_extensions = [list(items) for gr, items in groupby(group,
-                                                                               key=lambda name: name.split("-")[1])]
-                    for sub_g in grouped_extensions:
-                        prev_ms_cnt = 0
-                        for f in sorted(sub_g):
-                            prev_ms_cnt = milestones(os.path.join(root, f), ms_len, prev_ms_cnt)
-    # return main_folder
+        for job in jobs:
+            report.update(process_job(job, ms_len, dry_run=dry_run))
+    return report
 
 
 if __name__ == '__main__':
     folder = input("Enter the path to the OpenITI folder: ")
     ms_length = input("Enter the length of milestones: ")
+    dry = input("Dry run (only count the milestones)? (Y or N) ").strip().lower() == "y"
+    n_workers = int(input("Number of processes [1]: ") or 1)
     # TODO:
     #  skip for the time being as we are not sure whether some Arabic content is being changed since last run
     # re_insert = input("Do you want to re-insert milestone ids to a file with milestone ids? (Y or N)")
-    process_files(folder, int(ms_length))
+    process_files(folder, int(ms_length), workers=n_workers, dry_run=dry)
     print("Done!")
-
@@ -1,4 +1,5 @@
 import math
+import mmap
 import os
 import random
 import re
@@ -6,6 +7,9 @@ import unicodedata
 import urllib.request as url
 import requests
 import bisect
+import hashlib
+import json
+from collections import Counter
 
 if __name__ == '__main__':
     from os import sys, path
@@ -18,6 +22,9 @@ splitter = "#META#Header#End#"
 milestone = "Milestone300"
 thresh = 1000
 
+# default chunk size for streaming/mmap token counts (4 MB):
+TOK_COUNT_CHUNK_SIZE = 1 << 22
+
 exclude_folders = ["OpenITI.github.io", "Annotation", "maintenance",
                    "i.mech00", "i.mech01", "i.mech02", "i.mech03",
                    "i.mech04", "i.mech05", "i.mech06", "i.mech07",
@@ -186,10 +193,16 @@ def get_character_names(characters, verbose=False):
 
 
 def count_toks(text, incl_chars=False, return_tok_set=False, clean_tok_set=True,
-               tok_splitter=rgx.tok_splitter, do_not_count=rgx.do_not_count):
+               tok_splitter=rgx.tok_splitter, do_not_count=rgx.do_not_count,
+               stream=False, use_mmap=False, chunk_size=TOK_COUNT_CHUNK_SIZE):
     """Count non-tag tokens in text.
     If `incl_chars`, the function will return both token and character counts.
 
+    The text is split into tokens once; every distinct token is then
+    classified once (counted or not, number of word characters) and
+    weighted by its frequency, instead of running the regexes
+    for every token in the text.
+
     Args:
         text (str): text or path to text
         incl_chars (bool): if True, both tokens and characters will be counted.
@@ -202,6 +215,11 @@ def count_toks(text, incl_chars=False, return_tok_set=False, clean_tok_set=True,
            into tokens and non-tokens
         do_not_count (str): regex pattern to ignore tokens that contain
            letters and numbers but should not be counted as tokens
+        stream (bool): if True and `text` is a path, the file is read
+           in chunks of `chunk_size` characters instead of as a whole
+        use_mmap (bool): if True and `text` is a path, the file is
+           memory-mapped and decoded in chunks of `chunk_size` bytes
+        chunk_size (int): size of the chunks in streaming/mmap mode
 
     Returns: int or (int, int) or (int, int)
 
@@ -234,22 +252,17 @@ def count_toks(text, incl_chars=False, return_tok_set=False, clean_tok_set=True,
         6
     """
     if os.path.isfile(text):
-        text = read_text(text, remove_header=True)
-
-    all_toks = re.split(tok_splitter, text)
+        if use_mmap:
+            chunks = iter_text_chunks(text, chunk_size, use_mmap=True)
+        elif stream:
+            chunks = iter_text_chunks(text, chunk_size)
+        else:
+            chunks = [read_text(text, remove_header=True)]
+    else:
+        chunks = [text]
 
-    n_toks = 0
-    n_chars = 0
-    tok_set = set()
-    for tok in all_toks:
-        if re.findall(r"\w", tok) and not re.findall(do_not_count, tok):
-            # do not count first half of hyphenated token at end of line:
-            if not tok.endswith("-"):
-                n_toks += 1
-            if incl_chars:
-                n_chars += len(re.findall(r"\w", tok))
-            if return_tok_set:
-                tok_set.add(tok)
+    tok_freqs = tok_frequencies(chunks, tok_splitter)
+    n_toks, n_chars, tok_set = classify_toks(tok_freqs, do_not_count)
 
     if clean_tok_set:
         tok_set = set([re.sub(r"\W+", "", tok) for tok in tok_set])
@@ -265,6 +278,131 @@ def count_toks(text, incl_chars=False, return_tok_set=False, clean_tok_set=True,
         else:
             return n_toks
 
+
+def tok_frequencies(chunks, tok_splitter=rgx.tok_splitter):
+    """Split text chunks into tokens and non-tokens and count their frequencies.
+
+    Args:
+        chunks (iterable): strings (e.g., the output of `iter_text_chunks`)
+        tok_splitter (str): regex pattern on which the text should be split
+           into tokens and non-tokens
+
+    Returns:
+        Counter (key: token, value: frequency)
+    """
+    splitter_rgx = re.compile(tok_splitter)
+    tok_freqs = Counter()
+    for chunk in chunks:
+        tok_freqs.update(splitter_rgx.split(chunk))
+    return tok_freqs
+
+
+def classify_toks(tok_freqs, do_not_count=rgx.do_not_count):
+    """Count the tokens in a token frequency dictionary, like `count_toks` does.
+
+    Every distinct token is checked once: it counts if it contains
+    a word character and does not match `do_not_count`; the first half
+    of a token hyphenated at the end of the line (ending with "-")
+    counts for its characters but not as a token.
+
+    Args:
+        tok_freqs (dict): key: token, value: frequency
+        do_not_count (str): regex pattern to ignore tokens that contain
+           letters and numbers but should not be counted as tokens
+
+    Returns:
+        tuple (number of tokens, number of characters, set of counted tokens)
+    """
+    word_char_rgx = re.compile(r"\w")
+    not_tok_rgx = re.compile(do_not_count)
+    n_toks = 0
+    n_chars = 0
+    tok_set = set()
+    for tok, freq in tok_freqs.items():
+        if word_char_rgx.search(tok) and not not_tok_rgx.search(tok):
+            if not tok.endswith("-"):
+                n_toks += freq
+            n_chars += len(word_char_rgx.findall(tok)) * freq
+            tok_set.add(tok)
+    return n_toks, n_chars, tok_set
+
+
+def iter_text_chunks(fp, chunk_size=TOK_COUNT_CHUNK_SIZE, use_mmap=False,
+                     header_splitter="#META#Header#End#"):
+    """Read the main body of a text file (without header) in chunks.
+
+    Chunks are cut only at the start of a line that begins with
+    a token character (not a space, "~", "#" or "|"), so that splitting
+    every chunk with `rgx.tok_splitter` gives the same tokens
+    as splitting the whole text.
+
+    Args:
+        fp (str): path to the text file
+        chunk_size (int): approximate size of a chunk (in characters;
+            in bytes if `use_mmap`)
+        use_mmap (bool): if True, the file is memory-mapped and the
+            chunks are decoded from the map; the header ends with the line
+            that contains `header_splitter`
+        header_splitter (str): string that separates the header from the body text
+
+    Yields:
+        str
+    """
+    if use_mmap:
+        with open(fp, mode="rb") as file:
+            if not os.fstat(file.fileno()).st_size:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                start = mm.find(header_splitter.encode("utf-8"))
+                if start < 0:
+                    start = 0
+                else:
+                    start = mm.find(b"\n", start) + 1 or len(mm)
+                while start < len(mm):
+                    end = start + chunk_size
+                    cut = -1
+                    while cut < 0 and end < len(mm):
+                        cut = _last_cut(mm, start, end, b"\n", _line_start_seps_b)
+                        end += chunk_size
+                    if cut < 0:
+                        cut = len(mm)
+                    yield mm[start:cut].decode("utf-8")
+                    start = cut
+        return
+
+    header = read_header(fp)
+    with open(fp, mode="r", encoding="utf-8") as file:
+        file.read(len(header))
+        buffer = ""
+        while True:
+            data = file.read(chunk_size)
+            if not data:
+                break
+            buffer += data
+            cut = _last_cut(buffer, 0, len(buffer), "\n", _line_start_seps)
+            if cut > 0:
+                yield buffer[:cut]
+                buffer = buffer[cut:]
+        if buffer:
+            yield buffer
+
+
+# characters that may continue a separator at the start of a line:
+_line_start_seps = " \t\n\r\x0b\x0c~#|"
+_line_start_seps_b = _line_start_seps.encode("ascii")
+
+
+def _last_cut(data, start, end, newline, seps):
+    """Position after the last newline in data[start:end]
+    that is followed by a token character, or -1"""
+    i = data.rfind(newline, start, end)
+    while i >= 0:
+        if data[i+1:i+2] not in seps:
+            return i + 1
+        i = data.rfind(newline, start, i)
+    return -1
+
+
 def count_chars(text, tok_splitter=rgx.tok_splitter, do_not_count=rgx.do_not_count):
     """Count characters in non-tag tokens in text.
 
@@ -878,6 +1016,156 @@ def get_sections(text, section_header_regex="### .+",
 
     return sections
 
+class StructureMap(object):
+    """Page numbers, sections and milestones of a text, with their character offsets.
+
+    Offset lookups use bisection on the stored offsets (O(log n))
+    and do not need the text. Build it with `StructureMap.from_text`
+    or, for a file, with `get_structure_map` (which caches it).
+
+    Examples:
+        >>> text = '''### | فارس
+        ... ### || قصبة فارس
+        ... شيراز قصبة فارس.
+        ... PageV01P001'''
+        >>> sm = StructureMap.from_text(text)
+        >>> loc = text.index("شيراز")
+        >>> sm.page(loc)
+        'PageV01P001'
+        >>> sm.section_title(loc)
+        '### || قصبة فارس'
+        >>> sm.parent_sections(loc)
+        ['### | فارس']
+    """
+
+    def __init__(self, page_numbers=(), page_ends=(), section_titles=(),
+                 section_starts=(), section_parents=(), milestones=(),
+                 milestone_ends=()):
+        self.page_numbers = list(page_numbers)
+        self.page_ends = list(page_ends)
+        self.section_titles = list(section_titles)
+        self.section_starts = list(section_starts)
+        self.section_parents = list(section_parents)
+        self.milestones = list(milestones)
+        self.milestone_ends = list(milestone_ends)
+
+    @classmethod
+    def from_text(cls, text, page_regex=r"PageV[^P]+P\d+[A-Z]?",
+                  section_header_regex="### .+", milestone_regex=rgx.ms):
+        """Parse the page numbers, sections and milestones of a text
+
+        Args:
+            text (str): the text to be parsed
+            page_regex (str): regex pattern that describes the page numbers
+            section_header_regex (str): regex pattern for section headers
+            milestone_regex (str): regex pattern that describes the milestones
+
+        Returns:
+            StructureMap
+        """
+        page_numbers, page_ends = get_page_numbers(text, page_regex=page_regex)
+        sections = get_sections(text, section_header_regex=section_header_regex,
+                                include_offsets=True, include_hierarchy=True)
+        milestones, milestone_ends = get_page_numbers(text, page_regex=milestone_regex)
+        return cls(page_numbers, page_ends,
+                   [d["title"] for d in sections],
+                   [d["start_offset"] for d in sections],
+                   [d["parent_sections"] for d in sections],
+                   milestones, milestone_ends)
+
+    def page(self, loc):
+        """Page number of character offset `loc` (see `get_page_number`)"""
+        return get_page_number(loc, self.page_numbers, self.page_ends)
+
+    def section_title(self, loc):
+        """Title of the section of character offset `loc` (see `get_section_title`)"""
+        return get_section_title(loc, self.section_titles, self.section_starts)
+
+    def parent_sections(self, loc):
+        """Titles of the parent sections of the section of character offset `loc`"""
+        return get_section_title(loc, self.section_parents, self.section_starts)
+
+    def milestone(self, loc):
+        """Milestone that closes the passage of character offset `loc`
+        (None after the last milestone)"""
+        i = bisect.bisect_right(self.milestone_ends, loc)
+        return self.milestones[i] if i < len(self.milestones) else None
+
+    def to_dict(self):
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**d)
+
+
+# in-memory cache of `get_structure_map`:
+# key: (path, regexes); value: (mtime, size, md5, StructureMap)
+_structure_maps = dict()
+
+
+def get_structure_map(fp, cache_folder=None, page_regex=r"PageV[^P]+P\d+[A-Z]?",
+                      section_header_regex="### .+", milestone_regex=rgx.ms):
+    """Get the StructureMap of a text file; parse the file only if needed.
+
+    The map is cached in memory and, if `cache_folder` is provided, on disk
+    (one json file per text file and set of regex patterns). A cached map
+    is reused as long as the modification time and size of the file
+    are unchanged; if only the modification time changed, the md5 hash
+    of the file is compared before the file is parsed again.
+
+    Args:
+        fp (str): path to the text file
+        cache_folder (str): folder in which the maps are cached on disk
+            (default: None = cache in memory only)
+        page_regex (str): regex pattern that describes the page numbers
+        section_header_regex (str): regex pattern for section headers
+        milestone_regex (str): regex pattern that describes the milestones
+
+    Returns:
+        StructureMap
+    """
+    fp = os.path.abspath(fp)
+    settings = [page_regex, section_header_regex, milestone_regex]
+    key = (fp,) + tuple(settings)
+    st = os.stat(fp)
+    cached = _structure_maps.get(key)
+    cache_fp = None
+    if cache_folder:
+        key_hash = hashlib.sha1(json.dumps(key).encode("utf-8")).hexdigest()
+        cache_fp = os.path.join(cache_folder, key_hash + ".json")
+        if cached is None and os.path.exists(cache_fp):
+            with open(cache_fp, mode="r", encoding="utf-8") as file:
+                d = json.load(file)
+            if d["settings"] == settings:
+                cached = (d["mtime"], d["size"], d["md5"], StructureMap.from_dict(d["map"]))
+
+    if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+        _structure_maps[key] = cached
+        return cached[3]
+
+    with open(fp, mode="rb") as file:
+        data = file.read()
+    md5 = hashlib.md5(data).hexdigest()
+    if cached and cached[2] == md5:
+        structure = cached[3]
+    else:
+        # same newline translation as reading the file in text mode:
+        text = data.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+        structure = StructureMap.from_text(text, page_regex=page_regex,
+                                           section_header_regex=section_header_regex,
+                                           milestone_regex=milestone_regex)
+    _structure_maps[key] = (st.st_mtime_ns, st.st_size, md5, structure)
+
+    if cache_fp:
+        os.makedirs(cache_folder, exist_ok=True)
+        d = {"path": fp, "settings": settings, "mtime": st.st_mtime_ns,
+             "size": st.st_size, "md5": md5, "map": structure.to_dict()}
+        with open(cache_fp + ".tmp", mode="w", encoding="utf-8") as file:
+            json.dump(d, file, ensure_ascii=False)
+        os.replace(cache_fp + ".tmp", cache_fp)
+    return structure
+
 def search_in_text(search_term, text, use_regex=False, verbose=True,
         include_locations=False,
         include_section_titles=False, include_pages=True,
@@ -977,7 +1265,8 @@ def search_in_text(search_term, text, use_regex=False, verbose=True,
 def search_regex_in_text(search_term, text, verbose=True, include_locations=False,
            include_section_titles=False, include_pages=True,
            section_titles=None, section_starts=None, include_hierarchy=True,
-           page_numbers=None, page_ends=None, page_regex=r"PageV[^P]+P\d+[A-Z]?"):
+           page_numbers=None, page_ends=None, page_regex=r"PageV[^P]+P\d+[A-Z]?",
+           structure=None):
     """Search a regular expression in the text
 
     By default, this function prints and returns a list of matches for the
@@ -1012,6 +1301,9 @@ def search_regex_in_text(search_term, text, verbose=True, include_locations=Fals
             generated by the `get_page_numbers` function
         page_regex (str): regular expressions pattern describing
             the page number format used in the text
+        structure (StructureMap): precomputed page numbers and sections
+            of the text (see `get_structure_map`); used instead of
+            parsing the text if section titles or page numbers are not provided
 
     Returns:
         list or tuple of lists ( (search_results[, locations][, sections][, pages]))
@@ -1046,6 +1338,13 @@ def search_regex_in_text(search_term, text, verbose=True, include_locations=Fals
     """
 
     # get the required information on section titles and pages if not provided:
+    if structure is not None:
+        if include_section_titles and section_starts is None:
+            section_titles = structure.section_titles
+            section_starts = structure.section_starts
+            section_parents = structure.section_parents
+        if include_pages and (page_numbers is None or page_ends is None):
+            page_numbers, page_ends = structure.page_numbers, structure.page_ends
     if include_section_titles and section_starts is None:
         #section_titles, section_starts = get_sections(text, include_pages=False, include_hierarchy=include_hierarchy)
         sections = get_sections(text, include_offsets=True, include_hierarchy=include_hierarchy)
@@ -1110,7 +1409,8 @@ def search_in_folder(search_term, folder,
         exclude_files=exclude_files, use_regex=False, verbose=True, include_locations=False,
         include_section_titles=False, include_pages=True,
         section_titles=None, section_starts=None, include_hierarchy=True,
-        page_numbers=None, page_ends=None, page_regex=r"PageV[^P]+P\d+[A-Z]?"):
+        page_numbers=None, page_ends=None, page_regex=r"PageV[^P]+P\d+[A-Z]?",
+        index=None):
     """Search a word or expression in all text files in a folder
 
     NB: by default, search terms are considered not to be regular expressions;
@@ -1155,6 +1455,10 @@ def search_in_folder(search_term, folder,
             generated by the `get_page_numbers` function
         page_regex (str): regular expressions pattern describing
             the page number format used in the text
+        index (str or TextIndex): path to a persistent token index
+            (see the `index` module), or an open TextIndex. If provided,
+            the index is updated incrementally and only the files that
+            can contain the search term are read.
 
     Returns:
         dictionary (
@@ -1192,7 +1496,8 @@ def search_in_folder(search_term, folder,
               include_hierarchy=include_hierarchy,
               page_numbers=page_numbers,
               page_ends=page_ends,
-              page_regex=page_regex
+              page_regex=page_regex,
+              index=index
               )
 
 
@@ -1203,7 +1508,8 @@ def search_regex_in_folder(search_term, folder,
         verbose=True, include_locations=False,
         include_section_titles=False, include_pages=True,
         section_titles=None, section_starts=None, include_hierarchy=True,
-        page_numbers=None, page_ends=None, page_regex=r"PageV[^P]+P\d+[A-Z]?"):
+        page_numbers=None, page_ends=None, page_regex=r"PageV[^P]+P\d+[A-Z]?",
+        index=None, structure_cache=None):
     """Search a regular expression in the text
 
     By default, this function prints and returns a list of matches for the
@@ -1242,6 +1548,14 @@ def search_regex_in_folder(search_term, folder,
             generated by the `get_page_numbers` function
         page_regex (str): regular expressions pattern describing
             the page number format used in the text
+        index (str or TextIndex): path to a persistent token index
+            (see the `index` module), or an open TextIndex. If provided,
+            the index is updated incrementally, only the files that contain
+            the literal fragments of the search term are read, and the
+            page numbers and sections stored in the index are used.
+        structure_cache (str): folder in which the page numbers and sections
+            of each file are cached (see `get_structure_map`); if provided,
+            they are parsed only for new or modified files
 
     Returns:
         dictionary (
@@ -1269,12 +1583,31 @@ def search_regex_in_folder(search_term, folder,
         PageV01P437 ~~المعروف ممن لا خير فيه ، والشيراز استماع كلام من نسوة والإنفحة مال مع
         ...
     """
-    files = get_all_text_files_in_folder(folder, excluded_folders=exclude_folders,
-                                         exclude_files=exclude_files)
+    if index is not None:
+        from openiti.helper.index import TextIndex
+        if not isinstance(index, TextIndex):
+            index = TextIndex(index)
+        index.update(folder, exclude_folders=exclude_folders, exclude_files=exclude_files)
+        # the index stores absolute paths: give them the form os.walk(folder)
+        # would yield, so that the result keys do not depend on the index
+        abs_folder = os.path.abspath(folder)
+        files = [os.path.join(folder, os.path.relpath(fp, abs_folder))
+                 for fp in index.candidate_files(search_term, folder=folder)]
+    else:
+        files = get_all_text_files_in_folder(folder, excluded_folders=exclude_folders,
+                                             exclude_files=exclude_files)
     d = dict()
     for fp in files:
         with open(fp, mode="r", encoding="utf-8") as file:
             text = file.read()
+        structure = None
+        if include_pages or include_section_titles:
+            if index is not None and page_regex == index.page_regex \
+                    and index.section_header_regex == "### .+":
+                structure = index.file_maps(fp)
+            elif structure_cache:
+                structure = get_structure_map(fp, cache_folder=structure_cache,
+                                              page_regex=page_regex)
         r = search_regex_in_text(
               search_term,
               text,
@@ -1287,7 +1620,8 @@ def search_regex_in_folder(search_term, folder,
               include_hierarchy=include_hierarchy,
               page_numbers=page_numbers,
               page_ends=page_ends,
-              page_regex=page_regex
+              page_regex=page_regex,
+              structure=structure
               )
         if r:
             d[fp] = r
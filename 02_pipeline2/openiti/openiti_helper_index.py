@@ -0,0 +1,461 @@
+"""Persistent positional token index for searching OpenITI text folders.
+
+The index is an SQLite database that stores, for every text file in a folder:
+
+* positional postings: for each token (maximal run of word characters),
+  the token ordinal and character offset of every occurrence;
+* the structure map of the file (page numbers, section titles with
+  their hierarchy and milestones, with their character offsets;
+  see `StructureMap` in the `funcs` module).
+
+It is built once and updated incrementally: only files whose size or
+modification time changed are re-read, and files that disappeared from
+the folder are dropped.
+
+Token, prefix and phrase queries are answered from the index alone,
+without opening any text file. Regular expressions are prefiltered:
+the literal fragments every match must contain are looked up in the
+token vocabulary, and only the files that contain them are read and
+searched (see `search_regex_in_folder(..., index=...)` in the
+`funcs` module).
+
+Examples:
+    > from openiti.helper.index import TextIndex
+    > idx = TextIndex(r"D:/OpenITI/25Y_repos.index.sqlite")
+    > idx.update(r"D:/OpenITI/25Y_repos")
+    {'added': 10245, 'updated': 0, 'removed': 0, 'unchanged': 0}
+    > results = idx.search("شيراز", include_section_titles=True)
+    > results = idx.search("شير", mode="prefix")
+    > results = idx.search("قصبة فارس", mode="phrase")
+"""
+
+import json
+import os
+import re
+import sqlite3
+from array import array
+
+try:
+    import re._parser as sre_parse  # Python >= 3.11
+except ImportError:
+    import sre_parse
+
+from openiti.helper import rgx
+from openiti.helper.funcs import get_all_text_files_in_folder, StructureMap, \
+                                 exclude_folders, exclude_files
+
+TOKEN_REGEX = re.compile(r"\w+")
+DEFAULT_PAGE_REGEX = r"PageV[^P]+P\d+[A-Z]?"
+DEFAULT_SECTION_REGEX = "### .+"
+
+# maximum number of SQLite host parameters in one IN (...) list:
+MAX_SQL_PARAMS = 900
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS files (
+    file_id INTEGER PRIMARY KEY,
+    path    TEXT UNIQUE NOT NULL,
+    mtime   INTEGER,
+    size    INTEGER,
+    n_toks  INTEGER
+);
+CREATE TABLE IF NOT EXISTS terms (
+    term_id INTEGER PRIMARY KEY,
+    term    TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term_id   INTEGER NOT NULL,
+    file_id   INTEGER NOT NULL,
+    positions BLOB NOT NULL,
+    PRIMARY KEY (term_id, file_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_file ON postings (file_id);
+CREATE TABLE IF NOT EXISTS file_maps (
+    file_id   INTEGER PRIMARY KEY,
+    structure TEXT
+);
+"""
+
+
+class TextIndex(object):
+    """Persistent positional token index of the OpenITI text files in a folder.
+
+    Args:
+        db_path (str): path to the SQLite index file (created if needed)
+        page_regex (str): regex pattern of the page numbers stored in the index
+        section_header_regex (str): regex pattern of the section headers
+            stored in the index
+        milestone_regex (str): regex pattern of the milestones stored in the index
+
+    The three regex patterns are fixed when the index is created;
+    opening an existing index with different patterns raises a ValueError.
+    """
+
+    def __init__(self, db_path, page_regex=DEFAULT_PAGE_REGEX,
+                 section_header_regex=DEFAULT_SECTION_REGEX,
+                 milestone_regex=rgx.ms):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.settings = {"page_regex": page_regex,
+                         "section_header_regex": section_header_regex,
+                         "milestone_regex": milestone_regex}
+        stored = dict(self.conn.execute("SELECT key, value FROM settings"))
+        if stored and stored != self.settings:
+            raise ValueError("Index {} was built with different settings: {}".format(db_path, stored))
+        if not stored:
+            self.conn.executemany("INSERT INTO settings VALUES (?, ?)", self.settings.items())
+            self.conn.commit()
+        self.page_regex = page_regex
+        self.section_header_regex = section_header_regex
+        self.milestone_regex = milestone_regex
+        self._term_ids = None
+
+    def close(self):
+        self.conn.close()
+
+    # ------------------------------------------------------------------
+    # Building and updating the index
+    # ------------------------------------------------------------------
+
+    def update(self, folder, exclude_folders=exclude_folders,
+               exclude_files=exclude_files, verbose=False):
+        """Bring the index up to date with the text files in `folder`.
+
+        Only new files and files whose size or modification time changed
+        are (re-)indexed; indexed files in `folder` that no longer exist
+        are removed from the index.
+
+        Args:
+            folder (str): path to the folder containing the text files
+            exclude_folders (list): list of folder names that should be excluded
+            exclude_files (list): list of file names that should be excluded
+            verbose (bool): if True, the path of every (re-)indexed file is printed
+
+        Returns:
+            dict (keys: "added", "updated", "removed", "unchanged")
+        """
+        folder = os.path.abspath(folder)
+        indexed = {path: (file_id, mtime, size) for file_id, path, mtime, size
+                   in self.conn.execute("SELECT file_id, path, mtime, size FROM files "
+                                        "WHERE path >= ? AND path < ?",
+                                        _prefix_range(folder + os.sep))}
+        counts = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+        seen = set()
+        files = get_all_text_files_in_folder(folder, excluded_folders=exclude_folders,
+                                             exclude_files=exclude_files)
+        for fp in files:
+            fp = os.path.abspath(fp)
+            seen.add(fp)
+            st = os.stat(fp)
+            previous = indexed.get(fp)
+            if previous and previous[1:] == (st.st_mtime_ns, st.st_size):
+                counts["unchanged"] += 1
+                continue
+            if verbose:
+                print("indexing", fp)
+            if previous:
+                self._remove_file(previous[0])
+            self._add_file(fp, st)
+            counts["updated" if previous else "added"] += 1
+            self.conn.commit()
+        for path, (file_id, _, _) in indexed.items():
+            if path not in seen:
+                self._remove_file(file_id)
+                counts["removed"] += 1
+        self.conn.commit()
+        return counts
+
+    def _add_file(self, fp, st):
+        with open(fp, mode="r", encoding="utf-8") as file:
+            text = file.read()
+        postings = dict()
+        n_toks = 0
+        for n_toks, m in enumerate(TOKEN_REGEX.finditer(text), start=1):
+            postings.setdefault(m.group(), array("I")).extend((n_toks - 1, m.start()))
+        cur = self.conn.execute("INSERT INTO files (path, mtime, size, n_toks) VALUES (?, ?, ?, ?)",
+                                (fp, st.st_mtime_ns, st.st_size, n_toks))
+        file_id = cur.lastrowid
+        term_ids = self._get_term_ids(postings)
+        self.conn.executemany("INSERT INTO postings VALUES (?, ?, ?)",
+                              ((term_ids[term], file_id, positions.tobytes())
+                               for term, positions in postings.items()))
+        structure = StructureMap.from_text(text, page_regex=self.page_regex,
+                                           section_header_regex=self.section_header_regex,
+                                           milestone_regex=self.milestone_regex)
+        self.conn.execute("INSERT INTO file_maps VALUES (?, ?)",
+                          (file_id, json.dumps(structure.to_dict(), ensure_ascii=False)))
+
+    def _remove_file(self, file_id):
+        for table in ("postings", "file_maps", "files"):
+            self.conn.execute("DELETE FROM {} WHERE file_id = ?".format(table), (file_id,))
+
+    def _get_term_ids(self, terms):
+        if self._term_ids is None:
+            self._term_ids = dict(self.conn.execute("SELECT term, term_id FROM terms"))
+        new_terms = [t for t in terms if t not in self._term_ids]
+        for term in new_terms:
+            cur = self.conn.execute("INSERT INTO terms (term) VALUES (?)", (term,))
+            self._term_ids[term] = cur.lastrowid
+        return self._term_ids
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def search(self, search_term, mode="token", folder=None, include_locations=False,
+               include_section_titles=False, include_pages=True, include_hierarchy=True,
+               include_milestones=False):
+        """Search a token, token prefix or phrase using only the index.
+
+        Args:
+            search_term (str): the token, prefix or phrase to be searched
+            mode (str): "token": whole tokens equal to `search_term`;
+                "prefix": all tokens that start with `search_term`;
+                "phrase": consecutive tokens equal to the tokens of
+                `search_term` (separators between the tokens are ignored;
+                the "match" of a phrase result is its tokens joined by a space)
+            folder (str): if given, only files in this folder are searched
+            include_locations (bool): if True, the start and end offsets
+                of each match will be included in the output
+            include_section_titles (bool): if True, the titles of the sections
+                in which the match was found will be included in the output
+            include_pages (bool): if True, page numbers of the pages
+                in which the match was found will be included in the output
+            include_hierarchy (bool): if True, the titles of the parent sections
+                will be included
+            include_milestones (bool): if True, the milestone in which
+                the match was found will be included in the output
+
+        Returns:
+            dictionary (keys: file path, values: list of dictionaries
+            with the same keys as `search_regex_in_text` results,
+            plus "milestone" if `include_milestones` is True)
+        """
+        if mode == "phrase":
+            hits = self._phrase_hits(TOKEN_REGEX.findall(search_term), folder)
+        elif mode in ("token", "prefix"):
+            hits = self._term_hits(search_term, mode == "prefix", folder)
+        else:
+            raise ValueError("Unknown search mode: {}".format(mode))
+        results = dict()
+        for path, file_id, matches in hits:
+            structure = self.file_maps(file_id)
+            results[path] = [_result_dict(match, start, end, structure, include_locations,
+                                          include_section_titles, include_pages,
+                                          include_hierarchy, include_milestones)
+                             for start, end, match in sorted(matches)]
+        return results
+
+    def candidate_files(self, search_term, folder=None, flags=0):
+        """Get the indexed files that may contain a match for a regex pattern.
+
+        The literal fragments that every match of `search_term` must contain
+        are looked up in the token vocabulary. If no usable fragment can be
+        derived from the pattern (e.g., a top-level alternation or
+        case-insensitive matching), all indexed files are returned.
+
+        Args:
+            search_term (str): regular expression pattern
+            folder (str): if given, only files in this folder are returned
+            flags (int): regex flags with which the pattern will be used
+
+        Returns:
+            list of file paths, sorted
+        """
+        file_ids = None
+        for fragment in required_fragments(search_term, flags):
+            ids = self._files_with_fragment(fragment)
+            if ids is None:
+                continue
+            file_ids = ids if file_ids is None else file_ids & ids
+        sql, params = "SELECT file_id, path FROM files", ()
+        if folder:
+            sql += " WHERE path >= ? AND path < ?"
+            params = _prefix_range(os.path.abspath(folder) + os.sep)
+        return sorted(path for file_id, path in self.conn.execute(sql, params)
+                      if file_ids is None or file_id in file_ids)
+
+    def file_maps(self, file_id_or_path):
+        """Get the stored StructureMap of a file (None if the file is not indexed)"""
+        if isinstance(file_id_or_path, str):
+            row = self.conn.execute("SELECT structure FROM file_maps JOIN files USING (file_id) "
+                                    "WHERE path = ?", (os.path.abspath(file_id_or_path),)).fetchone()
+        else:
+            row = self.conn.execute("SELECT structure FROM file_maps WHERE file_id = ?",
+                                    (file_id_or_path,)).fetchone()
+        return StructureMap.from_dict(json.loads(row[0])) if row else None
+
+    def _term_hits(self, term, prefix, folder):
+        if prefix:
+            rows = self.conn.execute("SELECT term_id, term FROM terms WHERE term >= ? AND term < ?",
+                                     _prefix_range(term)).fetchall()
+        else:
+            rows = self.conn.execute("SELECT term_id, term FROM terms WHERE term = ?",
+                                     (term,)).fetchall()
+        terms = dict(rows)
+        by_file = dict()
+        for path, file_id, term_id, positions in self._postings(list(terms), folder):
+            matches = by_file.setdefault((path, file_id), [])
+            term = terms[term_id]
+            offsets = _unpack(positions)[1::2]
+            matches.extend((start, start + len(term), term) for start in offsets)
+        return [(path, file_id, matches) for (path, file_id), matches in sorted(by_file.items())]
+
+    def _phrase_hits(self, tokens, folder):
+        if not tokens:
+            return []
+        ids = []
+        for token in tokens:
+            row = self.conn.execute("SELECT term_id FROM terms WHERE term = ?", (token,)).fetchone()
+            if row is None:
+                return []
+            ids.append(row[0])
+        per_file = dict()
+        for path, file_id, term_id, positions in self._postings(sorted(set(ids)), folder):
+            per_file.setdefault((path, file_id), dict())[term_id] = _unpack(positions)
+        phrase = " ".join(tokens)
+        hits = []
+        for (path, file_id), postings in sorted(per_file.items()):
+            if len(postings) < len(set(ids)):
+                continue
+            first = postings[ids[0]]
+            last = postings[ids[-1]]
+            following = [set(postings[term_id][0::2]) for term_id in ids[1:]]
+            last_offsets = dict(zip(last[0::2], last[1::2]))
+            matches = []
+            for ordinal, start in zip(first[0::2], first[1::2]):
+                if all(ordinal + i in ordinals for i, ordinals in enumerate(following, start=1)):
+                    end = last_offsets[ordinal + len(ids) - 1] + len(tokens[-1])
+                    matches.append((start, end, phrase))
+            if matches:
+                hits.append((path, file_id, matches))
+        return hits
+
+    def _postings(self, term_ids, folder):
+        sql = ("SELECT path, file_id, term_id, positions FROM postings JOIN files USING (file_id) "
+               "WHERE term_id IN ({})")
+        folder_params = ()
+        if folder:
+            sql += " AND path >= ? AND path < ?"
+            folder_params = _prefix_range(os.path.abspath(folder) + os.sep)
+        for i in range(0, len(term_ids), MAX_SQL_PARAMS):
+            chunk = term_ids[i:i+MAX_SQL_PARAMS]
+            placeholders = ",".join("?" * len(chunk))
+            yield from self.conn.execute(sql.format(placeholders), tuple(chunk) + folder_params)
+
+    def _files_with_fragment(self, fragment):
+        """Get the ids of the files whose text may contain the literal `fragment`.
+
+        The fragment is split into word-character runs; the first and last
+        run may be part of a longer token in the text (suffix/prefix match)
+        unless the fragment has a non-word character before/after them.
+        Returns None if the fragment contains no word characters.
+        """
+        parts = TOKEN_REGEX.split(fragment)
+        words = TOKEN_REGEX.findall(fragment)
+        if not words:
+            return None
+        file_ids = None
+        for i, word in enumerate(words):
+            open_start = i == 0 and not parts[0]
+            open_end = i == len(words) - 1 and not parts[-1]
+            if open_start and open_end:
+                sql, params = "SELECT term_id FROM terms WHERE instr(term, ?) > 0", (word,)
+            elif open_start:
+                sql, params = "SELECT term_id FROM terms WHERE substr(term, -?) = ?", (len(word), word)
+            elif open_end:
+                sql, params = "SELECT term_id FROM terms WHERE term >= ? AND term < ?", _prefix_range(word)
+            else:
+                sql, params = "SELECT term_id FROM terms WHERE term = ?", (word,)
+            term_ids = [r[0] for r in self.conn.execute(sql, params)]
+            ids = {file_id for _, file_id, _, _ in self._postings(term_ids, None)}
+            file_ids = ids if file_ids is None else file_ids & ids
+            if not file_ids:
+                break
+        return file_ids
+
+
+def required_fragments(search_term, flags=0):
+    """Get literal fragments that every match of a regex pattern must contain.
+
+    Only the top level of the pattern is inspected: runs of literal characters
+    (zero-width assertions like \\b and ^ do not interrupt a run; a repeated
+    literal contributes its minimum number of repetitions) are returned.
+    Case-insensitive patterns yield no fragments.
+
+    Examples:
+        >>> required_fragments(r"\\bقصبة فارس\\b")
+        ['قصبة فارس']
+        >>> required_fragments(r"ابن \\w+ الشيرازي")
+        ['ابن ', ' الشيرازي']
+        >>> required_fragments(r"شيراز|فارس")
+        []
+    """
+    try:
+        parsed = sre_parse.parse(search_term, flags)
+    except Exception:
+        return []
+    state = getattr(parsed, "state", None) or getattr(parsed, "pattern", None)
+    if (flags | getattr(state, "flags", 0)) & re.IGNORECASE:
+        return []
+    fragments = []
+    run = []
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+        if op is sre_parse.AT:
+            continue
+        if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) \
+                and len(av[2]) == 1 and av[2][0][0] is sre_parse.LITERAL:
+            run.append(chr(av[2][0][1]) * av[0])
+            if av[0] == av[1]:
+                continue
+        if run:
+            fragments.append("".join(run))
+        run = []
+    if run:
+        fragments.append("".join(run))
+    return [f for f in fragments if f]
+
+
+def _result_dict(match, start, end, structure, include_locations, include_section_titles,
+                 include_pages, include_hierarchy, include_milestones):
+    """Build a result dictionary in the format of `search_regex_in_text`"""
+    d = dict()
+    d["match"] = match
+    if include_locations:
+        d["start_offset"] = start
+        d["end_offset"] = end
+    if include_section_titles:
+        d["section_title"] = structure.section_title(start)
+        if include_hierarchy:
+            d["parent_sections"] = structure.parent_sections(start)
+    if include_pages:
+        d["page"] = structure.page(start)
+    if include_milestones:
+        d["milestone"] = structure.milestone(start)
+    return d
+
+
+def _unpack(blob):
+    positions = array("I")
+    positions.frombytes(blob)
+    return positions
+
+
+def _prefix_range(prefix):
+    """(low, high) bounds that select all strings starting with `prefix`"""
+    return (prefix, prefix + "\U0010ffff")
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -224,11 +224,14 @@ Examples:
 """
 
 import copy
+import hashlib
 import json
 import os
 import re
 import requests
 import shutil
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
 
 if __name__ == '__main__':
     from os import sys, path
@@ -1978,7 +1981,7 @@ def move_to_new_uri_pth(old_fp, new_uri, execute=False, non_25Y_folder=None):
 
 
 #def check_token_count(version_uri, yml_dic):
-def check_token_count(uri, yml_dic, text_fp="", find_latest=True):
+def check_token_count(uri, yml_dic, text_fp="", find_latest=True, cache=None):
     """Check whether the token count in the version yml file agrees with the\
     actual token count of the text file.
 
@@ -1989,6 +1992,8 @@ def check_token_count(uri, yml_dic, text_fp="", find_latest=True):
         find_latest (bool): if False, text_fp will be used as is;
             if set to True, the script will find the most developed version of
             the text file, based on its extension (mARkdown > completed > inProgress)
+        cache (YmlCheckCache): if provided, token counts are taken from
+            (and stored in) this cache
     Returns:
         (tuple): Tuple containing 2 values (or None):
 
@@ -1996,6 +2001,34 @@ def check_token_count(uri, yml_dic, text_fp="", find_latest=True):
             char_count (int): number of Arabic characters in the target text
     """
     # TO DO: CHECK ME!
+    fp = latest_text_fp(uri, text_fp, find_latest)
+
+    #tok_count = ar_cnt_file(fp, mode="token")
+    #char_count = ar_cnt_file(fp, mode="char")
+    if cache is not None:
+        tok_count, char_count = cache.count_toks(fp)
+    else:
+        tok_count, char_count = count_toks(fp, incl_chars=True)
+
+    problems = token_count_problems(yml_dic, tok_count, char_count)
+    for problem in problems:
+        print(problem, "-", uri)
+    if problems:
+        return tok_count, char_count
+
+def latest_text_fp(uri, text_fp="", find_latest=True):
+    """Get the path to the text file whose tokens should be counted
+
+    Args:
+        uri (URI object): version/transcription uri of the target text
+        text_fp (str): file path to the target text
+        find_latest (bool): if False, text_fp will be used as is;
+            if set to True, the script will find the most developed version of
+            the text file, based on its extension (mARkdown > completed > inProgress)
+
+    Returns:
+        str
+    """
     # Get the count from the most complete version of the text file: 
     #fp = version_uri.build_pth(uri_type="version_file")
     if text_fp and not find_latest:
@@ -2017,12 +2050,28 @@ def check_token_count(uri, yml_dic, text_fp="", find_latest=True):
                 uri_type = uri.uri_type + "file"
             fp = uri.build_pth(uri_type=uri_type)
             if os.path.exists(fp):
-                break 
+                break
+    return fp
 
-    #tok_count = ar_cnt_file(fp, mode="token")
-    #char_count = ar_cnt_file(fp, mode="char")
-    tok_count, char_count = count_toks(fp, incl_chars=True)
-    
+def token_count_problems(yml_dic, tok_count, char_count):
+    """Compare the token and character counts in a yml dictionary\
+    with the actual counts.
+
+    Args:
+        yml_dic (dict): dictionary containing the data from the version yml file
+        tok_count (int): number of Arabic tokens in the text
+        char_count (int): number of Arabic characters in the text
+
+    Returns:
+        list (of problem descriptions; empty if the counts agree)
+
+    Examples:
+        >>> d = {"00#VERS#LENGTH###:": "12", "00#VERS#CLENGTH##:": ""}
+        >>> token_count_problems(d, 12, 50)
+        ['CHARACTER COUNT MISSING']
+        >>> token_count_problems(d, 13, 50)
+        ['TOKEN COUNT CHANGED', 'CHARACTER COUNT MISSING']
+    """
     #len_key = "00#VERS#LENGTH###:"
     #char_len_key = "00#VERS#CLENGTH##:"
     len_key = [k for k in yml_dic.keys() if "#LENGTH#" in k][0]
@@ -2032,23 +2081,18 @@ def check_token_count(uri, yml_dic, text_fp="", find_latest=True):
         yml_char_count = yml_dic[char_len_key].strip()
     except:
         yml_char_count = ""
-    replace_counts = False
+    problems = []
     for cnt_type, cnt, yml_cnt in [("token", tok_count, yml_tok_count),
                                    ("character", char_count, yml_char_count)]:
         if yml_cnt == "":
-            print(cnt_type.upper(), "COUNT MISSING -", uri)
-            replace_counts = True
+            problems.append(cnt_type.upper() + " COUNT MISSING")
         else:
             try:
                 if int(yml_cnt) != cnt:
-                    print(cnt_type.upper(), "COUNT CHANGED -", uri)
-                    replace_counts = True
-                    
+                    problems.append(cnt_type.upper() + " COUNT CHANGED")
             except:
-                print(cnt_type.upper(), "COUNT {} IS NOT A NUMBER -".format(yml_cnt), uri)
-                replace_counts = True
-    if replace_counts:
-        return tok_count, char_count
+                problems.append(cnt_type.upper() + " COUNT {} IS NOT A NUMBER".format(yml_cnt))
+    return problems
 
 def replace_tok_counts(missing_tok_count):
     """Replace the token counts in the relevant yml files.
@@ -2083,7 +2127,7 @@ def replace_tok_counts(missing_tok_count):
             outf.write(ymlS)
 
 def check_yml_file(yml_fp, yml_type, text_fp=None, execute=False,
-                   check_token_counts=True):
+                   check_token_counts=True, cache=None):
     """Check whether a yml file exist, is valid, and contains no foreign keys
 
     Args:
@@ -2096,6 +2140,8 @@ def check_yml_file(yml_fp, yml_type, text_fp=None, execute=False,
             before any changes are made to the yml file
         check_token_counts (bool): if True, the script will check
             the number of tokens (and characters) in the text
+        cache (YmlCheckCache): if provided, token counts are taken from
+            (and stored in) this cache
 
     Returns:
         None or yml_fp
@@ -2138,8 +2184,6 @@ def check_yml_file(yml_fp, yml_type, text_fp=None, execute=False,
             yml_changed = True
         else:
             return yml_fp
-    key_d = {"author": "AUTH", "book": "BOOK", "version": "VERS",
-             "location": "LOC", "manuscript": "MS", "transcription": "TRNS"}
     for key in list(yml_dic.keys()):  # NB: list needed because otherwise keys cannot be deleted!
         
         # check if all keys have the prefix of the yml type (..#AUTH, ..#BOOK, ..#VERS):
@@ -2168,7 +2212,7 @@ def check_yml_file(yml_fp, yml_type, text_fp=None, execute=False,
                 
     # check whether version/transcription yml files contain token and character length values:
     if yml_type in ["version", "transcription"] and check_token_counts:
-        res = check_token_count(URI(yml_fp), yml_dic, text_fp)
+        res = check_token_count(URI(yml_fp), yml_dic, text_fp, cache=cache)
         if res:
             tok_count, char_count = res
             if execute or input("Change token count? Y/N? ").lower() == "y":
@@ -2190,11 +2234,185 @@ def check_yml_file(yml_fp, yml_type, text_fp=None, execute=False,
             file.write(yml.dicToYML(yml_dic, reflow=False))
 
 
+# key prefixes of the different yml types:
+key_d = {"author": "AUTH", "book": "BOOK", "version": "VERS",
+         "location": "LOC", "manuscript": "MS", "transcription": "TRNS"}
+
+
+class YmlCheckCache(object):
+    """Persistent cache of parsed yml files and token counts of text files.
+
+    Parsed yml dictionaries and (token, character) counts are stored
+    by md5 hash of the file content, so that they are recomputed only
+    for files that changed. The hash of a file is itself cached by
+    path, modification time and size, so unchanged files are not even read.
+
+    The cache is an SQLite database; several processes can use it at once.
+
+    Args:
+        db_fp (str): path to the cache database (created if needed)
+    """
+
+    def __init__(self, db_fp):
+        self.db_fp = db_fp
+        self.conn = sqlite3.connect(db_fp, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS file_hashes (
+                path TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, md5 TEXT);
+            CREATE TABLE IF NOT EXISTS yml_dics (
+                md5 TEXT PRIMARY KEY, yml_dic TEXT);
+            CREATE TABLE IF NOT EXISTS tok_counts (
+                md5 TEXT PRIMARY KEY, tok_count INTEGER, char_count INTEGER);
+            """)
+        self.conn.commit()
+
+    def file_hash(self, fp):
+        """md5 hash of the content of a file"""
+        st = os.stat(fp)
+        row = self.conn.execute("SELECT mtime, size, md5 FROM file_hashes WHERE path = ?",
+                                (fp,)).fetchone()
+        if row and row[:2] == (st.st_mtime_ns, st.st_size):
+            return row[2]
+        h = hashlib.md5()
+        with open(fp, mode="rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                h.update(block)
+        md5 = h.hexdigest()
+        self.conn.execute("INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?)",
+                          (fp, st.st_mtime_ns, st.st_size, md5))
+        self.conn.commit()
+        return md5
+
+    def read_yml(self, yml_fp):
+        """Cached version of `yml.readYML` (errors are not cached)"""
+        md5 = self.file_hash(yml_fp)
+        row = self.conn.execute("SELECT yml_dic FROM yml_dics WHERE md5 = ?", (md5,)).fetchone()
+        if row:
+            return json.loads(row[0])
+        yml_dic = yml.readYML(yml_fp)
+        self.conn.execute("INSERT OR REPLACE INTO yml_dics VALUES (?, ?)",
+                          (md5, json.dumps(yml_dic, ensure_ascii=False)))
+        self.conn.commit()
+        return yml_dic
+
+    def count_toks(self, text_fp):
+        """Cached version of `count_toks(text_fp, incl_chars=True)`"""
+        md5 = self.file_hash(text_fp)
+        row = self.conn.execute("SELECT tok_count, char_count FROM tok_counts WHERE md5 = ?",
+                                (md5,)).fetchone()
+        if row:
+            return tuple(row)
+        tok_count, char_count = count_toks(text_fp, incl_chars=True)
+        self.conn.execute("INSERT OR REPLACE INTO tok_counts VALUES (?, ?, ?)",
+                          (md5, tok_count, char_count))
+        self.conn.commit()
+        return tok_count, char_count
+
+    def close(self):
+        self.conn.close()
+
+
+def yml_file_problems(yml_fp, yml_type, text_fp=None, check_token_counts=True,
+                      cache=None):
+    """Check a yml file like `check_yml_file` does, without changing it\
+    and without user interaction.
+
+    Args:
+        yml_fp (str): path to the yml file
+        yml_type (str): either "author", "book", "version",
+            "location", "manuscript" or "transcription"
+        text_fp (str): path to the text file of the version/transcription
+        check_token_counts (bool): if True, the script will check
+            the number of tokens (and characters) in the text
+        cache (YmlCheckCache): if provided, parsed yml files and token counts
+            are taken from (and stored in) this cache
+
+    Returns:
+        list (of problem descriptions; empty if `check_yml_file`
+        would not report or change anything)
+    """
+    if not os.path.exists(yml_fp):
+        return ["DOES NOT EXIST"]
+    try:
+        yml_dic = cache.read_yml(yml_fp) if cache is not None else yml.readYML(yml_fp)
+    except Exception as e:
+        return ["invalid YML file structure: {}".format(e)]
+    if yml_dic == {}:
+        return ["Empty yml file"]
+    problems = []
+    for key in yml_dic:
+        if key_d[yml_type.split("_")[0]] not in key:
+            problems.append("wrong key: {}".format(key))
+        if "URI" in key:
+            fn = os.path.splitext(os.path.split(yml_fp)[-1])[0]
+            fn = re.sub(r"\.inProgress|\.mARkdown|\.completed", "", fn)
+            if yml_dic[key].strip() != fn:
+                problems.append("URI {} != filename {}".format(yml_dic[key], fn))
+    if yml_type in ["version", "transcription"] and check_token_counts:
+        try:
+            fp = latest_text_fp(URI(yml_fp), text_fp)
+            if cache is not None:
+                tok_count, char_count = cache.count_toks(fp)
+            else:
+                tok_count, char_count = count_toks(fp, incl_chars=True)
+            problems += token_count_problems(yml_dic, tok_count, char_count)
+        except Exception as e:
+            problems.append("token count check failed: {}".format(e))
+    return problems
+
+
+def get_yml_checks(start_folder, exclude=[], flat_folder=False):
+    """A generator that yields the (yml_fp, yml_type, text_fp) tuples \
+    of all yml files that `check_yml_files` checks, in the same order.
+
+    Args:
+        start_folder (str): path to the parent folder of the folders
+            that need to be checked.
+        exclude (list): a list of directory names that should be excluded.
+        flat_folder (bool): if True, author/location yml files are
+            expected in the same folder as the text file
+    """
+    for fp in get_all_text_files_in_folder(start_folder, excluded_folders=exclude):
+        uri = URI(fp)
+        if "version" in uri.uri_type:
+            yml_types = ("author", "book", "version")
+        else:
+            yml_types = ("location", "manuscript", "transcription")
+        for yml_type in yml_types:
+            yml_fn = uri.build_uri(uri_type="{}_yml".format(yml_type))
+            if yml_type in ("author", "location") and not flat_folder:
+                yml_fp = os.path.join(os.path.dirname(os.path.dirname(fp)), yml_fn)
+            else:
+                yml_fp = os.path.join(os.path.dirname(fp), yml_fn)
+            yield yml_fp, yml_type, fp
+
+
+# per-process cache of the parallel prefilter of `check_yml_files`:
+_worker_cache = None
+
+def _init_yml_worker(cache_fp):
+    global _worker_cache
+    _worker_cache = YmlCheckCache(cache_fp) if cache_fp else None
+
+def _yml_check_has_problems(check, check_token_counts):
+    yml_fp, yml_type, text_fp = check
+    return bool(yml_file_problems(yml_fp, yml_type, text_fp,
+                                  check_token_counts=check_token_counts,
+                                  cache=_worker_cache))
+
+
 def check_yml_files(start_folder, exclude=[],
                     execute=False, check_token_counts=True,
-                    flat_folder=False):
+                    flat_folder=False, workers=1, cache_fp=None, chunksize=64):
     """Check whether yml files are missing or have faulty data in them.
 
+    If `workers` > 1 or a `cache_fp` is provided, all yml files are
+    first checked in parallel (and/or using the cache) by the
+    non-interactive `yml_file_problems` function; only the yml files
+    with problems are then passed to `check_yml_file` (in the original order),
+    which reports them and asks the user before changing them.
+
     Args:
         start_folder (str): path to the parent folder of the folders
             that need to be checked.
@@ -2203,42 +2421,45 @@ def check_yml_files(start_folder, exclude=[],
             which changes it would undertake if set to True.
             After it has looped through all files and folders, it will give
             the user the option to execute the proposed changes.
+        check_token_counts (bool): if True, the script will check
+            the number of tokens (and characters) in the texts
+        flat_folder (bool): if True, author/location yml files are
+            expected in the same folder as the text file
+        workers (int): number of processes used to check the yml files
+        cache_fp (str): path to a YmlCheckCache database; if provided,
+            parsed yml files and token counts are cached by file hash,
+            so that only changed files are parsed/counted again
+        chunksize (int): number of yml files sent to a process at once
 
     Returns:
         list (of paths to yml files where token counts failed)
     """
-    failed = []
-    for fp in get_all_text_files_in_folder(start_folder, excluded_folders=exclude):
-        uri = URI(fp)
-        if "version" in uri.uri_type:
-            for yml_type in ("author", "book", "version"):
-                yml_fn = uri.build_uri(uri_type="{}_yml".format(yml_type))
-                if yml_type == "author":
-                    if flat_folder:
-                        yml_fp = os.path.join(os.path.dirname(fp), yml_fn)
-                    else:
-                        yml_fp = os.path.join(os.path.dirname(os.path.dirname(fp)), yml_fn)
-                else:
-                    yml_fp = os.path.join(os.path.dirname(fp), yml_fn)
-                r = check_yml_file(yml_fp, yml_type, text_fp=fp, execute=execute,
-                                   check_token_counts=check_token_counts)
-                if r:
-                    failed.append(r)
+    checks = list(get_yml_checks(start_folder, exclude=exclude, flat_folder=flat_folder))
+    cache = None
+    if workers > 1 or cache_fp:
+        unique_checks = list(dict.fromkeys(checks))
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_yml_worker,
+                                     initargs=(cache_fp,)) as pool:
+                flags = pool.map(_yml_check_has_problems, unique_checks,
+                                 [check_token_counts] * len(unique_checks),
+                                 chunksize=chunksize)
+                flagged = {c for c, flag in zip(unique_checks, flags) if flag}
         else:
-            for yml_type in ("location", "manuscript", "transcription"):
-                yml_fn = uri.build_uri(uri_type="{}_yml".format(yml_type))
-                if yml_type == "location":
-                    if flat_folder:
-                        yml_fp = os.path.join(os.path.dirname(fp), yml_fn)
-                    else:
-                        yml_fp = os.path.join(os.path.dirname(os.path.dirname(fp)), yml_fn)
-                else:
-                    yml_fp = os.path.join(os.path.dirname(fp), yml_fn)
-                r = check_yml_file(yml_fp, yml_type, text_fp=fp, execute=execute,
-                                   check_token_counts=check_token_counts)
-                if r:
-                    failed.append(r)
-            
+            _init_yml_worker(cache_fp)
+            flagged = {c for c in unique_checks
+                       if _yml_check_has_problems(c, check_token_counts)}
+        print("{} of {} yml files need attention".format(len(flagged), len(unique_checks)))
+        checks = [c for c in checks if c in flagged]
+        cache = YmlCheckCache(cache_fp) if cache_fp else None
+
+    failed = []
+    for yml_fp, yml_type, fp in checks:
+        r = check_yml_file(yml_fp, yml_type, text_fp=fp, execute=execute,
+                           check_token_counts=check_token_counts, cache=cache)
+        if r:
+            failed.append(r)
+
     if failed:
         print("The following yml files could not be read. Please correct them manually:")
         for yml_fp in failed:
@@ -1,6 +1,10 @@
+import csv
+import hashlib
 import re
 import os
+import sqlite3
 import sys
+from concurrent.futures import ProcessPoolExecutor
 
 # TODO: update the paths using import
 sys.path.append("Z:/Documents/GitProjects/PythonFunctions")
@@ -20,30 +24,251 @@ sum_r = """
 # count word frequencies of only longest texts in each text group
 
 
+word_rgx = re.compile(r"\w+")
+
+
 def get_len(file_name):
     with open(file_name, "r", encoding="utf8") as f1:
         f1 = f1.read()
-        fr = len(re.findall("\w+", f1))
+        fr = len(word_rgx.findall(f1))
         return fr
 
 
-def generate_stats(in_dir):
-    stats = []
+class LenStatsCache(object):
+    """Persistent cache of the lengths (in words) of text files.
+
+    Lengths are stored by md5 hash of the file content, so that a new release
+    only recounts the files that changed (renamed or copied files are not recounted).
+    The hash of a file is itself cached by path, modification time and size,
+    so unchanged files are not even read.
+
+    The cache is an SQLite database; several processes can read it at once.
+
+    Args:
+        db_fp (str): path to the cache database (created if needed)
+    """
+
+    def __init__(self, db_fp):
+        self.db_fp = db_fp
+        self.conn = sqlite3.connect(db_fp, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS file_hashes (
+                path TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, md5 TEXT);
+            CREATE TABLE IF NOT EXISTS lengths (
+                md5 TEXT PRIMARY KEY, words INTEGER);
+            """)
+        self.conn.commit()
+
+    def cached_hash(self, fp):
+        """md5 hash of a file if the file did not change since it was hashed, else None"""
+        st = os.stat(fp)
+        row = self.conn.execute("SELECT mtime, size, md5 FROM file_hashes WHERE path = ?",
+                                (fp,)).fetchone()
+        if row and row[:2] == (st.st_mtime_ns, st.st_size):
+            return row[2]
+        return None
+
+    def get(self, md5):
+        """Length of the file with this content hash, or None"""
+        row = self.conn.execute("SELECT words FROM lengths WHERE md5 = ?", (md5,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, fp, md5, words):
+        st = os.stat(fp)
+        self.conn.execute("INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?)",
+                          (fp, st.st_mtime_ns, st.st_size, md5))
+        self.conn.execute("INSERT OR REPLACE INTO lengths VALUES (?, ?)", (md5, words))
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+_worker_cache = None
+
+
+def _init_len_worker(cache_fp):
+    global _worker_cache
+    _worker_cache = LenStatsCache(cache_fp) if cache_fp else None
+
+
+def hash_and_len(fp):
+    """Read a file once: md5 hash of its content and its length in words
+    (the length is taken from the cache of the worker if the content is known)
+
+    Returns:
+        tuple (path, md5, number of words)
+    """
+    with open(fp, mode="rb") as file:
+        data = file.read()
+    md5 = hashlib.md5(data).hexdigest()
+    words = _worker_cache.get(md5) if _worker_cache else None
+    if words is None:
+        words = len(word_rgx.findall(data.decode("utf8")))
+    return fp, md5, words
+
+
+def release_files(in_dir, ext="-ara1"):
+    """Paths of all files in the release that end with `ext` (in os.walk order)"""
+    paths = []
     for root, dirs, filenames in os.walk(in_dir):
         for f in filenames:
-            if f.endswith("-ara1"):
-                path_to_file = os.path.join(root, f)
-                # print(path_to_file)
-
-                fr1 = get_len(path_to_file)
-                fr2 = "{:,}".format(fr1)
-                stats.append("%010d\t%s\t%s" % (fr1, f, fr2))
+            if f.endswith(ext):
+                paths.append(os.path.join(root, f))
+    return paths
+
+
+def get_century(uri):
+    """Century (AH) of the author of a URI (the URI starts with the death date)"""
+    date = re.match(r"\d{4}", uri)
+    if not date:
+        return None
+    return (int(date.group()) - 1) // 100 + 1
+
+
+def collect_lengths(in_dir, workers=1, cache_fp=None, chunksize=16):
+    """Count the words of all -ara1 files in a release.
+
+    Args:
+        in_dir (str): path to the release folder
+        workers (int): number of processes used to count the files
+            that are not in the cache
+        cache_fp (str): path to a LenStatsCache database; if None,
+            all files are counted
+        chunksize (int): number of files sent to a process at once
+
+    Returns:
+        list of dicts (keys: uri, path, author, book, century, words, md5),
+            in os.walk order
+    """
+    paths = release_files(in_dir)
+    cache = LenStatsCache(cache_fp) if cache_fp else None
+    results = dict()
+    to_count = []
+    for fp in paths:
+        md5 = cache.cached_hash(fp) if cache else None
+        words = cache.get(md5) if md5 else None
+        if words is None:
+            to_count.append(fp)
+        else:
+            results[fp] = (md5, words)
+    print("{} files, {} to count".format(len(paths), len(to_count)))
+
+    if workers > 1 and len(to_count) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_len_worker,
+                                 initargs=(cache_fp,)) as pool:
+            counted = list(pool.map(hash_and_len, to_count, chunksize=chunksize))
+    else:
+        _init_len_worker(cache_fp)
+        counted = [hash_and_len(fp) for fp in to_count]
+        _init_len_worker(None)
+    for fp, md5, words in counted:
+        results[fp] = (md5, words)
+        if cache:
+            cache.put(fp, md5, words)
+    if cache:
+        cache.commit()
+        cache.close()
+
+    records = []
+    for fp in paths:
+        md5, words = results[fp]
+        uri = os.path.basename(fp)
+        records.append({"uri": uri, "path": fp,
+                        "author": uri.split(".")[0],
+                        "book": ".".join(uri.split(".")[:2]),
+                        "century": get_century(uri),
+                        "words": words, "md5": md5})
+    return records
+
+
+def aggregate_stats(records, key):
+    """Aggregate the lengths of texts per author or per century.
+
+    As in `process_stats`, the unique length of a book is the length
+    of its longest version.
+
+    Args:
+        records (list): output of `collect_lengths`
+        key (str): "author" or "century"
+
+    Returns:
+        list of dicts (keys: `key`, files, books, words_all, words_unique),
+            sorted by `key`
+    """
+    groups = dict()
+    for r in records:
+        g = groups.setdefault(r[key], {"files": 0, "words_all": 0, "books": dict()})
+        g["files"] += 1
+        g["words_all"] += r["words"]
+        g["books"][r["book"]] = max(g["books"].get(r["book"], 0), r["words"])
+    rows = []
+    for k in sorted(groups, key=lambda k: (k is None, k)):
+        g = groups[k]
+        rows.append({key: k, "files": g["files"], "books": len(g["books"]),
+                     "words_all": g["words_all"],
+                     "words_unique": sum(g["books"].values())})
+    return rows
+
+
+def export_csv(rows, fp):
+    """Write a list of dicts (records or aggregates) to a csv file"""
+    if not rows:
+        return
+    with open(fp, "w", encoding="utf8", newline="") as f9:
+        writer = csv.DictWriter(f9, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def export_parquet(rows, fp):
+    """Write a list of dicts (records or aggregates) to a parquet file (requires pyarrow)"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    pq.write_table(pa.Table.from_pylist(rows), fp)
+
+
+def generate_stats(in_dir, workers=1, cache_fp=None, out_fp="raw_len_stats.txt",
+                   export_folder=None, export_format="csv"):
+    """Count the words of all -ara1 files in a release and write raw_len_stats.txt.
+
+    Args:
+        in_dir (str): path to the release folder
+        workers (int): number of processes
+        cache_fp (str): path to a LenStatsCache database; if provided,
+            only the files that changed since the previous run are recounted
+        out_fp (str): path to the raw length stats file (input of `process_stats`)
+        export_folder (str): if provided, the per-file lengths and the
+            per-author and per-century aggregates are exported to this folder
+        export_format (str): "csv" or "parquet"
+
+    Returns:
+        list of dicts (see `collect_lengths`)
+    """
+    records = collect_lengths(in_dir, workers=workers, cache_fp=cache_fp)
+    stats = []
+    for r in records:
+        fr1 = r["words"]
+        fr2 = "{:,}".format(fr1)
+        stats.append("%010d\t%s\t%s" % (fr1, r["uri"], fr2))
 
-                print("%010d\t%s\t%s" % (fr1, f, fr2))
+        print("%010d\t%s\t%s" % (fr1, r["uri"], fr2))
 
-    with open("raw_len_stats.txt", "w", encoding="utf8") as f9:
+    with open(out_fp, "w", encoding="utf8") as f9:
         f9.write("\n".join(stats))
 
+    if export_folder:
+        export = export_parquet if export_format == "parquet" else export_csv
+        os.makedirs(export_folder, exist_ok=True)
+        for name, rows in [("len_stats", records),
+                           ("len_stats_per_author", aggregate_stats(records, "author")),
+                           ("len_stats_per_century", aggregate_stats(records, "century"))]:
+            export(rows, os.path.join(export_folder, "{}.{}".format(name, export_format)))
+    return records
+
 
 # generateStats()
 def ref(sum_re):
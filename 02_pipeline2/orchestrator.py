@@ -13,10 +13,15 @@ DEC-P1-016 (Manifest + BQ Write)
   - يكتب lineage مباشرة لـ BigQuery
   - process_gcs_prefix بديل process_directory لـ GCS
   - process_directory يبقى للاختبار المحلي
+  - تشغيل متوازٍ (workers) + سجل تقدّم قابل للاستئناف (ProgressLedger)
+  - سجل محتوى (DedupLedger) يتخطّى الملفات المُدخلة سابقاً بنفس الإعدادات
+  - رفع القطع كشظايا JSONL/Parquet + index.json بدل كائن لكل قطعة
 """
 import json
 import logging
+import os
 import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime, timezone
 from dataclasses import dataclass, field
 from pathlib import Path
@@ -26,7 +31,10 @@ from .converter_registry import ConverterRegistry, ConversionResult, FileFormat
 from .text_cleaner import get_cleaner, CleanResult
 from .quality_gate import QualityGate, QualityResult
 from .chunker import ArabicChunker, ChunkingResult, Chunk
-from .storage import StorageBackend
+from .storage import (
+    DEFAULT_SHARD_BYTES, SHARD_FORMATS, StorageBackend, create_storage, file_md5,
+)
+from .run_ledger import DedupLedger, ProgressLedger, config_fingerprint
 
 logger = logging.getLogger("pipeline.orchestrator")
 
@@ -55,6 +63,12 @@ class PipelineResult:
     cleaned_uri: str = ""
     chunked_uris: List[str] = field(default_factory=list)
     manifest_uri: str = ""
+    chunk_shard_uris: List[str] = field(default_factory=list)
+    chunk_index_uri: str = ""
+    # dedup
+    content_hash: str = ""
+    source_bytes: int = 0
+    deduplicated: bool = False
 
 
 # ─────────────────────────────────────────────
@@ -88,6 +102,9 @@ class PipelineOrchestrator:
         deep_clean_threshold: float = 0.7,
         write_bq: bool = True,
         language: str = "ar",
+        dedup_ledger_path: Optional[str] = None,
+        chunk_format: str = "jsonl",
+        max_shard_bytes: int = DEFAULT_SHARD_BYTES,
     ):
         """
         تهيئة خط المعالجة.
@@ -102,11 +119,34 @@ class PipelineOrchestrator:
             deep_clean_threshold: عتبة الجودة لتفعيل التنظيف العميق (افتراضي: 0.7)
             write_bq: كتابة النتائج في BigQuery (افتراضي: True)
             language: لغة النصوص "ar" | "en" | "mixed" (افتراضي: "ar")
+            dedup_ledger_path: مسار سجل المحتوى SQLite — يتخطّى الملفات
+                               ذات البايتات والإعدادات المطابقة (افتراضي: معطّل)
+            chunk_format: "jsonl" (الافتراضي) | "parquet" (شظايا + فهرس)
+                          أو "txt" (كائن لكل قطعة — التخطيط السابق)
+            max_shard_bytes: الحد التقريبي لحجم الشظية (افتراضي: 32MB)
         """
+        if chunk_format not in SHARD_FORMATS | {"txt"}:
+            raise ValueError("صيغة قطع غير معروفة: {}".format(chunk_format))
         self.storage = storage
+        # إعدادات البناء — لإعادة إنشاء المنسّق داخل عمليات العمّال
+        self._config = {
+            "project": project,
+            "dataset": dataset,
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+            "remove_diacritics": remove_diacritics,
+            "deep_clean_threshold": deep_clean_threshold,
+            "write_bq": write_bq,
+            "language": language,
+            "dedup_ledger_path": dedup_ledger_path,
+            "chunk_format": chunk_format,
+            "max_shard_bytes": max_shard_bytes,
+        }
         self.project = project
         self.dataset = dataset
         self.write_bq = write_bq
+        self.chunk_format = chunk_format
+        self.max_shard_bytes = max_shard_bytes
 
         self.converter = ConverterRegistry()
         self.cleaner = get_cleaner(
@@ -120,6 +160,12 @@ class PipelineOrchestrator:
             chunk_size=chunk_size,
             overlap=chunk_overlap,
         )
+        self.dedup_ledger = (
+            DedupLedger(dedup_ledger_path) if dedup_ledger_path else None
+        )
+        self.config_fingerprint = config_fingerprint(
+            self.cleaner, self.quality_gate, self.chunker
+        )
 
         self.stats = {
             "files_processed": 0,
@@ -127,6 +173,9 @@ class PipelineOrchestrator:
             "files_rejected": 0,
             "files_error": 0,
             "total_chunks": 0,
+            "files_resumed": 0,
+            "files_deduplicated": 0,
+            "bytes_saved": 0,
         }
 
         # Lazy BQ client — لا نُنشئه إلا عند الحاجة
@@ -157,6 +206,18 @@ class PipelineOrchestrator:
         stem = Path(source_path).stem
         self.stats["files_processed"] += 1
 
+        # ── 0. فحص التكرار قبل التنزيل ─────────
+        content_hash = ""
+        if self.dedup_ledger is not None:
+            try:
+                content_hash = self.storage.content_md5(source_path) or ""
+            except Exception as e:
+                logger.warning("تعذّر قراءة hash من المخزن لـ %s: %s", source_path, e)
+            if content_hash:
+                duplicate = self._dedup_hit(source_path, content_hash, started)
+                if duplicate is not None:
+                    return duplicate
+
         # ── 1. تنزيل من المخزن ──────────────────
         try:
             local_path = self.storage.download_to_temp(source_path)
@@ -169,6 +230,13 @@ class PipelineOrchestrator:
                 run_id, source_path, "download", str(e), started, source_collection
             )
 
+        source_bytes = local_path.stat().st_size
+        if self.dedup_ledger is not None and not content_hash:
+            content_hash = file_md5(local_path)
+            duplicate = self._dedup_hit(source_path, content_hash, started)
+            if duplicate is not None:
+                return duplicate
+
         # ── 2. تحويل ────────────────────────────
         try:
             conversion = self.converter.convert(local_path)
@@ -240,9 +308,12 @@ class PipelineOrchestrator:
                 duration_seconds=(done - started).total_seconds(),
                 converted_uri=converted_uri,
                 cleaned_uri=cleaned_uri,
+                content_hash=content_hash,
+                source_bytes=source_bytes,
             )
             self._write_manifest(result, source_collection)
             self._write_lineage(result)
+            self._record_dedup(result)
             return result
 
         # ── 5. تقطيع ────────────────────────────
@@ -262,15 +333,15 @@ class PipelineOrchestrator:
                 run_id, source_path, "chunk", str(e), started, source_collection
             )
 
-        # رفع القطع
-        chunked_uris = []
-        for chunk in chunking.chunks:
-            chunk_path = "chunked/{}/{:04d}.txt".format(run_id, chunk.chunk_index)
-            try:
-                uri = self.storage.upload_text(chunk.text, chunk_path)
-                chunked_uris.append(uri)
-            except Exception as e:
-                logger.warning("فشل رفع القطعة %d: %s", chunk.chunk_index, e)
+        # رفع القطع — فشله يُفشل الملف (لا يُسجَّل كمكتمل في سجلّي التقدّم و dedup)
+        try:
+            chunked_uris, chunk_shard_uris, chunk_index_uri = self._upload_chunks(
+                run_id, chunking
+            )
+        except Exception as e:
+            return self._finalize_error(
+                run_id, source_path, "upload", str(e), started, source_collection
+            )
 
         # ── 6. نجاح ─────────────────────────────
         self.stats["files_success"] += 1
@@ -292,12 +363,113 @@ class PipelineOrchestrator:
             converted_uri=converted_uri,
             cleaned_uri=cleaned_uri,
             chunked_uris=chunked_uris,
+            chunk_shard_uris=chunk_shard_uris,
+            chunk_index_uri=chunk_index_uri,
+            content_hash=content_hash,
+            source_bytes=source_bytes,
         )
 
         self._write_manifest(result, source_collection)
         self._write_lineage(result)
+        self._record_dedup(result)
         return result
 
+    def _upload_chunks(self, run_id: str, chunking: ChunkingResult):
+        """
+        رفع القطع — شظايا محدودة الحجم (رحلة واحدة لكل شظية) أو كائن لكل قطعة.
+
+        Returns:
+            (chunked_uris, chunk_shard_uris, chunk_index_uri) — chunked_uris
+            لصيغة "txt" فقط
+
+        Raises:
+            الاستثناء الأصلي عند فشل أي رفع — الكل أو لا شيء (يُحذف ما رُفع)
+        """
+        if self.chunk_format == "txt":
+            chunked_uris, uploaded = [], []
+            try:
+                for chunk in chunking.chunks:
+                    chunk_path = "chunked/{}/{:04d}.txt".format(run_id, chunk.chunk_index)
+                    chunked_uris.append(self.storage.upload_text(chunk.text, chunk_path))
+                    uploaded.append(chunk_path)
+            except Exception as e:
+                logger.warning("فشل رفع القطعة %d: %s", chunk.chunk_index, e)
+                for path in uploaded:
+                    try:
+                        self.storage.delete_file(path)
+                    except Exception as cleanup_error:
+                        logger.warning("تعذّر حذف القطعة %s: %s", path, cleanup_error)
+                raise
+            return chunked_uris, [], ""
+
+        records = (
+            {
+                # نفس chunk_id المستخدم في chunk_lineage
+                "chunk_id": "{}_{:04d}".format(run_id, c.chunk_index),
+                "chunk_index": c.chunk_index,
+                "text": c.text,
+                "word_count": c.word_count,
+                "content_hash": c.content_hash,
+                "start_char": c.start_char,
+                "end_char": c.end_char,
+            }
+            for c in chunking.chunks
+        )
+        try:
+            index = self.storage.upload_chunk_shards(
+                records,
+                "chunked/{}".format(run_id),
+                max_shard_bytes=self.max_shard_bytes,
+                fmt=self.chunk_format,
+            )
+        except Exception as e:
+            logger.warning("فشل رفع شظايا القطع لـ %s: %s", run_id, e)
+            raise
+        return [], index.shard_uris, index.index_uri
+
+    # ─────────────────────────────────────────
+    # Dedup
+    # ─────────────────────────────────────────
+
+    def _dedup_hit(
+        self,
+        source_path: str,
+        content_hash: str,
+        started: datetime,
+    ) -> Optional[PipelineResult]:
+        """إن سبق إدخال نفس البايتات بنفس الإعدادات — نتيجة تعيد استخدام manifest السابق"""
+        prior = self.dedup_ledger.lookup(content_hash, self.config_fingerprint)
+        if prior is None:
+            return None
+        self.stats["files_deduplicated"] += 1
+        self.stats["bytes_saved"] += prior["source_bytes"] or 0
+        done = datetime.now(timezone.utc)
+        logger.info(
+            "[DEDUP] %s ≡ %s (run %s) — تخطّي",
+            source_path, prior["source_path"], prior["run_id"],
+        )
+        return PipelineResult(
+            run_id=prior["run_id"],
+            source_path=source_path,
+            status=prior["status"],
+            stage_reached=prior["stage_reached"],
+            started_at=started.isoformat(),
+            completed_at=done.isoformat(),
+            duration_seconds=(done - started).total_seconds(),
+            manifest_uri=prior["manifest_uri"] or "",
+            content_hash=content_hash,
+            source_bytes=prior["source_bytes"] or 0,
+            deduplicated=True,
+        )
+
+    def _record_dedup(self, result: PipelineResult) -> None:
+        if self.dedup_ledger is None:
+            return
+        try:
+            self.dedup_ledger.record(result, self.config_fingerprint)
+        except Exception as e:
+            logger.warning("فشل تسجيل dedup لـ %s: %s", result.source_path, e)
+
     # ─────────────────────────────────────────
     # Batch Processing
     # ─────────────────────────────────────────
@@ -306,6 +478,9 @@ class PipelineOrchestrator:
         self,
         prefix: str,
         source_collection: str = "",
+        workers: int = 1,
+        ledger_path: Optional[str] = None,
+        retry_errors: bool = True,
     ) -> List[PipelineResult]:
         """
         معالجة كل الملفات المدعومة تحت prefix في المخزن.
@@ -313,11 +488,14 @@ class PipelineOrchestrator:
         يكتشف الصيغ المدعومة تلقائياً ويعالج كل ملف عبر process_file.
 
         Returns:
-            List[PipelineResult]: نتيجة لكل ملف مُعالَج
+            List[PipelineResult]: نتيجة لكل ملف مُعالَج (بترتيب الملفات)
 
         Args:
             prefix: مسار في المخزن (مثال: "raw/other/global_library/")
             source_collection: تصنيف المجموعة
+            workers: عدد العمليات المتوازية (1 = تسلسلي، 0 = عدد الأنوية)
+            ledger_path: مسار سجل التقدّم SQLite — يُتخطّى ما اكتمل سابقاً
+            retry_errors: إعادة محاولة الملفات التي انتهت بخطأ عند الاستئناف
         """
         supported = set(self.converter.supported_formats())
         all_files = self.storage.list_files(prefix)
@@ -329,24 +507,17 @@ class PipelineOrchestrator:
             "وُجد %d ملف مدعوم من أصل %d تحت %s",
             len(files), len(all_files), prefix,
         )
-        results = []
-        for f in files:
-            try:
-                result = self.process_file(f, source_collection)
-                results.append(result)
-                logger.info(
-                    "[%s] %s → %s (%d chunks)",
-                    result.run_id, Path(f).name, result.status,
-                    result.chunking.total_chunks if result.chunking else 0,
-                )
-            except Exception as e:
-                logger.error("خطأ غير متوقع في %s: %s", f, e)
-        return results
+        return self._process_many(
+            files, source_collection, workers, ledger_path, retry_errors
+        )
 
     def process_directory(
         self,
         directory: Path,
         source_collection: str = "",
+        workers: int = 1,
+        ledger_path: Optional[str] = None,
+        retry_errors: bool = True,
     ) -> List[PipelineResult]:
         """
         معالجة مجلد محلي — للاختبار مع LocalStorage.
@@ -356,6 +527,9 @@ class PipelineOrchestrator:
         Args:
             directory: مسار المجلد المحلي
             source_collection: تصنيف المجموعة
+            workers: عدد العمليات المتوازية (1 = تسلسلي، 0 = عدد الأنوية)
+            ledger_path: مسار سجل التقدّم SQLite — يُتخطّى ما اكتمل سابقاً
+            retry_errors: إعادة محاولة الملفات التي انتهت بخطأ عند الاستئناف
 
         Returns:
             List[PipelineResult]: نتيجة لكل ملف مُعالَج
@@ -370,17 +544,127 @@ class PipelineOrchestrator:
             if f.is_file() and f.suffix.lower() in supported
         )
         logger.info("وُجد %d ملف مدعوم في %s", len(files), directory)
-        results = []
+        rel_paths = []
         for f in files:
             # تحويل المسار المحلي إلى مسار نسبي
             try:
-                rel = str(f.relative_to(self.storage.base))
+                rel_paths.append(str(f.relative_to(self.storage.base)))
             except (AttributeError, ValueError):
-                rel = str(f)
-            result = self.process_file(rel, source_collection)
+                rel_paths.append(str(f))
+        return self._process_many(
+            rel_paths, source_collection, workers, ledger_path, retry_errors
+        )
+
+    def _process_many(
+        self,
+        files: List[str],
+        source_collection: str,
+        workers: int,
+        ledger_path: Optional[str],
+        retry_errors: bool,
+    ) -> List[PipelineResult]:
+        """تنفيذ دفعة ملفات — تسلسلياً أو عبر مجمّع عمليات، مع سجل تقدّم اختياري"""
+        ledger = ProgressLedger(ledger_path) if ledger_path else None
+        if ledger is not None:
+            pending = ledger.pending(files, retry_errors=retry_errors)
+            resumed = len(files) - len(pending)
+            if resumed:
+                logger.info("[LEDGER] استئناف: تخطّي %d ملف مكتمل", resumed)
+            self.stats["files_resumed"] += resumed
+            files = pending
+
+        workers = workers or os.cpu_count() or 1
+        try:
+            if workers <= 1 or len(files) <= 1:
+                return self._process_sequential(files, source_collection, ledger)
+            return self._process_parallel(files, source_collection, workers, ledger)
+        finally:
+            if ledger is not None:
+                logger.info("[LEDGER] %s", ledger.summary())
+                ledger.close()
+
+    def _process_sequential(
+        self,
+        files: List[str],
+        source_collection: str,
+        ledger: Optional[ProgressLedger],
+    ) -> List[PipelineResult]:
+        results = []
+        for f in files:
+            try:
+                result = self.process_file(f, source_collection)
+            except Exception as e:
+                logger.error("خطأ غير متوقع في %s: %s", f, e)
+                continue
             results.append(result)
+            self._log_result(f, result)
+            if ledger is not None:
+                ledger.record(result)
+        return results
+
+    def _process_parallel(
+        self,
+        files: List[str],
+        source_collection: str,
+        workers: int,
+        ledger: Optional[ProgressLedger],
+    ) -> List[PipelineResult]:
+        """
+        كل عامل يبني منسّقاً خاصاً به (مخزن + BQ client مستقلان).
+        السجل والإحصائيات تُحدَّث في العملية الأم فقط — كاتب واحد.
+        """
+        storage_config = self.storage.to_config()
+        order = {f: i for i, f in enumerate(files)}
+        results = []
+        logger.info("تشغيل متوازٍ: %d ملف على %d عامل", len(files), workers)
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(storage_config, self._config),
+        ) as pool:
+            futures = {
+                pool.submit(_worker_process_file, f, source_collection): f
+                for f in files
+            }
+            for future in as_completed(futures):
+                f = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error("خطأ غير متوقع في %s: %s", f, e)
+                    continue
+                self._merge_stats(result)
+                results.append(result)
+                self._log_result(f, result)
+                if ledger is not None:
+                    ledger.record(result)
+        results.sort(key=lambda r: order[r.source_path])
         return results
 
+    def _merge_stats(self, result: PipelineResult) -> None:
+        """دمج نتيجة عامل في إحصائيات العملية الأم"""
+        self.stats["files_processed"] += 1
+        if result.deduplicated:
+            self.stats["files_deduplicated"] += 1
+            self.stats["bytes_saved"] += result.source_bytes
+        elif result.status == "success":
+            self.stats["files_success"] += 1
+            self.stats["total_chunks"] += (
+                result.chunking.total_chunks if result.chunking else 0
+            )
+        elif result.status == "rejected":
+            self.stats["files_rejected"] += 1
+        else:
+            self.stats["files_error"] += 1
+
+    @staticmethod
+    def _log_result(source_path: str, result: PipelineResult) -> None:
+        logger.info(
+            "[%s] %s → %s (%d chunks)",
+            result.run_id, Path(source_path).name, result.status,
+            result.chunking.total_chunks if result.chunking else 0,
+        )
+
     # ─────────────────────────────────────────
     # Manifest
     # ─────────────────────────────────────────
@@ -412,7 +696,17 @@ class PipelineOrchestrator:
             ),
             "converted_uri": result.converted_uri,
             "cleaned_uri": result.cleaned_uri,
-            "chunked_uris_count": len(result.chunked_uris),
+            # عدد القطع المرفوعة (بأي صيغة) — الشظايا تُعدّ في chunk_shards_count
+            "chunked_uris_count": (
+                result.chunking.total_chunks
+                if result.chunk_index_uri and result.chunking
+                else len(result.chunked_uris)
+            ),
+            "chunk_shards_count": len(result.chunk_shard_uris),
+            "chunk_format": self.chunk_format,
+            "chunk_index_uri": result.chunk_index_uri or None,
+            "content_hash": result.content_hash or None,
+            "config_fingerprint": self.config_fingerprint,
             "error": result.error or None,
             "started_at": result.started_at,
             "completed_at": result.completed_at,
@@ -582,6 +876,7 @@ class PipelineOrchestrator:
             "success_rate": self.stats["files_success"] / processed,
             "rejection_rate": self.stats["files_rejected"] / processed,
             "error_rate": self.stats["files_error"] / processed,
+            "dedup_rate": self.stats["files_deduplicated"] / processed,
         }
 
     # ─────────────────────────────────────────
@@ -613,3 +908,24 @@ class PipelineOrchestrator:
         self._write_manifest(result, source_collection)
         self._write_lineage(result)
         return result
+
+
+# ─────────────────────────────────────────────
+# Worker Process Entry Points
+# ─────────────────────────────────────────────
+
+_WORKER_ORCHESTRATOR: Optional[PipelineOrchestrator] = None
+
+
+def _init_worker(storage_config, orchestrator_config: Dict) -> None:
+    """يُنفَّذ مرة واحدة لكل عملية عامل — يبني منسّقاً محلياً"""
+    global _WORKER_ORCHESTRATOR
+    mode, storage_kwargs = storage_config
+    _WORKER_ORCHESTRATOR = PipelineOrchestrator(
+        storage=create_storage(mode, **storage_kwargs),
+        **orchestrator_config,
+    )
+
+
+def _worker_process_file(source_path: str, source_collection: str) -> PipelineResult:
+    return _WORKER_ORCHESTRATOR.process_file(source_path, source_collection)
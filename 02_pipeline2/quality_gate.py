@@ -2,12 +2,18 @@
 """
 Quality Gate — 4 معايير جودة
 DEC-P1-008
+
+المقاييس الحرفية (عربي/لاتيني/Unicode) تُحسب في مرور واحد:
+str.translate بجدول أصناف مُحسوب مسبقاً لكل نقطة في BMP ثم str.count.
+التكرار مقياس على مستوى الأسطر (أسطر مكررة بعد strip) فلا يدخل جدول الأصناف الحرفي:
+مرور ثانٍ منفصل — split + strip + set، كلها في C بلا حلقة Python لكل سطر.
 """
 import logging
 import re
 import unicodedata
 from collections import Counter
 from dataclasses import dataclass, field
+from functools import lru_cache
 from typing import Dict, List, Tuple
 
 logger = logging.getLogger("pipeline.quality_gate")
@@ -25,6 +31,34 @@ DEFAULT_MIN_LATIN_RATIO = 0.50
 
 SUPPORTED_LANGUAGES = {"ar", "en", "mixed"}
 
+# أصناف المرور الموحّد: group*2 + bad — group: 0 متجاهَل، 1 عربي، 2 لاتيني، 3 آخر
+_IGNORED_PUNCT = '.,;:!?()[]{}«»"\''
+_GROUP_SKIP, _GROUP_ARABIC, _GROUP_LATIN, _GROUP_OTHER = 0, 1, 2, 3
+_CLASS_CHARS = "01234567"
+_NON_CLASS = re.compile("[^01234567]")
+_BMP_SIZE = 0x10000
+
+def _classify(ch) -> int:
+    if ch.isspace() or ch.isdigit() or ch in _IGNORED_PUNCT: group = _GROUP_SKIP
+    elif QualityGate._is_arabic_char(ch): group = _GROUP_ARABIC
+    elif QualityGate._is_latin_char(ch): group = _GROUP_LATIN
+    else: group = _GROUP_OTHER
+    bad = ch in PROBLEMATIC_CHARS or unicodedata.category(ch) == "Cn"
+    return group * 2 + int(bad)
+
+@lru_cache(maxsize=1)
+def _class_table() -> str:
+    """جدول BMP: table[ord(ch)] = رمز الصنف — النقاط خارج BMP تبقى كما هي في translate"""
+    return "".join(_CLASS_CHARS[_classify(chr(cp))] for cp in range(_BMP_SIZE))
+
+def _class_counts(text) -> List[int]:
+    """عدّاد لكل صنف من الأصناف الثمانية — مرور translate واحد"""
+    classes = text.translate(_class_table())
+    counts = [classes.count(c) for c in _CLASS_CHARS]
+    if sum(counts) != len(text):
+        for ch in _NON_CLASS.findall(classes): counts[_classify(ch)] += 1
+    return counts
+
 @dataclass
 class QualityFlag:
     name: str
@@ -78,24 +112,42 @@ class QualityGate:
         flags = []
         length = len(text.strip())
         flags.append(QualityFlag("length", length >= self.min_length, length, self.min_length))
+        ar, lr, uv = self._char_ratios(text)
         # فحص اللغة حسب النوع
-        ar = self._arabic_ratio(text)
         if self.language == "ar":
             flags.append(QualityFlag("arabic_ratio", ar >= self.min_arabic_ratio, ar, self.min_arabic_ratio))
         elif self.language == "en":
-            lr = self._latin_ratio(text)
             flags.append(QualityFlag("latin_ratio", lr >= self.min_latin_ratio, lr, self.min_latin_ratio))
         else:  # mixed — لا فحص لغة، الفحوصات الأخرى كافية
             flags.append(QualityFlag("language_ratio", True, 1.0, 0.0, "mixed — skipped"))
-        uv = self._unicode_valid_ratio(text)
         flags.append(QualityFlag("unicode_valid", uv >= self.min_unicode_valid, uv, self.min_unicode_valid))
-        rr = self._repetition_ratio(text)
+        rr = self._line_repetition_ratio(text)
         flags.append(QualityFlag("repetition", rr <= self.max_repetition_ratio, rr, self.max_repetition_ratio))
         all_passed = all(f.passed for f in flags)
         weights = {"length": 0.15, "arabic_ratio": 0.35, "latin_ratio": 0.35, "language_ratio": 0.35, "unicode_valid": 0.25, "repetition": 0.25}
         score = min(1.0, sum(weights.get(f.name, 0.25) * (1.0 if f.passed else max(0, f.value / f.threshold if f.threshold > 0 else 0)) for f in flags))
         return QualityResult(passed=all_passed, score=score, flags=flags, text_length=length, arabic_ratio=ar, unicode_valid_ratio=uv, repetition_ratio=rr)
 
+    @staticmethod
+    def _char_ratios(text) -> Tuple[float, float, float]:
+        """(arabic_ratio, latin_ratio, unicode_valid_ratio) في مرور واحد — مطابقة للدوال المنفصلة أدناه"""
+        counts = _class_counts(text)
+        arabic = counts[2] + counts[3]
+        latin = counts[4] + counts[5]
+        letters = len(text) - counts[0] - counts[1]
+        bad = counts[1] + counts[3] + counts[5] + counts[7]
+        ar = arabic / letters if letters else 0.0
+        lr = latin / letters if letters else 0.0
+        return ar, lr, 1.0 - (bad / len(text))
+
+    @staticmethod
+    def _line_repetition_ratio(text) -> float:
+        """نسبة الأسطر المكررة — مطابقة لـ _repetition_ratio (المكرر = الأسطر − الفريدة)"""
+        lines = list(filter(None, map(str.strip, text.split("\n"))))
+        if len(lines) <= 1: return 0.0
+        return (len(lines) - len(set(lines))) / len(lines)
+
+    # الدوال المنفصلة — مرجع للمطابقة وخط الأساس في benchmarks/bench_quality_gate.py
     @staticmethod
     def _is_arabic_char(ch): return any(s <= ord(ch) <= e for s, e in ARABIC_RANGES)
 
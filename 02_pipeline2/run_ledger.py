@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Run Ledger — سجل تقدّم التشغيل
+================================
+  - ProgressLedger: حالة كل ملف في تشغيل دفعي، يسمح باستئناف
+    process_gcs_prefix / process_directory من حيث توقّف التشغيل.
+  - DedupLedger: سجل محتوى (hash البايتات + بصمة الإعدادات) يسمح بتخطّي
+    ملف سبق إدخاله — ولو باسم آخر أو في تشغيل سابق — وإعادة استخدام manifest.
+
+Usage:
+  ledger = ProgressLedger("/tmp/iqraa-pipeline/ledger.sqlite")
+  done = ledger.completed_paths()
+  ledger.record(result)
+
+  dedup = DedupLedger("/tmp/iqraa-pipeline/dedup.sqlite")
+  prior = dedup.lookup(content_hash, config_fingerprint)
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Set
+
+logger = logging.getLogger("pipeline.run_ledger")
+
+# الحالات النهائية — لا يُعاد معالجة الملف عند الاستئناف
+FINAL_STATUSES = ("success", "rejected")
+
+
+class ProgressLedger:
+    """سجل تقدّم لكل ملف — يُكتب فور انتهاء الملف (commit لكل صف)"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS file_progress (
+                source_path   TEXT PRIMARY KEY,
+                status        TEXT NOT NULL,
+                stage_reached TEXT,
+                run_id        TEXT,
+                manifest_uri  TEXT,
+                chunks        INTEGER DEFAULT 0,
+                error         TEXT,
+                attempts      INTEGER DEFAULT 1,
+                updated_at    TEXT
+            )
+            """
+        )
+        self._conn.commit()
+
+    def completed_paths(self, retry_errors: bool = True) -> Set[str]:
+        """المسارات التي لا تحتاج إعادة معالجة"""
+        statuses = FINAL_STATUSES if retry_errors else FINAL_STATUSES + ("error",)
+        placeholders = ",".join("?" for _ in statuses)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT source_path FROM file_progress WHERE status IN ({})".format(
+                    placeholders
+                ),
+                statuses,
+            ).fetchall()
+        return {r[0] for r in rows}
+
+    def pending(self, paths: Iterable[str], retry_errors: bool = True) -> list:
+        """تصفية قائمة مسارات — يُرجع ما لم يكتمل بعد (بنفس الترتيب)"""
+        done = self.completed_paths(retry_errors=retry_errors)
+        return [p for p in paths if p not in done]
+
+    def record(self, result) -> None:
+        """تسجيل نتيجة PipelineResult — upsert مع عدّاد المحاولات"""
+        row = (
+            result.source_path,
+            result.status,
+            result.stage_reached,
+            result.run_id,
+            result.manifest_uri,
+            result.chunking.total_chunks if result.chunking else 0,
+            result.error or None,
+            datetime.now(timezone.utc).isoformat(),
+        )
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO file_progress
+                    (source_path, status, stage_reached, run_id, manifest_uri,
+                     chunks, error, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(source_path) DO UPDATE SET
+                    status=excluded.status,
+                    stage_reached=excluded.stage_reached,
+                    run_id=excluded.run_id,
+                    manifest_uri=excluded.manifest_uri,
+                    chunks=excluded.chunks,
+                    error=excluded.error,
+                    attempts=file_progress.attempts + 1,
+                    updated_at=excluded.updated_at
+                """,
+                row,
+            )
+            self._conn.commit()
+
+    def summary(self) -> Dict[str, int]:
+        """عدد الملفات لكل حالة"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM file_progress GROUP BY status"
+            ).fetchall()
+        return {status: count for status, count in rows}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def config_fingerprint(*components) -> str:
+    """
+    بصمة إعدادات المراحل (منظّف، مقطّع، بوابة جودة...).
+
+    تُبنى من اسم الصنف والسمات البسيطة لكل مكوّن — أي تغيير في عتبة
+    أو حجم قطعة يُنتج بصمة جديدة فيُعاد المعالجة.
+    """
+    parts = []
+    for comp in components:
+        attrs = {
+            k: v for k, v in sorted(vars(comp).items())
+            if isinstance(v, (str, int, float, bool)) and not k.startswith("_")
+        }
+        parts.append({"class": type(comp).__name__, "attrs": attrs})
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class DedupLedger:
+    """سجل إزالة التكرار — مفتاحه (content_hash, config_fingerprint)"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # timeout: عدة عمليات عمّال قد تكتب في نفس الملف
+        self._conn = sqlite3.connect(
+            str(self.path), timeout=30, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS content_ledger (
+                content_hash       TEXT NOT NULL,
+                config_fingerprint TEXT NOT NULL,
+                source_path        TEXT,
+                source_bytes       INTEGER DEFAULT 0,
+                status             TEXT NOT NULL,
+                stage_reached      TEXT,
+                run_id             TEXT,
+                manifest_uri       TEXT,
+                chunks             INTEGER DEFAULT 0,
+                created_at         TEXT,
+                PRIMARY KEY (content_hash, config_fingerprint)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def lookup(self, content_hash: str, fingerprint: str) -> Optional[Dict]:
+        """إرجاع السجل السابق لنفس المحتوى والإعدادات — أو None"""
+        with self._lock:
+            cur = self._conn.execute(
+                "SELECT * FROM content_ledger"
+                " WHERE content_hash = ? AND config_fingerprint = ?",
+                (content_hash, fingerprint),
+            )
+            row = cur.fetchone()
+            if row is None:
+                return None
+            return dict(zip([d[0] for d in cur.description], row))
+
+    def record(self, result, fingerprint: str) -> None:
+        """تسجيل نتيجة نهائية (success | rejected) — الأخطاء لا تُسجَّل"""
+        if not result.content_hash or result.status not in FINAL_STATUSES:
+            return
+        row = (
+            result.content_hash,
+            fingerprint,
+            result.source_path,
+            result.source_bytes,
+            result.status,
+            result.stage_reached,
+            result.run_id,
+            result.manifest_uri,
+            result.chunking.total_chunks if result.chunking else 0,
+            datetime.now(timezone.utc).isoformat(),
+        )
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO content_ledger
+                    (content_hash, config_fingerprint, source_path, source_bytes,
+                     status, stage_reached, run_id, manifest_uri, chunks, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                row,
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -12,16 +12,41 @@ Usage:
   storage = GCSStorage(bucket_name="iqraa-pipeline")
   local_path = storage.download_to_temp("raw/openiti/file.txt")
   storage.upload_text(text, "cleaned/openiti/run_id/file.txt")
+
+  # القطع: شظايا JSONL/Parquet محدودة الحجم + فهرس إزاحات
+  index = storage.upload_chunk_shards(records, "chunked/run_id")
+  chunk = storage.read_chunk("chunked/run_id", "run_id_0042")
 """
+import base64
+import hashlib
+import io
 import json
 import logging
 import tempfile
 from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import List, Optional
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
 
 logger = logging.getLogger("pipeline.storage")
 
+DEFAULT_SHARD_BYTES = 32 * 1024 * 1024
+SHARD_FORMATS = {"jsonl", "parquet"}
+SHARD_INDEX_NAME = "index.json"
+
+
+@dataclass
+class ShardIndex:
+    """فهرس الشظايا — chunk_id → (رقم الشظية، الإزاحة، الطول بالبايت | رقم الصف)"""
+    format: str
+    shards: List[str] = field(default_factory=list)
+    shard_uris: List[str] = field(default_factory=list)
+    chunks: Dict[str, List[int]] = field(default_factory=dict)
+    index_uri: str = ""
+
+    def to_dict(self) -> Dict:
+        return {"format": self.format, "shards": self.shards, "chunks": self.chunks}
+
 
 class StorageBackend(ABC):
     """واجهة موحدة للتخزين"""
@@ -46,10 +71,164 @@ class StorageBackend(ABC):
         """رفع JSON إلى المخزن — يُرجع URI"""
         ...
 
+    @abstractmethod
+    def upload_bytes(self, data: bytes, dest_path: str, content_type: str) -> str:
+        """رفع بايتات خام — يُرجع URI"""
+        ...
+
+    @abstractmethod
+    def read_range(self, path: str, start: int, length: int) -> bytes:
+        """قراءة مقطع بايتات [start, start+length) دون تنزيل الملف كاملاً"""
+        ...
+
     @abstractmethod
     def file_exists(self, path: str) -> bool:
         ...
 
+    @abstractmethod
+    def content_md5(self, path: str) -> Optional[str]:
+        """MD5 (hex) لبايتات الملف دون تنزيله إن أمكن — None إن لم يتوفر"""
+        ...
+
+    @abstractmethod
+    def delete_file(self, path: str) -> bool:
+        """حذف ملف — False إن لم يكن موجوداً"""
+        ...
+
+    @abstractmethod
+    def to_config(self) -> Tuple[str, dict]:
+        """(mode, kwargs) لإعادة إنشاء المخزن عبر create_storage — في عمليات العمّال"""
+        ...
+
+    # ── شظايا القطع ──
+
+    def upload_chunk_shards(
+        self,
+        records: Iterable[Dict],
+        prefix: str,
+        max_shard_bytes: int = DEFAULT_SHARD_BYTES,
+        fmt: str = "jsonl",
+    ) -> ShardIndex:
+        """
+        رفع القطع كشظايا محدودة الحجم بدل كائن لكل قطعة.
+
+        Args:
+            records: قواميس تحوي "chunk_id" على الأقل (والنص وبياناته)
+            prefix: مجلد الوجهة (مثال: "chunked/run_id")
+            max_shard_bytes: الحد التقريبي لحجم الشظية
+            fmt: "jsonl" (إزاحات بايت) أو "parquet" (أرقام صفوف، يتطلب pyarrow)
+
+        Returns:
+            ShardIndex — يُرفع أيضاً كـ {prefix}/index.json
+
+        إذا فشل رفع أي شظية (أو الفهرس) تُحذف الشظايا المرفوعة ثم يُعاد رفع الخطأ
+        — لا شظايا يتيمة بلا فهرس.
+        """
+        if fmt not in SHARD_FORMATS:
+            raise ValueError("صيغة شظايا غير معروفة: {}".format(fmt))
+        index = ShardIndex(format=fmt)
+        prefix = prefix.rstrip("/")
+
+        pending: List[Tuple[Dict, bytes]] = []
+        pending_bytes = 0
+
+        def flush():
+            nonlocal pending, pending_bytes
+            if not pending:
+                return
+            shard_no = len(index.shards)
+            shard_path = "{}/shard-{:05d}.{}".format(prefix, shard_no, fmt)
+            if fmt == "jsonl":
+                offset = 0
+                for rec, line in pending:
+                    index.chunks[rec["chunk_id"]] = [shard_no, offset, len(line)]
+                    offset += len(line)
+                data = b"".join(line for _, line in pending)
+                uri = self.upload_bytes(
+                    data, shard_path, "application/x-ndjson; charset=utf-8"
+                )
+            else:
+                for row, (rec, _) in enumerate(pending):
+                    index.chunks[rec["chunk_id"]] = [shard_no, row, 0]
+                uri = self.upload_bytes(
+                    _records_to_parquet([rec for rec, _ in pending]),
+                    shard_path, "application/vnd.apache.parquet",
+                )
+            index.shards.append(shard_path)
+            index.shard_uris.append(uri)
+            pending, pending_bytes = [], 0
+
+        try:
+            for rec in records:
+                line = (json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8")
+                if pending and pending_bytes + len(line) > max_shard_bytes:
+                    flush()
+                pending.append((rec, line))
+                pending_bytes += len(line)
+            flush()
+
+            index.index_uri = self.upload_json(
+                index.to_dict(), "{}/{}".format(prefix, SHARD_INDEX_NAME)
+            )
+        except Exception:
+            self._delete_shards(index.shards)
+            raise
+        logger.info(
+            "[SHARDS] %d قطعة في %d شظية ← %s",
+            len(index.chunks), len(index.shards), prefix,
+        )
+        return index
+
+    def _delete_shards(self, shard_paths: List[str]) -> None:
+        """تنظيف شظايا رفع فاشل — أفضل جهد"""
+        for path in shard_paths:
+            try:
+                self.delete_file(path)
+            except Exception as e:
+                logger.warning("تعذّر حذف الشظية اليتيمة %s: %s", path, e)
+        if shard_paths:
+            logger.info("[SHARDS] حذف %d شظية من رفع فاشل", len(shard_paths))
+
+    def load_shard_index(self, prefix: str) -> ShardIndex:
+        """تحميل {prefix}/index.json"""
+        path = "{}/{}".format(prefix.rstrip("/"), SHARD_INDEX_NAME)
+        data = json.loads(self.download_to_temp(path).read_text(encoding="utf-8"))
+        return ShardIndex(
+            format=data["format"], shards=data["shards"], chunks=data["chunks"]
+        )
+
+    def read_chunk(
+        self,
+        prefix: str,
+        chunk_id: str,
+        index: Optional[ShardIndex] = None,
+    ) -> Dict:
+        """
+        جلب قطعة واحدة بمعرّفها.
+
+        JSONL: قراءة مقطع بايتات واحد من الشظية (range read).
+        Parquet: قراءة الشظية ثم الصف المطلوب.
+        """
+        index = index or self.load_shard_index(prefix)
+        if chunk_id not in index.chunks:
+            raise KeyError("قطعة غير موجودة: {}".format(chunk_id))
+        shard_no, offset, length = index.chunks[chunk_id]
+        shard_path = index.shards[shard_no]
+        if index.format == "jsonl":
+            return json.loads(self.read_range(shard_path, offset, length))
+        import pyarrow.parquet as pq
+        table = pq.read_table(str(self.download_to_temp(shard_path)))
+        return table.slice(offset, 1).to_pylist()[0]
+
+
+def _records_to_parquet(records: List[Dict]) -> bytes:
+    """تحويل سجلات إلى Parquet في الذاكرة — pyarrow اختياري"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    buf = io.BytesIO()
+    pq.write_table(pa.Table.from_pylist(records), buf, compression="zstd")
+    return buf.getvalue()
+
 
 class LocalStorage(StorageBackend):
     """تخزين محلي للتطوير والاختبار"""
@@ -87,9 +266,37 @@ class LocalStorage(StorageBackend):
         text = json.dumps(data, ensure_ascii=False, indent=2)
         return self.upload_text(text, dest_path)
 
+    def upload_bytes(self, data: bytes, dest_path: str, content_type: str) -> str:
+        full = self.base / dest_path
+        full.parent.mkdir(parents=True, exist_ok=True)
+        full.write_bytes(data)
+        logger.info("[LOCAL] كتابة: %s", full)
+        return str(full)
+
+    def read_range(self, path: str, start: int, length: int) -> bytes:
+        with open(self.base / path, "rb") as fh:
+            fh.seek(start)
+            return fh.read(length)
+
     def file_exists(self, path: str) -> bool:
         return (self.base / path).exists()
 
+    def content_md5(self, path: str) -> Optional[str]:
+        full = self.base / path
+        if not full.is_file():
+            return None
+        return file_md5(full)
+
+    def delete_file(self, path: str) -> bool:
+        full = self.base / path
+        if not full.is_file():
+            return False
+        full.unlink()
+        return True
+
+    def to_config(self) -> Tuple[str, dict]:
+        return "local", {"base_dir": str(self.base)}
+
 
 class GCSStorage(StorageBackend):
     """تخزين Google Cloud Storage للإنتاج"""
@@ -148,9 +355,49 @@ class GCSStorage(StorageBackend):
         logger.info("[GCS] رفع JSON: %s", uri)
         return uri
 
+    def upload_bytes(self, data: bytes, dest_path: str, content_type: str) -> str:
+        blob = self._bucket.blob(dest_path)
+        blob.upload_from_string(data, content_type=content_type)
+        uri = "gs://{}/{}".format(self._bucket_name, dest_path)
+        logger.info("[GCS] رفع: %s", uri)
+        return uri
+
+    def read_range(self, path: str, start: int, length: int) -> bytes:
+        # end شامل في GCS
+        return self._bucket.blob(path).download_as_bytes(
+            start=start, end=start + length - 1
+        )
+
     def file_exists(self, path: str) -> bool:
         return self._bucket.blob(path).exists()
 
+    def content_md5(self, path: str) -> Optional[str]:
+        # GCS يحفظ md5 لكل blob عادي (ليس للـ composite) — بلا تنزيل
+        blob = self._bucket.get_blob(path)
+        if blob is None or not blob.md5_hash:
+            return None
+        return base64.b64decode(blob.md5_hash).hex()
+
+    def delete_file(self, path: str) -> bool:
+        from google.api_core.exceptions import NotFound
+        try:
+            self._bucket.blob(path).delete()
+        except NotFound:
+            return False
+        return True
+
+    def to_config(self) -> Tuple[str, dict]:
+        return "gcs", {"bucket_name": self._bucket_name, "project": self._project}
+
+
+def file_md5(path: Path, block_size: int = 1 << 20) -> str:
+    """MD5 (hex) لملف محلي — قراءة بكتل لتفادي تحميل الملف كاملاً"""
+    digest = hashlib.md5()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
 
 def create_storage(mode: str = "gcs", **kwargs) -> StorageBackend:
     """
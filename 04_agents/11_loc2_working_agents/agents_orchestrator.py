@@ -89,6 +89,20 @@ class AgentsOrchestrator:
     
     async def process_query(self, query: str, context: Dict[str, Any] = None) -> Dict[str, Any]:
         
+        if not self.cache:
+            return await self._process_query(query, context)
+        
+        # 0. Cache + single-flight: الاستعلامات المتطابقة المتزامنة تنتظر نفس المعالجة
+        #    (BigQuery + Claude مرة واحدة) — cache.metrics()["coalesced"]
+        #    نتائج الأخطاء لا تُحفظ
+        return await self.cache.get_or_compute(
+            query,
+            lambda: self._process_query(query, context),
+            cache_if=lambda r: "error" not in r["metadata"],
+        )
+    
+    async def _process_query(self, query: str, context: Dict[str, Any] = None) -> Dict[str, Any]:
+        
         start_time = time.time()
         
         results = {
@@ -106,13 +120,6 @@ class AgentsOrchestrator:
         }
         
         try:
-            # 0. تحقق من Cache
-            if self.cache:
-                cached = self.cache.get(query)
-                if cached:
-                    print("⚡ Cache Hit!")
-                    return cached
-            
             # 1. استخراج كلمات
             keywords = self.extract_keywords(query)
             print(f"🔍 الكلمات: {keywords}")
@@ -291,15 +298,12 @@ class AgentsOrchestrator:
             
             print(f"⏱️ الأداء: {total_time:.0f}ms (GPS: {gps_time:.0f}ms, Verify: {verify_time:.0f}ms, Search: {search_time:.0f}ms, Claude: {claude_time:.0f}ms)")
             
-            # 9. حفظ في Cache
-            if self.cache:
-                self.cache.set(query, results)
-            
         except Exception as e:
             print(f"❌ {e}")
             import traceback
             traceback.print_exc()
             results["answer"] = f"خطأ: {e}"
+            results["metadata"]["error"] = str(e)
         
         return results
 
@@ -0,0 +1,330 @@
+"""
+ANN Index - بحث دلالي محلي (IVF في numpy)
+بديل لرحلة VECTOR_SEARCH إلى BigQuery: top-k في ملّي ثوانٍ بلا bytes billed
+
+• البناء: من ملف embeddings مُصدَّر (JSONL من BigQuery، أو .npy + ids، أو Parquet)
+  → k-means كروي → المتجهات مرتبة حسب القائمة في ملف .npy واحد
+• التحميل: np.load(mmap_mode="r") — لا يُقرأ إلا ما تلمسه القوائم المفحوصة
+• الاستدعاء (recall) قابل للضبط: nprobe = عدد القوائم المفحوصة لكل استعلام
+• المسافة: cosine — score = 1 - distance (مثل VECTOR_SEARCH بـ distance_type => 'COSINE')
+
+الاستخدام:
+    python ann_index.py build embeddings.jsonl ./ann_index --lists 4096
+    python ann_index.py bench ./ann_index --queries 200 --nprobe 1 4 16 64
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import argparse
+import json
+import logging
+import math
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+DEFAULT_NPROBE = 16
+BUILD_BATCH = 65536
+
+
+class IVFIndex:
+    """
+    فهرس IVF (Inverted File) محفوظ في مجلد:
+        meta.json, centroids.npy, vectors.npy, offsets.npy, ids.npy
+    القائمة i = vectors[offsets[i]:offsets[i + 1]]
+    """
+
+    def __init__(self, path: str, nprobe: int = DEFAULT_NPROBE, mmap: bool = True):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"إصدار فهرس غير مدعوم: {self.meta.get('version')}")
+        mode = "r" if mmap else None
+        self.path = path
+        self.nprobe = nprobe
+        self.centroids = np.load(os.path.join(path, "centroids.npy"))
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode=mode)
+        self.offsets = np.load(os.path.join(path, "offsets.npy"))
+        self.ids = np.load(os.path.join(path, "ids.npy"), mmap_mode=mode)
+        logger.info(
+            "ANN Index: %d متجه × %d بُعد، %d قائمة (%s)",
+            len(self), self.dim, self.n_lists, path,
+        )
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+    @property
+    def dim(self) -> int:
+        return int(self.centroids.shape[1])
+
+    @property
+    def n_lists(self) -> int:
+        return int(self.centroids.shape[0])
+
+    # ── البحث ──
+
+    def search(self, query: Sequence[float], k: int = 10, nprobe: Optional[int] = None) -> List[Tuple[str, float]]:
+        """أقرب k: [(chunk_id, score)] مرتبة تنازلياً — score = تشابه cosine"""
+        q = _normalize(np.asarray(query, dtype=np.float32).reshape(1, -1))[0]
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+        centroid_scores = self.centroids @ q
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+
+        cand_rows, cand_scores = [], []
+        for lst in probe:
+            start, end = int(self.offsets[lst]), int(self.offsets[lst + 1])
+            if start == end:
+                continue
+            cand_scores.append(self.vectors[start:end] @ q)
+            cand_rows.append(np.arange(start, end))
+        if not cand_rows:
+            return []
+        return self._top_k(np.concatenate(cand_rows), np.concatenate(cand_scores), k)
+
+    def exact_search(self, query: Sequence[float], k: int = 10, batch: int = BUILD_BATCH) -> List[Tuple[str, float]]:
+        """بحث شامل (للمقارنة وقياس recall)"""
+        q = _normalize(np.asarray(query, dtype=np.float32).reshape(1, -1))[0]
+        best_rows, best_scores = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        for start in range(0, len(self), batch):
+            scores = self.vectors[start:start + batch] @ q
+            rows = np.arange(start, start + len(scores))
+            if len(scores) > k:
+                top = np.argpartition(-scores, k - 1)[:k]
+                rows, scores = rows[top], scores[top]
+            best_rows = np.concatenate([best_rows, rows])
+            best_scores = np.concatenate([best_scores, scores])
+        return self._top_k(best_rows, best_scores, k)
+
+    def _top_k(self, rows: np.ndarray, scores: np.ndarray, k: int) -> List[Tuple[str, float]]:
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return [(str(self.ids[rows[i]]), float(scores[i])) for i in order]
+
+    # ── البناء ──
+
+    @classmethod
+    def build(
+        cls,
+        vectors: np.ndarray,
+        ids: Sequence[str],
+        out_dir: str,
+        n_lists: Optional[int] = None,
+        sample_size: int = 256 * 1024,
+        iterations: int = 20,
+        seed: int = 12,
+    ) -> "IVFIndex":
+        """
+        بناء الفهرس وحفظه. vectors يمكن أن يكون np.memmap (لا يُحمَّل كاملاً).
+
+        n_lists: الافتراضي ≈ 4·√N
+        """
+        n, dim = vectors.shape
+        if n != len(ids):
+            raise ValueError(f"عدد المتجهات ({n}) ≠ عدد المعرفات ({len(ids)})")
+        if n == 0:
+            raise ValueError("لا توجد متجهات")
+        n_lists = max(1, min(n_lists or int(4 * math.sqrt(n)), n))
+        # البناء في مجلد مؤقت بجانب الهدف ثم تبديل المجلد: عملية تقرأ الفهرس القديم
+        # (mmap) لا ترى ملفاً نصف مكتوب — تبقى على الملفات القديمة حتى تعيد التحميل
+        final_dir = os.path.abspath(out_dir)
+        out_dir = f"{final_dir}.building-{uuid.uuid4().hex[:8]}"
+        os.makedirs(out_dir)
+        t0 = time.time()
+        try:
+            rng = np.random.default_rng(seed)
+            sample_rows = np.sort(rng.choice(n, size=min(n, max(sample_size, n_lists)), replace=False))
+            sample = _normalize(np.asarray(vectors[sample_rows], dtype=np.float32))
+            centroids = _spherical_kmeans(sample, n_lists, iterations, rng)
+
+            # تعيين كل متجه لأقرب مركز — على دفعات
+            assign = np.empty(n, dtype=np.int32)
+            for start in range(0, n, BUILD_BATCH):
+                block = _normalize(np.asarray(vectors[start:start + BUILD_BATCH], dtype=np.float32))
+                assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+
+            order = np.argsort(assign, kind="stable")
+            counts = np.bincount(assign, minlength=n_lists)
+            offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+            out = np.lib.format.open_memmap(
+                os.path.join(out_dir, "vectors.npy"), mode="w+", dtype=np.float32, shape=(n, dim)
+            )
+            for start in range(0, n, BUILD_BATCH):
+                rows = order[start:start + BUILD_BATCH]
+                out[start:start + len(rows)] = _normalize(np.asarray(vectors[rows], dtype=np.float32))
+            out.flush()
+            del out
+
+            np.save(os.path.join(out_dir, "centroids.npy"), centroids)
+            np.save(os.path.join(out_dir, "offsets.npy"), offsets)
+            np.save(os.path.join(out_dir, "ids.npy"), np.asarray(ids, dtype=str)[order])
+            with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({
+                    "version": INDEX_VERSION,
+                    "count": int(n),
+                    "dim": int(dim),
+                    "n_lists": int(n_lists),
+                    "metric": "cosine",
+                    "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                }, f, indent=2)
+
+            _swap_dir(out_dir, final_dir)
+        except BaseException:
+            shutil.rmtree(out_dir, ignore_errors=True)
+            raise
+
+        logger.info("ANN Index: بُني %d متجه في %.1f ث → %s", n, time.time() - t0, final_dir)
+        return cls(final_dir)
+
+
+def _swap_dir(built: str, final: str) -> None:
+    """استبدال final بـ built — rename ذري لكل خطوة؛ القديم يُحذف بعد التبديل"""
+    old = None
+    if os.path.exists(final):
+        old = f"{final}.old-{uuid.uuid4().hex[:8]}"
+        os.replace(final, old)
+    os.replace(built, final)
+    if old is not None:
+        # الملفات المحذوفة تبقى صالحة لمن يحملها mmap حتى يغلقها
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+def _spherical_kmeans(x: np.ndarray, k: int, iterations: int, rng) -> np.ndarray:
+    """k-means على متجهات مُطبَّعة (تشابه cosine) — المراكز مُطبَّعة"""
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.empty(len(x), dtype=np.int64)
+        for start in range(0, len(x), BUILD_BATCH):
+            assign[start:start + BUILD_BATCH] = np.argmax(x[start:start + BUILD_BATCH] @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        empty = np.bincount(assign, minlength=k) == 0
+        if empty.any():
+            # القوائم الفارغة تأخذ نقاطاً عشوائية
+            sums[empty] = x[rng.choice(len(x), size=int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+    return centroids.astype(np.float32)
+
+
+# ─────────────────────────────────────────────
+# ملفات embeddings المُصدَّرة
+# ─────────────────────────────────────────────
+
+def load_embeddings(fp: str, id_field: str = "chunk_id", vector_field: str = "embedding") -> Tuple[List[str], np.ndarray]:
+    """
+    (ids, vectors) من ملف مُصدَّر:
+      • .jsonl / .json — سطر لكل صف (تصدير BigQuery NEWLINE_DELIMITED_JSON)
+      • .npy — المتجهات (mmap) + ملف المعرفات بجانبه: <الاسم>.ids.txt (سطر لكل معرف)
+      • .parquet — يحتاج pyarrow
+    """
+    if fp.endswith(".npy"):
+        ids_fp = fp[:-len(".npy")] + ".ids.txt"
+        with open(ids_fp, encoding="utf-8") as f:
+            ids = [line.rstrip("\n") for line in f]
+        return ids, np.load(fp, mmap_mode="r")
+    if fp.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("pyarrow مطلوب لقراءة Parquet: pip install pyarrow")
+        table = pq.read_table(fp, columns=[id_field, vector_field])
+        ids = [str(v) for v in table.column(id_field).to_pylist()]
+        return ids, np.asarray(table.column(vector_field).to_pylist(), dtype=np.float32)
+    ids, rows = [], []
+    with open(fp, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                ids.append(str(record[id_field]))
+                rows.append(record[vector_field])
+    return ids, np.asarray(rows, dtype=np.float32)
+
+
+# ─────────────────────────────────────────────
+# Benchmark: recall مقابل الزمن
+# ─────────────────────────────────────────────
+
+def benchmark(
+    index: IVFIndex,
+    queries: np.ndarray,
+    k: int = 10,
+    nprobes: Iterable[int] = (1, 4, 16, 64),
+) -> List[Dict[str, Any]]:
+    """recall@k (مقابل البحث الشامل) وزمن الاستعلام لكل nprobe"""
+    truth = [{cid for cid, _ in index.exact_search(q, k)} for q in queries]
+    report = []
+    for nprobe in nprobes:
+        latencies, found = [], 0
+        for q, expected in zip(queries, truth):
+            t0 = time.perf_counter()
+            result = index.search(q, k, nprobe=nprobe)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            found += len(expected & {cid for cid, _ in result})
+        latencies.sort()
+        report.append({
+            "nprobe": min(nprobe, index.n_lists),
+            "recall": round(found / max(1, sum(len(t) for t in truth)), 4),
+            "p50_ms": round(latencies[len(latencies) // 2], 3),
+            "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 3),
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="بناء فهرس ANN محلي وقياس recall/الزمن")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="بناء الفهرس من ملف embeddings مُصدَّر")
+    build.add_argument("embeddings")
+    build.add_argument("out_dir")
+    build.add_argument("--lists", type=int, default=None, help="عدد القوائم (الافتراضي ≈ 4·√N)")
+    build.add_argument("--sample", type=int, default=256 * 1024, help="عينة تدريب k-means")
+    build.add_argument("--iterations", type=int, default=20)
+
+    bench = sub.add_parser("bench", help="recall@k مقابل الزمن لعدة قيم nprobe")
+    bench.add_argument("index_dir")
+    bench.add_argument("--queries", type=int, default=200, help="استعلامات من متجهات الفهرس نفسه (مع تشويش)")
+    bench.add_argument("-k", type=int, default=10)
+    bench.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    bench.add_argument("--noise", type=float, default=0.05)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.command == "build":
+        ids, vectors = load_embeddings(args.embeddings)
+        IVFIndex.build(vectors, ids, args.out_dir, n_lists=args.lists,
+                       sample_size=args.sample, iterations=args.iterations)
+        return
+
+    index = IVFIndex(args.index_dir)
+    rng = np.random.default_rng(0)
+    rows = rng.choice(len(index), size=min(args.queries, len(index)), replace=False)
+    queries = np.asarray(index.vectors[np.sort(rows)], dtype=np.float32)
+    queries += rng.normal(scale=args.noise / math.sqrt(index.dim), size=queries.shape).astype(np.float32)
+
+    t0 = time.perf_counter()
+    index.exact_search(queries[0], args.k)
+    exact_ms = (time.perf_counter() - t0) * 1000
+    print(f"{len(index):,} متجه × {index.dim} — {index.n_lists} قائمة — بحث شامل: {exact_ms:.1f}ms")
+    print(f"{'nprobe':>7} {'recall@' + str(args.k):>10} {'p50 ms':>9} {'p99 ms':>9}")
+    for row in benchmark(index, queries, args.k, args.nprobe):
+        print(f"{row['nprobe']:>7} {row['recall']:>10.4f} {row['p50_ms']:>9.3f} {row['p99_ms']:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
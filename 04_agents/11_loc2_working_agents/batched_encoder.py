@@ -0,0 +1,188 @@
+"""
+Batched Encoder - استدلال CAMeLBERT على دفعات (CPU)
+بديل لتمرير نص واحد في كل مرة:
+
+• تقطيع (tokenize) الدفعة كلها مرة واحدة، بلا حشو
+• تجميع حسب الطول (length bucketing): النصوص المتقاربة طولاً في دفعة واحدة
+• حشو ديناميكي: كل دفعة تُحشى لأطول نص فيها فقط، لا لـ max_length
+• torch.inference_mode، وعدد خيوط قابل للضبط
+• تكميم ديناميكي int8 اختياري (طبقات Linear)
+• texts/second لكل حجم دفعة — throughput()
+
+الاستخدام:
+    encoder = BatchedEncoder.from_pretrained(threads=8, quantize=True)
+    vectors = encoder.encode(texts)      # متجه (mean pooling) لكل نص، أو None عند الخطأ
+
+    python batched_encoder.py --texts 2000 --batch-sizes 1 8 32 64 --quantize
+"""
+
+from typing import Dict, List, Optional, Sequence
+import argparse
+import logging
+import os
+import random
+import time
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "CAMeL-Lab/bert-base-arabic-camelbert-ca"
+
+
+class BatchedEncoder:
+    """
+    Args:
+        batch_size: أقصى عدد نصوص في الدفعة
+        max_tokens: أقصى (عدد النصوص × الطول بعد الحشو) في الدفعة — يحدّ ذاكرة الدفعات الطويلة
+        threads: torch.set_num_threads (None = افتراضي torch)
+        quantize: تكميم ديناميكي int8 لطبقات Linear
+    """
+
+    def __init__(
+        self,
+        model,
+        tokenizer,
+        batch_size: int = 32,
+        max_length: int = 512,
+        max_tokens: int = 16384,
+        threads: Optional[int] = None,
+        quantize: bool = False,
+    ):
+        if threads:
+            torch.set_num_threads(threads)
+        model.eval()
+        if quantize:
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model
+        self.tokenizer = tokenizer
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.max_tokens = max_tokens
+        self.quantized = quantize
+        self._stats: Dict[int, List[float]] = {}       # حجم الدفعة → [نصوص، ثوانٍ]
+        logger.info(
+            "Batched Encoder: batch=%d، خيوط=%d، int8=%s",
+            batch_size, torch.get_num_threads(), quantize,
+        )
+
+    @classmethod
+    def from_pretrained(cls, model_name: str = MODEL_NAME, **kwargs) -> "BatchedEncoder":
+        from transformers import AutoModel, AutoTokenizer
+        return cls(AutoModel.from_pretrained(model_name), AutoTokenizer.from_pretrained(model_name), **kwargs)
+
+    def encode(self, texts: Sequence[Optional[str]]) -> List[Optional[List[float]]]:
+        """
+        متجه لكل نص بنفس الترتيب (mean pooling لآخر طبقة).
+        النص غير النصي (None) → None. إذا فشل تقطيع الدفعة أو تمريرها يُعاد
+        العمل نصاً نصاً؛ النص الفاشل → None ولا يُسقط بقية الدفعة.
+        """
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        valid = [i for i, text in enumerate(texts) if isinstance(text, str)]
+        for i in range(len(texts)):
+            if not isinstance(texts[i], str):
+                logger.error("❌ نص %d: ليس نصاً (%s)", i, type(texts[i]).__name__)
+        if not valid:
+            return results
+        input_ids = self._tokenize([texts[i] for i in valid])
+        tokenized = [(i, ids) for i, ids in zip(valid, input_ids) if ids is not None]
+        for batch in self._buckets([len(ids) for _, ids in tokenized]):
+            batch = [tokenized[b] for b in batch]
+            try:
+                vectors = self._forward([ids for _, ids in batch])
+            except Exception as e:
+                logger.warning("دفعة فاشلة (%d نص): %s — إعادة فردية", len(batch), e)
+                for i, ids in batch:
+                    try:
+                        results[i] = self._forward([ids])[0]
+                    except Exception as e:
+                        logger.error("❌ نص %d: %s", i, e)
+                continue
+            for (i, _), vector in zip(batch, vectors):
+                results[i] = vector
+        return results
+
+    def _tokenize(self, texts: List[str]) -> List[Optional[List[int]]]:
+        """input_ids لكل نص (بلا حشو) — عند فشل الدفعة يُقطَّع كل نص وحده؛ الفاشل → None"""
+        try:
+            return self.tokenizer(texts, truncation=True, max_length=self.max_length)["input_ids"]
+        except Exception as e:
+            logger.warning("تقطيع الدفعة فشل (%d نص): %s — إعادة فردية", len(texts), e)
+        input_ids: List[Optional[List[int]]] = []
+        for text in texts:
+            try:
+                input_ids.append(self.tokenizer(text, truncation=True, max_length=self.max_length)["input_ids"])
+            except Exception as e:
+                logger.error("❌ تقطيع: %s", e)
+                input_ids.append(None)
+        return input_ids
+
+    def _buckets(self, lengths: List[int]) -> List[List[int]]:
+        """مؤشرات مرتبة حسب الطول، مقسّمة بحد batch_size و max_tokens"""
+        order = sorted(range(len(lengths)), key=lengths.__getitem__)
+        batches, current = [], []
+        for i in order:
+            # مرتبة تصاعدياً: الطول بعد الحشو = طول النص الحالي
+            if current and (len(current) >= self.batch_size or (len(current) + 1) * lengths[i] > self.max_tokens):
+                batches.append(current)
+                current = []
+            current.append(i)
+        if current:
+            batches.append(current)
+        return batches
+
+    def _forward(self, input_ids: List[List[int]]) -> List[List[float]]:
+        batch = self.tokenizer.pad({"input_ids": input_ids}, padding="longest", return_tensors="pt")
+        start = time.perf_counter()
+        with torch.inference_mode():
+            hidden = self.model(input_ids=batch["input_ids"], attention_mask=batch["attention_mask"]).last_hidden_state
+            mask = batch["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+            pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+        stats = self._stats.setdefault(len(input_ids), [0, 0.0])
+        stats[0] += len(input_ids)
+        stats[1] += time.perf_counter() - start
+        return pooled.tolist()
+
+    def throughput(self) -> Dict[int, float]:
+        """texts/second لكل حجم دفعة فعلي"""
+        return {
+            size: round(count / seconds, 2)
+            for size, (count, seconds) in sorted(self._stats.items())
+            if seconds > 0
+        }
+
+    def reset_stats(self):
+        self._stats.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="texts/second لكل حجم دفعة — CAMeLBERT على CPU")
+    parser.add_argument("--file", help="ملف نصوص (سطر لكل نص) بدل النصوص المُولَّدة")
+    parser.add_argument("--texts", type=int, default=1000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 16, 32, 64])
+    parser.add_argument("--threads", type=int, default=os.cpu_count())
+    parser.add_argument("--quantize", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            texts = [line.strip()[:512] for line in f if line.strip()][:args.texts]
+    else:
+        rng = random.Random(21)
+        words = ["قال", "الإمام", "الغزالي", "في", "كتاب", "السوق", "المدينة", "التاجر", "القاضي", "الحرب"]
+        texts = [" ".join(rng.choices(words, k=rng.randint(5, 120))) for _ in range(args.texts)]
+
+    encoder = BatchedEncoder.from_pretrained(threads=args.threads, quantize=args.quantize)
+    print(f"{'batch':>6} {'texts/s':>10} {'ثوانٍ':>8}")
+    for batch_size in args.batch_sizes:
+        encoder.batch_size = batch_size
+        encoder.reset_stats()
+        start = time.perf_counter()
+        encoder.encode(texts)
+        seconds = time.perf_counter() - start
+        print(f"{batch_size:>6} {len(texts) / seconds:>10.1f} {seconds:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Budget Tracker - متتبع ميزانية الاستدعاءات المدفوعة (WAL + لقطة JSON)
+يُستخدم في PremiumProcessor (premium_processor_fixed.py)
+"""
+
+import atexit
+import json
+import os
+import threading
+from pathlib import Path
+
+
+class BudgetTracker:
+    """
+    متتبع الميزانية — سجل كتابة مسبقة (WAL) بدل إعادة كتابة JSON مع كل تكلفة
+
+    • كل حدث (تكلفة / معالج / فاشل) يُضاف للذاكرة فوراً، ويُلحق بـ <budget_file>.wal
+      كل flush_interval ثانية (write + fsync) — kill -9 يفقد آخر فترة فقط
+    • الضغط (compaction): لقطة JSON ذرية في budget_file (نفس الصيغة) ثم تفريغ WAL —
+      كل compact_every حدث وعند close()
+    • التحميل: اللقطة + إعادة تطبيق أحداث WAL الأحدث منها (wal_seq)، ثم ضغط فوري
+      (لا يبقى سطر مبتور من انقطاع سابق قبل الأحداث الجديدة)
+    • آمن للمهام المتزامنة (asyncio) وللخيط الخلفي (قفل)
+    """
+    
+    def __init__(self, budget_file: str, limit: float = 10000, flush_interval: float = 1.0, compact_every: int = 10000):
+        self.budget_file = Path(budget_file)
+        self.wal_file = self.budget_file.with_name(self.budget_file.name + ".wal")
+        self.limit = limit
+        self.flush_interval = flush_interval
+        self.compact_every = compact_every
+        self._lock = threading.RLock()
+        self._pending = []          # أحداث لم تُكتب في WAL بعد
+        self._since_compact = 0
+        self.load()
+        
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="budget-wal-flush", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+    
+    def load(self):
+        with self._lock:
+            if self.budget_file.exists():
+                with open(self.budget_file) as f:
+                    self.data = json.load(f)
+            else:
+                self.data = {
+                    "budget_limit": self.limit,
+                    "budget_used": 0,
+                    "budget_remaining": self.limit,
+                    "costs": {},
+                    "texts_processed": 0,
+                    "texts_failed": 0
+                }
+            self.data.setdefault("wal_seq", 0)
+            self._seq = self.data["wal_seq"]
+            
+            # إعادة تطبيق WAL — السطر الأخير قد يكون مبتوراً (انقطاع أثناء الكتابة)
+            replayed = 0
+            if self.wal_file.exists():
+                with open(self.wal_file) as f:
+                    for line in f:
+                        try:
+                            event = json.loads(line)
+                        except ValueError:
+                            break
+                        if event["seq"] > self.data["wal_seq"]:
+                            self._apply(event)
+                            self._seq = event["seq"]
+                            replayed += 1
+            self._since_compact = replayed
+            
+            # ضغط بعد الاسترجاع: سطر مبتور في الذيل يسبق كل إلحاق جديد فيُسقطه عند
+            # الاسترجاع التالي — اللقطة + تفريغ WAL قبل أي حدث جديد
+            if self.wal_file.exists() and self.wal_file.stat().st_size:
+                self.save()
+    
+    def _apply(self, event: dict):
+        kind = event["kind"]
+        if kind == "cost":
+            self.data["costs"][event["category"]] = self.data["costs"].get(event["category"], 0) + event["amount"]
+            self.data["budget_used"] += event["amount"]
+            self.data["budget_remaining"] = self.limit - self.data["budget_used"]
+        elif kind == "processed":
+            self.data["texts_processed"] += event["count"]
+        elif kind == "failed":
+            self.data["texts_failed"] += event["count"]
+    
+    def _record(self, event: dict):
+        with self._lock:
+            self._seq += 1
+            event["seq"] = self._seq
+            self._apply(event)
+            self._pending.append(event)
+            self._since_compact += 1
+            if self._since_compact >= self.compact_every:
+                self.save()
+    
+    def flush(self):
+        """إلحاق الأحداث المعلّقة بـ WAL (fsync)"""
+        with self._lock:
+            if not self._pending:
+                return
+            with open(self.wal_file, "a") as f:
+                f.write("".join(json.dumps(e, ensure_ascii=False) + "\n" for e in self._pending))
+                f.flush()
+                os.fsync(f.fileno())
+            self._pending = []
+    
+    def save(self):
+        """ضغط: لقطة ذرية للحالة ثم تفريغ WAL"""
+        with self._lock:
+            self.data["wal_seq"] = self._seq
+            tmp = self.budget_file.with_name(self.budget_file.name + ".tmp")
+            with open(tmp, "w") as f:
+                json.dump(self.data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.budget_file)
+            # اللقطة تحتوي كل ما سبق wal_seq — الانقطاع هنا آمن (الأحداث القديمة تُتخطى عند التحميل)
+            with open(self.wal_file, "w"):
+                pass
+            self._pending = []
+            self._since_compact = 0
+    
+    def close(self):
+        self._stop.set()
+        self.save()
+    
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:  # الكتابة الدورية لا تُسقط المعالجة
+                print(f"⚠️ Budget WAL: {e}")
+    
+    def add_cost(self, category: str, amount: float):
+        self._record({"kind": "cost", "category": category, "amount": amount})
+        
+        if self.data["budget_used"] >= self.limit:
+            self.flush()
+            raise Exception(f"🚨 تجاوز الميزانية! ${self.data['budget_used']:.2f}")
+    
+    def increment_processed(self, count: int = 1):
+        self._record({"kind": "processed", "count": count})
+    
+    def increment_failed(self, count: int = 1):
+        self._record({"kind": "failed", "count": count})
+    
+    def get_status(self):
+        return {
+            "used": self.data["budget_used"],
+            "remaining": self.data["budget_remaining"],
+            "percentage": self.data["budget_used"] / self.limit * 100,
+            "texts_processed": self.data["texts_processed"],
+            "texts_failed": self.data["texts_failed"],
+            "success_rate": (self.data["texts_processed"] - self.data["texts_failed"]) / max(self.data["texts_processed"], 1) * 100
+        }
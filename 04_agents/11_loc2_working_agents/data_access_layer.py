@@ -3,13 +3,27 @@ Data Access Layer (DAL) - البوابة الموحدة للبيانات الذ
 Version: Final Stable
 """
 from google.cloud import bigquery
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional
 import logging
+import os
+
+from micro_batcher import IdBatcher, InsertBuffer
+from result_cache import DEFAULT_CACHE_PATH, ResultCache
 
 logger = logging.getLogger(__name__)
 
 class DataAccessLayer:
-    def __init__(self):
+    def __init__(
+        self,
+        *,
+        cache_path: Optional[str] = DEFAULT_CACHE_PATH,
+        table_ttls: Optional[Dict[str, float]] = None,
+        ann_index_path: Optional[str] = os.environ.get("DAL_ANN_INDEX"),
+        ann_nprobe: int = 16,
+        batch_window_ms: float = 5.0,
+        insert_flush_rows: int = 500,
+        insert_flush_interval: float = 2.0,
+    ):
         self.client = bigquery.Client()
         self.project = "iqraa-12"
         self.TABLES = {
@@ -22,8 +36,75 @@ class DataAccessLayer:
             "gov_topics": f"{self.project}.iqraa_academic_v2.gov_topics_taxonomy_ai",
             "gov_balance": f"{self.project}.iqraa_academic_v2.gov_corpus_balance",
         }
+        # نتائج الاستعلامات على القرص — cache_path=None لتعطيله
+        self.cache = None
+        if cache_path:
+            try:
+                self.cache = ResultCache(cache_path, table_ttls=table_ttls)
+            except Exception as e:
+                logger.warning(f"⚠️ Result Cache معطّل: {e}")
+        # فهرس ANN محلي لـ semantic_search (ann_index.py build) — وإلا VECTOR_SEARCH
+        self.ann_index = None
+        if ann_index_path:
+            try:
+                from ann_index import IVFIndex
+                self.ann_index = IVFIndex(ann_index_path, nprobe=ann_nprobe)
+            except Exception as e:
+                logger.warning(f"⚠️ ANN Index غير متاح ({ann_index_path}): {e}")
+        # طلبات المعرفات المتزامنة → استعلام واحد؛ التفاعلات → إدراج دفعي
+        self.chunk_batcher = IdBatcher(self._fetch_chunks, window_ms=batch_window_ms)
+        self.interactions = InsertBuffer(
+            lambda rows: self.client.insert_rows_json(self.TABLES["knowledge"], rows),
+            flush_rows=insert_flush_rows,
+            flush_interval=insert_flush_interval,
+        )
         logger.info("✅ DAL Initialized.")
 
+    def _rows(self, table: str, sql: str, params: Optional[List] = None) -> List[Dict]:
+        """تنفيذ استعلام قراءة (صفوف كـ dict) — عبر Result Cache إن وُجد"""
+        def run():
+            job_config = bigquery.QueryJobConfig(query_parameters=params) if params else None
+            return [dict(row) for row in self.client.query(sql, job_config=job_config).result()]
+        if not self.cache:
+            return run()
+        key_params = [(p.name, p.type_, p.value) for p in params or []]
+        return self.cache.get_or_query(sql, key_params, table, run)
+
+    def invalidate_cache(self, table: Optional[str] = None) -> int:
+        """إبطال النتائج المحفوظة لجدول (مفتاح من TABLES) أو للكل"""
+        return self.cache.invalidate(table) if self.cache else 0
+
+    def cache_metrics(self) -> Dict[str, Any]:
+        return self.cache.metrics() if self.cache else {}
+
+    def batch_metrics(self) -> Dict[str, Any]:
+        """أحجام الدفعات و p50/p99 للتأخير المضاف — القراءة والكتابة"""
+        return {"chunks": self.chunk_batcher.metrics(), "interactions": self.interactions.metrics()}
+
+    def flush(self) -> int:
+        """كتابة التفاعلات المخزّنة الآن"""
+        return self.interactions.flush()
+
+    def _chunks_sql(self) -> str:
+        return f"SELECT chunk_id, text, record_id FROM `{self.TABLES['chunks']}` WHERE chunk_id IN UNNEST(@ids)"
+
+    def _fetch_chunks(self, chunk_ids: List[str]) -> Dict[str, Dict]:
+        """دفعة واحدة من IdBatcher — استعلام بمعاملات"""
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[bigquery.ArrayQueryParameter("ids", "STRING", chunk_ids)]
+        )
+        rows = self.client.query(self._chunks_sql(), job_config=job_config).result()
+        return {row["chunk_id"]: dict(row) for row in rows}
+
+    def _chunk_rows(self, chunk_ids: List[str]) -> Dict[str, Dict]:
+        """{chunk_id: {chunk_id, text, record_id}} — Result Cache، ثم IdBatcher"""
+        ids = sorted(set(chunk_ids))
+        if not self.cache:
+            return self.chunk_batcher.fetch(ids)
+        return self.cache.get_or_query(
+            self._chunks_sql(), [("ids", "STRING", ids)], "chunks", lambda: self.chunk_batcher.fetch(ids)
+        )
+
     def search_entities(self, query: str = None, category: str = None, limit: int = 50) -> List[Dict]:
         sql = f"SELECT entity_name, entity_type, COUNT(*) as frequency FROM `{self.TABLES['entities']}` WHERE 1=1"
         params = []
@@ -36,8 +117,7 @@ class DataAccessLayer:
         
         sql += f" GROUP BY entity_name, entity_type ORDER BY frequency DESC LIMIT {limit}"
         
-        job_config = bigquery.QueryJobConfig(query_parameters=params)
-        return [dict(row) for row in self.client.query(sql, job_config=job_config)]
+        return self._rows("entities", sql, params)
 
     def search_golden_content(self, topic: str, limit: int = 10) -> List[Dict]:
         sql = f"""
@@ -47,33 +127,36 @@ class DataAccessLayer:
             ORDER BY confidence DESC
             LIMIT {limit}
         """
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[bigquery.ScalarQueryParameter("topic", "STRING", f"%{topic}%")]
-        )
-        return [dict(row) for row in self.client.query(sql, job_config=job_config)]
+        params = [bigquery.ScalarQueryParameter("topic", "STRING", f"%{topic}%")]
+        return self._rows("classifications", sql, params)
 
     def get_text_content(self, chunk_ids: List[str]) -> Dict[str, str]:
         if not chunk_ids: return {}
-        safe_ids = [cid.replace("'", "") for cid in chunk_ids]
-        ids_str = ", ".join([f"'{cid}'" for cid in safe_ids])
-        query = f"SELECT chunk_id, text FROM `{self.TABLES['chunks']}` WHERE chunk_id IN ({ids_str})"
-        results = self.client.query(query).result()
-        return {row.chunk_id: row.text for row in results}
+        return {cid: row["text"] for cid, row in self._chunk_rows(chunk_ids).items()}
 
-    def semantic_search(self, vector: List[float], limit: int = 10) -> List[Dict]:
+    def semantic_search(self, vector: List[float], limit: int = 10, nprobe: Optional[int] = None) -> List[Dict]:
         if not vector: return []
+        if self.ann_index is not None:
+            try:
+                hits = self.ann_index.search(vector, k=limit, nprobe=nprobe)
+                return [{"chunk_id": chunk_id, "score": score} for chunk_id, score in hits]
+            except Exception as e:
+                # بُعد مختلف أو فهرس تالف — VECTOR_SEARCH بدلاً منه
+                logger.error(f"ANN Search Error (→ VECTOR_SEARCH): {e}")
         vector_str = str(vector)
         query = f"""
             SELECT base.chunk_id, distance
             FROM VECTOR_SEARCH(
                 TABLE `{self.TABLES['embeddings']}`, 'embedding',
                 (SELECT {vector_str} as embedding),
-                top_k => {limit}, options => '{{"fraction_lists_to_search": 0.01}}'
+                top_k => {limit}, distance_type => 'COSINE',
+                options => '{{"fraction_lists_to_search": 0.01}}'
             )
         """
         try:
-            rows = self.client.query(query).result()
-            return [{"chunk_id": r.chunk_id, "score": 1 - r.distance} for r in rows]
+            rows = self._rows("embeddings", query)
+            # COSINE: 1 - distance = تشابه cosine، نفس مقياس الفهرس المحلي
+            return [{"chunk_id": r["chunk_id"], "score": 1 - r["distance"]} for r in rows]
         except Exception as e:
             logger.error(f"Vector Search Error: {e}") 
             return []
@@ -85,33 +168,31 @@ class DataAccessLayer:
             WHERE death_hijri = @year
             LIMIT {limit}
         """
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[bigquery.ScalarQueryParameter("year", "INTEGER", year)]
-        )
-        return [dict(row) for row in self.client.query(query, job_config=job_config)]
+        params = [bigquery.ScalarQueryParameter("year", "INTEGER", year)]
+        return self._rows("gov_books", query, params)
 
     def get_content_details(self, chunk_ids: List[str]) -> Dict[str, Dict]:
         if not chunk_ids: return {}
-        safe_ids = [cid.replace("'", "") for cid in chunk_ids]
-        ids_str = ", ".join([f"'{cid}'" for cid in safe_ids])
-        query = f"SELECT chunk_id, text, record_id FROM `{self.TABLES['chunks']}` WHERE chunk_id IN ({ids_str})"
-        results = self.client.query(query).result()
         data = {}
-        for row in results:
+        for row in self._chunk_rows(chunk_ids).values():
             author = "Unknown"
             book = "Unknown"
-            if row.record_id and len(row.record_id) > 4:
+            record_id = row["record_id"]
+            if record_id and len(record_id) > 4:
                 try:
-                    parts = row.record_id[4:].split('.')
-                    author = parts[0] if len(parts) > 0 else row.record_id
+                    parts = record_id[4:].split('.')
+                    author = parts[0] if len(parts) > 0 else record_id
                     book = parts[1] if len(parts) > 1 else ""
                 except: pass
-            data[row.chunk_id] = {"text": row.text, "author": author, "book": book, "record_id": row.record_id}
+            data[row["chunk_id"]] = {"text": row["text"], "author": author, "book": book, "record_id": record_id}
         return data
 
 
     def save_interaction(self, interaction: dict) -> bool:
-        """حفظ نتيجة البحث في جدول المعرفة"""
+        """
+        حفظ نتيجة البحث في جدول المعرفة — يُضاف إلى InsertBuffer ويُكتب دفعياً
+        (True = أُضيف؛ أخطاء الكتابة تظهر في batch_metrics()["interactions"])
+        """
         import uuid
         from datetime import datetime
         
@@ -133,14 +214,9 @@ class DataAccessLayer:
         }
         
         try:
-            table_ref = f"{self.project}.diwan_iqraa_v2.iqraa_knowledge"
-            errors = self.client.insert_rows_json(table_ref, [row])
-            if not errors:
-                logger.info(f"✅ Saved interaction: {row['interaction_id'][:8]}")
-                return True
-            else:
-                logger.error(f"Save failed: {errors}")
-                return False
+            self.interactions.add(row)
+            logger.info(f"✅ Queued interaction: {row['interaction_id'][:8]}")
+            return True
         except Exception as e:
             logger.error(f"Save error: {e}")
             return False
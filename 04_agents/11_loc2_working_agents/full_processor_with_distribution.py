@@ -3,8 +3,14 @@ Full Processor - مع التوزيع على الجداول
 النسخة المصححة - 2026-01-25
 """
 
+import argparse
 import asyncio
 import json
+import multiprocessing
+import os
+import socket
+import sys
+import time
 from google.cloud import bigquery
 from transformers import AutoTokenizer, AutoModel
 import torch
@@ -12,6 +18,10 @@ from datetime import datetime
 import logging
 import uuid
 
+from work_watermark import (
+    DEFAULT_STATE_PATH, LeaseLost, ShardBusy, WorkWatermark, fetch_shard_batch, merge_counts,
+)
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
@@ -23,6 +33,27 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+TOTAL_TEXTS = 157870756
+
+JOB = "full_processor"
+CHUNKS_TABLE = "iqraa-12.diwan_iqraa_v2.openiti_chunks"
+CLASSIFICATIONS_TABLE = "iqraa-12.diwan_iqraa_v2.classifications_unified"
+
+# تقدّم الإصدار السابق (NOT IN) — يُقرأ فقط كخط أساس للتقدّم الكلي؛
+# صفوفه المُصنَّفة تُتخطّى عبر مطابقة classifications_unified (fetch_shard_batch)
+LEGACY_CHECKPOINT = "/home/user/processing_checkpoint.json"
+
+# رمز خروج العامل حين تكون شريحته محجوزة (منسّق آخر على نفس ملف الحالة)
+EXIT_SHARD_BUSY = 3
+
+
+def load_legacy_checkpoint(path: str = LEGACY_CHECKPOINT) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
 
 class FullProcessorWithDistribution:
     """معالج كامل مع التوزيع"""
@@ -56,14 +87,28 @@ class FullProcessorWithDistribution:
         "غير محدد": "02_analysis_results"
     }
     
-    def __init__(self):
+    def __init__(
+        self,
+        shard: int = 0,
+        shards: int = 1,
+        state_path: str = DEFAULT_STATE_PATH,
+        owner: str = None,
+    ):
         self.bq_client = bigquery.Client(project="iqraa-12")
         
+        # هذا العامل يملك: FARM_FINGERPRINT(chunk_id) mod shards = shard — بعقد إيجار
+        self.watermark = WorkWatermark(state_path, job=JOB, shard=shard, shards=shards, owner=owner)
+        if not self.watermark.claim():
+            raise ShardBusy(f"الشريحة {shard}/{shards} محجوزة لعامل آخر")
+        if self.watermark.position:
+            logger.info(f"استئناف الشريحة {shard}/{shards} بعد {self.watermark.position}")
+        
         logger.info("تحميل CAMeLBERT-CA...")
         self.tokenizer = AutoTokenizer.from_pretrained("CAMeL-Lab/bert-base-arabic-camelbert-ca")
         self.model = AutoModel.from_pretrained("CAMeL-Lab/bert-base-arabic-camelbert-ca")
         self.model.eval()
         
+        # عدّادات هذه الجلسة؛ المجاميع الدائمة في علامة الشريحة (watermark.progress)
         self.tracker = {
             "started_at": datetime.now().isoformat(),
             "processed": 0,
@@ -91,10 +136,6 @@ class FullProcessorWithDistribution:
         
         return row
     
-    def save_checkpoint(self):
-        with open("/home/user/processing_checkpoint.json", "w") as f:
-            json.dump(self.tracker, f, indent=2, ensure_ascii=False)
-    
     def get_target_table(self, domain: str) -> str:
         """تحديد الجدول المناسب"""
         table_name = self.DOMAIN_TO_TABLE.get(domain, "02_analysis_results")
@@ -118,27 +159,26 @@ class FullProcessorWithDistribution:
     async def process_and_distribute_batch(self, batch_size=1000):
         """معالجة وتوزيع دفعة"""
         
-        query = f"""
-        SELECT chunk_id, record_id, text
-        FROM `iqraa-12.diwan_iqraa_v2.openiti_chunks`
-        WHERE chunk_id NOT IN (
-            SELECT chunk_id FROM `iqraa-12.diwan_iqraa_v2.classifications_unified`
+        # الدفعة التالية بعد علامة الشريحة — done: صفوف لها تصنيف سابق (ترحيل من NOT IN)
+        rows, done = fetch_shard_batch(
+            self.bq_client, self.watermark, CHUNKS_TABLE, CLASSIFICATIONS_TABLE, batch_size
         )
-        LIMIT {batch_size}
-        """
-        
-        rows = list(self.bq_client.query(query).result())
         
         if not rows:
             logger.info("كل النصوص معالجة!")
             return False
         
-        logger.info(f"معالجة وتوزيع {len(rows)} نص...")
+        if done:
+            logger.info(f"تخطي {len(done)} نص مصنف سابقاً")
+        pending = [row for row in rows if row.chunk_id not in done]
+        
+        logger.info(f"معالجة وتوزيع {len(pending)} نص...")
         
+        batch_stats = {"distributed": 0, "errors": 0, "by_domain": {}}
         processed_results = []
         distribution_map = {}
         
-        for row in rows:
+        for row in pending:
             try:
                 inputs = self.tokenizer(row.text[:512], return_tensors="pt", truncation=True, max_length=512)
                 
@@ -166,16 +206,19 @@ class FullProcessorWithDistribution:
                 
             except Exception as e:
                 logger.error(f"خطأ في {row.chunk_id}: {e}")
-                self.tracker["errors"] += 1
+                batch_stats["errors"] += 1
         
         # حفظ في classifications_unified
         if processed_results:
             errors = self.bq_client.insert_rows_json(
-                "iqraa-12.diwan_iqraa_v2.classifications_unified",
-                processed_results
+                CLASSIFICATIONS_TABLE,
+                processed_results,
+                row_ids=[r["chunk_id"] for r in processed_results],
             )
             if errors:
+                # الموضع لا يتقدم: الدفعة تُعاد
                 logger.error(f"اخطاء في الحفظ: {errors[:2]}")
+                return True
         
         # التوزيع على الجداول النهائية - مع الحقول المطلوبة
         for domain, results in distribution_map.items():
@@ -188,13 +231,13 @@ class FullProcessorWithDistribution:
                 prepared_rows.append(prepared_row)
             
             try:
-                errors = self.bq_client.insert_rows_json(target_table, prepared_rows)
+                errors = self.bq_client.insert_rows_json(
+                    target_table, prepared_rows, row_ids=[r["chunk_id"] for r in prepared_rows]
+                )
                 
                 if not errors:
-                    self.tracker["distributed"] += len(prepared_rows)
-                    if domain not in self.tracker["by_domain"]:
-                        self.tracker["by_domain"][domain] = 0
-                    self.tracker["by_domain"][domain] += len(prepared_rows)
+                    batch_stats["distributed"] += len(prepared_rows)
+                    merge_counts(batch_stats["by_domain"], {domain: len(prepared_rows)})
                     logger.info(f"   OK: {len(prepared_rows)} -> {domain}")
                 else:
                     logger.error(f"   FAIL {domain}: {errors[:1]}")
@@ -202,8 +245,10 @@ class FullProcessorWithDistribution:
             except Exception as e:
                 logger.error(f"   ERROR {domain}: {e}")
         
+        # تقدّم العلامة بعد الحفظ (المفتاح الأخير في الدفعة المرتبة) مع عدّادات الدفعة
+        self.watermark.advance(rows[-1].chunk_id, len(processed_results), stats=batch_stats)
+        merge_counts(self.tracker, batch_stats)
         if self.tracker["processed"] % 10000 == 0:
-            self.save_checkpoint()
             logger.info(f"Checkpoint: {self.tracker['processed']:,}")
         
         return True
@@ -232,22 +277,180 @@ class FullProcessorWithDistribution:
         
         logger.info("بدء المعالجة والتوزيع...")
         logger.info("الهدف: 157,870,756 نص")
+        shards = self.watermark.shards
         
-        while True:
-            has_more = await self.process_and_distribute_batch(1000)
-            
-            if not has_more:
-                break
+        try:
+            while True:
+                has_more = await self.process_and_distribute_batch(1000)
+                
+                if not has_more:
+                    break
+                
+                if self.tracker["processed"] % 100000 == 0:
+                    shard = next(p for p in self.watermark.progress() if p["shard"] == self.watermark.shard)
+                    percentage = shard["processed"] / (TOTAL_TEXTS / shards) * 100
+                    logger.info(f"Progress: {shard['processed']:,} ({percentage:.2f}%)")
+                    logger.info(f"By domain: {shard['stats'].get('by_domain', {})}")
             
-            if self.tracker["processed"] % 100000 == 0:
-                percentage = self.tracker["processed"] / 157870756 * 100
-                logger.info(f"Progress: {self.tracker['processed']:,} ({percentage:.2f}%)")
-                logger.info(f"By domain: {self.tracker['by_domain']}")
+            self.watermark.finish()
+        except LeaseLost as e:
+            logger.error(f"{e}")
+            return
+        finally:
+            self.watermark.release()
         
         logger.info("المعالجة والتوزيع اكتملت!")
-        self.save_checkpoint()
 
 
-if __name__ == "__main__":
-    processor = FullProcessorWithDistribution()
+# ─────────────────────────────────────────────
+# التشغيل المجزّأ: N عمّال محليين + منسّق
+# ─────────────────────────────────────────────
+
+def _run_shard(shard: int, shards: int, state_path: str, owner: str, threads: int):
+    """عملية عامل: شريحة واحدة حتى النهاية (تستأنف من علامة الشريحة)"""
+    torch.set_num_threads(threads)
+    try:
+        processor = FullProcessorWithDistribution(shard, shards, state_path, owner=owner)
+    except ShardBusy as e:
+        logger.error(f"{e}")
+        sys.exit(EXIT_SHARD_BUSY)
     asyncio.run(processor.run())
+
+
+class ShardCoordinator:
+    """
+    يشغّل عاملاً لكل شريحة، ويدمج WorkWatermark.progress() للشرائح في تقدّم كلي + ETA،
+    ويعيد تشغيل شريحة العامل المنهار (يستأنف من علامتها) حتى max_restarts.
+    
+    مالك كل شريحة ثابت لهذا المنسّق (العامل المُعاد يستعيد الإيجار فوراً)؛ منسّق ثانٍ
+    على نفس ملف الحالة لا يحصل على شرائح محجوزة — عامله يخرج بـ EXIT_SHARD_BUSY.
+    """
+    
+    def __init__(
+        self,
+        workers: int,
+        state_path: str = DEFAULT_STATE_PATH,
+        total: int = TOTAL_TEXTS,
+        poll_interval: float = 30.0,
+        max_restarts: int = 5,
+        legacy_checkpoint: str = LEGACY_CHECKPOINT,
+    ):
+        self.workers = workers
+        self.state_path = state_path
+        self.total = total
+        self.poll_interval = poll_interval
+        self.max_restarts = max_restarts
+        self.legacy = load_legacy_checkpoint(legacy_checkpoint) if legacy_checkpoint else {}
+        self.threads = max(1, (os.cpu_count() or 1) // workers)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # للقراءة فقط (progress) — لا يحجز شريحة
+        self.watermark = WorkWatermark(state_path, job=JOB, shard=0, shards=workers)
+        self._ctx = multiprocessing.get_context("spawn")
+        self._procs = {}
+        self._restarts = {shard: 0 for shard in range(workers)}
+        self._started = None
+        self._baseline = 0
+    
+    def _start(self, shard: int):
+        proc = self._ctx.Process(
+            target=_run_shard,
+            args=(shard, self.workers, self.state_path, f"{self.owner}/shard-{shard}", self.threads),
+            name=f"shard-{shard}", daemon=False,
+        )
+        proc.start()
+        self._procs[shard] = proc
+        logger.info(f"عامل الشريحة {shard}/{self.workers}: pid {proc.pid}")
+    
+    def _finished(self, shard: int) -> bool:
+        return any(p["shard"] == shard and p["finished"] for p in self.watermark.progress())
+    
+    def progress(self) -> dict:
+        """دمج علامات كل الشرائح (+ تقدّم الإصدار السابق كخط أساس)"""
+        merged = {
+            "processed": self.legacy.get("processed", 0),
+            "distributed": self.legacy.get("distributed", 0),
+            "errors": self.legacy.get("errors", 0),
+            "by_domain": dict(self.legacy.get("by_domain", {})),
+            "legacy_processed": self.legacy.get("processed", 0),
+            "shards": {},
+        }
+        for p in self.watermark.progress():
+            merged["processed"] += p["processed"]
+            merge_counts(merged, {k: v for k, v in p["stats"].items() if k in ("distributed", "errors", "by_domain")})
+            proc = self._procs.get(p["shard"])
+            merged["shards"][p["shard"]] = {
+                "processed": p["processed"],
+                "last_key": p["last_key"],
+                "finished": p["finished"],
+                "owner": p["owner"],
+                "alive": bool(proc and proc.is_alive()),
+                "restarts": self._restarts[p["shard"]],
+            }
+        
+        elapsed = time.time() - self._started if self._started else 0
+        rate = (merged["processed"] - self._baseline) / elapsed if elapsed > 0 else 0.0
+        remaining = max(0, self.total - merged["processed"])
+        merged["rate_per_second"] = round(rate, 2)
+        merged["percent"] = round(merged["processed"] / self.total * 100, 4) if self.total else 0.0
+        merged["eta_seconds"] = round(remaining / rate) if rate > 0 else None
+        return merged
+    
+    def _report(self):
+        p = self.progress()
+        eta = p["eta_seconds"]
+        eta_str = f"{eta / 3600:.1f} ساعة" if eta is not None else "—"
+        alive = sum(1 for s in p["shards"].values() if s["alive"])
+        logger.info(
+            f"Progress: {p['processed']:,} ({p['percent']:.2f}%) | {p['rate_per_second']:.1f} نص/ث | "
+            f"ETA: {eta_str} | عمّال: {alive}/{self.workers}"
+        )
+    
+    def run(self):
+        logger.info(f"بدء المعالجة المجزّأة: {self.workers} عامل × {self.threads} خيط")
+        if self.legacy:
+            logger.info(f"تقدّم الإصدار السابق: {self.legacy.get('processed', 0):,} (خط أساس)")
+        self._baseline = self.progress()["processed"]
+        self._started = time.time()
+        for shard in range(self.workers):
+            if not self._finished(shard):
+                self._start(shard)
+        
+        while self._procs:
+            time.sleep(self.poll_interval)
+            for shard, proc in list(self._procs.items()):
+                if proc.is_alive():
+                    continue
+                del self._procs[shard]
+                if proc.exitcode == 0 and self._finished(shard):
+                    logger.info(f"الشريحة {shard} اكتملت")
+                    continue
+                if proc.exitcode == EXIT_SHARD_BUSY:
+                    logger.error(f"الشريحة {shard}: محجوزة لعامل آخر — لا إعادة")
+                    continue
+                # انهيار: إعادة الشريحة لعامل جديد يستأنف من علامتها
+                self._restarts[shard] += 1
+                if self._restarts[shard] > self.max_restarts:
+                    logger.error(f"الشريحة {shard}: exit {proc.exitcode} — تجاوزت {self.max_restarts} إعادة، متروكة")
+                    continue
+                logger.warning(f"الشريحة {shard}: exit {proc.exitcode} — إعادة إسناد ({self._restarts[shard]})")
+                self._start(shard)
+            self._report()
+        
+        logger.info("المعالجة المجزّأة انتهت")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Full Processor مع التوزيع")
+    parser.add_argument("--workers", type=int, default=1, help="عدد العمّال المحليين (شرائح)")
+    parser.add_argument("--state", default=DEFAULT_STATE_PATH, help="ملف العلامات المحلي (مشترك مع SmartDistributor)")
+    parser.add_argument("--legacy-checkpoint", default=LEGACY_CHECKPOINT, help="checkpoint الإصدار السابق (خط أساس)")
+    parser.add_argument("--poll", type=float, default=30.0, help="فترة مراقبة المنسّق بالثواني")
+    args = parser.parse_args()
+    
+    if args.workers > 1:
+        ShardCoordinator(
+            args.workers, args.state, poll_interval=args.poll, legacy_checkpoint=args.legacy_checkpoint
+        ).run()
+    else:
+        processor = FullProcessorWithDistribution(state_path=args.state)
+        asyncio.run(processor.run())
@@ -0,0 +1,253 @@
+"""
+Keyword Classifier - تصنيف بالكلمات المفتاحية في مرور واحد على النص
+يُستخدم في SmartDistributor.simple_classify و auto_classifier (velvet-dashboard)
+— المصدر: 04_agents/11_loc2_working_agents؛ نسخة مطابقة (vendored) في velvet-dashboard
+  pipeline/classification — لا تُعدَّل هناك: انسخ الملف، و tests/test_keyword_classifier.py يتحقق من التطابق
+
+• الجداول: فئة → كلمات مفتاحية، من ملف JSON (نفس صيغة tables_schema.json)
+• تعبير منتظم واحد مُجمَّع لكل الكلمات (شجرة بادئات: ح(?:كم|ر(?:ب|اسة))...)
+  يجد في مرور واحد أطول كلمة تبدأ عند كل موضع؛ الكلمات الأقصر عند نفس الموضع
+  هي بادئاتها (محسوبة مسبقاً) — بدل مسح النص مرة لكل كلمة
+• العدّ غير متداخل لكل كلمة (= len(re.findall(keyword, text)) للكلمات الحرفية)
+• الدرجات موزونة: وزن للفئة ووزن لكل كلمة (الافتراضي 1.0)
+• first_match (سلسلة if/elif): بحث جزئي (in) بترتيب الفئات يتوقف عند أول تطابق — بلا مسح كامل
+
+صيغة الملف:
+    {"categories": {
+        "اقتصاد": {"keywords": ["ضريبة", "مجاعة"], "weight": 1.0, "keyword_weights": {"مجاعة": 2.0}},
+        "حضري": ["مدينة", "سوق"]
+    }}
+
+    python keyword_classifier.py --config tables_schema.json --chunks 100000
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+import argparse
+import json
+import os
+import random
+import re
+import time
+
+CategorySpec = Union[List[str], Dict]
+
+
+class KeywordClassifier:
+    """
+    Args:
+        categories: {فئة: [كلمات]} أو {فئة: {"keywords": [...], "weight": w, "keyword_weights": {...}}}
+                    — الترتيب مهم لـ first_match
+        lowercase: تطبيق text.lower() قبل المطابقة (كما في الكود السابق)
+    """
+
+    def __init__(self, categories: Dict[str, CategorySpec], lowercase: bool = True):
+        self.lowercase = lowercase
+        self.categories: List[str] = []
+        # كلمة → [(فئة، وزن)]
+        self._targets: Dict[str, List[Tuple[str, float]]] = {}
+        for category, spec in categories.items():
+            if isinstance(spec, dict):
+                keywords = spec.get("keywords", [])
+                weight = float(spec.get("weight", 1.0))
+                keyword_weights = spec.get("keyword_weights", {})
+            else:
+                keywords, weight, keyword_weights = spec, 1.0, {}
+            self.categories.append(category)
+            for keyword in keywords:
+                if not keyword:
+                    continue
+                key = keyword.lower() if lowercase else keyword
+                self._targets.setdefault(key, []).append(
+                    (category, weight * float(keyword_weights.get(keyword, 1.0)))
+                )
+
+        # كلمة → الكلمات التي هي بادئات لها (بما فيها نفسها)
+        self._prefixes: Dict[str, List[str]] = {
+            keyword: [k for k in self._targets if keyword.startswith(k)] for keyword in self._targets
+        }
+        self._rank = {category: i for i, category in enumerate(self.categories)}
+        # first_match: (فئة، كلماتها) بالترتيب — بحث جزئي (in) يتوقف عند أول تطابق
+        self._ordered: List[Tuple[str, List[str]]] = [(category, []) for category in self.categories]
+        for keyword, targets in self._targets.items():
+            for category, _ in targets:
+                self._ordered[self._rank[category]][1].append(keyword)
+        self._scanner = None
+        if self._targets:
+            self._scanner = re.compile(f"(?=({_trie_pattern(self._targets)}))")
+
+    @classmethod
+    def from_config(cls, path, key: str = "categories", **kwargs) -> "KeywordClassifier":
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        return cls(config.get(key, {}) if key else config, **kwargs)
+
+    @property
+    def keywords(self) -> List[str]:
+        return list(self._targets)
+
+    def counts(self, text: str) -> Dict[str, int]:
+        """عدد الظهور غير المتداخل لكل كلمة موجودة في النص"""
+        if not text or self._scanner is None:
+            return {}
+        if self.lowercase:
+            text = text.lower()
+        counts: Dict[str, int] = {}
+        next_free: Dict[str, int] = {}          # كلمة → أول موضع بعد آخر ظهور محسوب
+        prefixes = self._prefixes
+        for m in self._scanner.finditer(text):
+            pos = m.start()
+            for keyword in prefixes[m.group(1)]:
+                if pos >= next_free.get(keyword, 0):
+                    counts[keyword] = counts.get(keyword, 0) + 1
+                    next_free[keyword] = pos + len(keyword)
+        return counts
+
+    def scores(self, text: str, fields: Iterable[Tuple[str, float]] = ()) -> Dict[str, float]:
+        """
+        درجة موزونة لكل فئة = Σ وزن × عدد الظهور.
+        fields: [(نص إضافي، مكافأة)] — كل كلمة موجودة في النص الإضافي تضيف المكافأة مرة
+                (مثل عنوان الكتاب +5، المؤلف +3)
+        """
+        scores: Dict[str, float] = {}
+        for keyword, count in self.counts(text).items():
+            for category, weight in self._targets[keyword]:
+                scores[category] = scores.get(category, 0.0) + count * weight
+        for field, bonus in fields:
+            if not field:
+                continue
+            present = self.counts(field)
+            for keyword in present:
+                for category, weight in self._targets[keyword]:
+                    scores[category] = scores.get(category, 0.0) + bonus * weight
+        return scores
+
+    def top(self, text: str, n: int = 3, fields: Iterable[Tuple[str, float]] = ()) -> List[Tuple[str, float]]:
+        """أعلى n فئات بدرجات مُطبَّعة (الأعلى = 1.0)، بترتيب الجدول عند التساوي"""
+        scores = self.scores(text, fields)
+        ranked = sorted(
+            ((c, s) for c, s in scores.items() if s > 0),
+            key=lambda item: (-item[1], self._rank[item[0]]),
+        )
+        if not ranked:
+            return []
+        best = ranked[0][1]
+        return [(category, score / best) for category, score in ranked[:n]]
+
+    def first_match(self, text: str, default: Optional[str] = None) -> Optional[str]:
+        """
+        أول فئة (بترتيب الجدول) فيها أي كلمة موجودة — سلوك سلسلة if/elif.
+        لا مسح كامل (counts): بحث جزئي سريع لكل كلمة يتوقف عند أول فئة مطابقة
+        """
+        if not text:
+            return default
+        if self.lowercase:
+            text = text.lower()
+        for category, keywords in self._ordered:
+            for keyword in keywords:
+                if keyword in text:
+                    return category
+        return default
+
+
+def _trie_pattern(keywords: Iterable[str]) -> str:
+    """تعبير منتظم على شكل شجرة بادئات — يطابق أطول كلمة عند الموضع (greedy)"""
+    trie: Dict = {}
+    for keyword in keywords:
+        node = trie
+        for ch in keyword:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def emit(node: Dict) -> str:
+        alternatives = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not alternatives:
+            return ""
+        body = alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return emit(trie)
+
+
+# ─────────────────────────────────────────────
+# Benchmark
+# ─────────────────────────────────────────────
+
+def _classify_reference(text: str, categories: Dict[str, CategorySpec]) -> Dict[str, float]:
+    """التطبيق السابق (auto_classifier.classify_text): re.findall لكل كلمة لكل فئة"""
+    scores: Dict[str, float] = {}
+    text_lower = text.lower()
+    for category, spec in categories.items():
+        keywords = spec.get("keywords", []) if isinstance(spec, dict) else spec
+        for keyword in keywords:
+            count = len(re.findall(keyword, text_lower))
+            if count:
+                scores[category] = scores.get(category, 0.0) + count * 1.0
+    return scores
+
+
+def _first_match_reference(text: str, categories: Dict[str, CategorySpec], default: str) -> str:
+    """التطبيق السابق (SmartDistributor.simple_classify): سلسلة if/elif من any(w in text)"""
+    text_lower = text.lower()
+    for category, spec in categories.items():
+        keywords = spec.get("keywords", []) if isinstance(spec, dict) else spec
+        if any(w in text_lower for w in keywords if w):
+            return category
+    return default
+
+
+def _timed(label: str, before: float, after: float, n: int):
+    print(f"{label}")
+    print(f"  السابق:            {before:.2f} ث ({n / before:,.0f} قطعة/ث)")
+    print(f"  KeywordClassifier: {after:.2f} ث ({n / after:,.0f} قطعة/ث) — ×{before / after:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark: KeywordClassifier مقابل التطبيقات السابقة (scores و first_match)")
+    parser.add_argument("--config", help="ملف JSON بالفئات (الافتراضي: keyword_categories.json بجانب هذا الملف)")
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--words", type=int, default=120, help="متوسط عدد الكلمات في القطعة")
+    args = parser.parse_args()
+
+    if args.config:
+        config_path = args.config
+    else:
+        config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "keyword_categories.json")
+    with open(config_path, encoding="utf-8") as f:
+        categories = json.load(f)["categories"]
+    classifier = KeywordClassifier(categories)
+
+    rng = random.Random(24)
+    letters = "ابتثجحخدذرزسشصضطظعغفقكلمنهوي"
+    filler = ["".join(rng.choice(letters) for _ in range(rng.randint(2, 7))) for _ in range(5000)]
+    keywords = classifier.keywords
+    chunks = []
+    for _ in range(args.chunks):
+        n = rng.randint(args.words // 2, args.words * 3 // 2)
+        words = [rng.choice(keywords) if rng.random() < 0.03 else rng.choice(filler) for _ in range(n)]
+        chunks.append(" ".join(words))
+
+    print(f"{args.chunks:,} قطعة × {len(keywords)} كلمة في {len(categories)} فئة")
+
+    # scores (auto_classifier): re.findall لكل كلمة لكل فئة
+    t0 = time.perf_counter()
+    expected = [_classify_reference(c, categories) for c in chunks]
+    before = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    got = [classifier.scores(c) for c in chunks]
+    after = time.perf_counter() - t0
+    assert got == expected, "نتائج scores مختلفة عن التطبيق السابق"
+    _timed("scores (auto_classifier) مقابل re.findall لكل كلمة:", before, after, args.chunks)
+
+    # first_match (SmartDistributor.simple_classify): سلسلة if/elif
+    t0 = time.perf_counter()
+    expected = [_first_match_reference(c, categories, "غير محدد") for c in chunks]
+    before = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    got = [classifier.first_match(c, default="غير محدد") for c in chunks]
+    after = time.perf_counter() - t0
+    assert got == expected, "نتائج first_match مختلفة عن التطبيق السابق"
+    _timed("first_match (simple_classify) مقابل سلسلة if/elif:", before, after, args.chunks)
+
+
+if __name__ == "__main__":
+    main()
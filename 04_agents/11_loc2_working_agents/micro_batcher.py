@@ -0,0 +1,261 @@
+"""
+Micro Batcher - تجميع الطلبات الصغيرة في استعلام/إدراج واحد
+
+• IdBatcher: طلبات المعرفات المتزامنة خلال نافذة قصيرة (window_ms) تُدمج في
+  استعلام واحد؛ كل مستدعٍ يستلم صفوف معرفاته فقط
+• InsertBuffer: الصفوف تُجمع وتُكتب دفعة واحدة (عند امتلاء الدفعة أو كل flush_interval)
+
+كلاهما آمن بين الخيوط، ويعيد metrics(): أحجام الدفعات و p50/p99 للتأخير المضاف.
+"""
+
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from collections import deque
+import atexit
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class _Request:
+    __slots__ = ("ids", "enqueued_at", "done", "result", "error", "lead")
+
+    def __init__(self, ids: List[str]):
+        self.ids = ids
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result: Dict[str, Any] = {}
+        self.error: Optional[BaseException] = None
+        self.lead = False
+
+
+class IdBatcher:
+    """
+    fetch_many(ids) → {id: row} — تُستدعى مرة لكل دفعة (حتى max_batch معرف).
+
+    أول مستدعٍ في النافذة هو القائد: ينتظر window_ms (أو حتى تمتلئ الدفعة)،
+    ثم ينفّذ استعلاماً واحداً لحتى max_batch معرف؛ ما زاد يبقى معلّقاً ويقوده
+    أقدم مستدعٍ منتظر (استعلام ممتلئ بدل ذيل صغير). لا خيط خلفي.
+    """
+
+    def __init__(
+        self,
+        fetch_many: Callable[[List[str]], Dict[str, Any]],
+        window_ms: float = 5.0,
+        max_batch: int = 1000,
+        latency_window: int = 10000,
+    ):
+        self.fetch_many = fetch_many
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.counters = {"requests": 0, "batches": 0, "ids_fetched": 0, "errors": 0}
+        self._pending: List[_Request] = []
+        self._pending_ids = 0
+        self._leader = False
+        self._cond = threading.Condition()
+        self._batch_sizes: deque = deque(maxlen=latency_window)
+        self._added_ms: deque = deque(maxlen=latency_window)
+
+    def fetch(self, ids: Iterable[str]) -> Dict[str, Any]:
+        """الصفوف الموجودة من ids (المعرف غير الموجود لا يظهر)"""
+        request = _Request(list(dict.fromkeys(ids)))
+        if not request.ids:
+            return {}
+        with self._cond:
+            self.counters["requests"] += 1
+            self._pending.append(request)
+            self._pending_ids += len(request.ids)
+            lead = not self._leader
+            if lead:
+                self._leader = True
+            elif self._pending_ids >= self.max_batch:
+                self._cond.notify_all()
+        if lead:
+            self._lead()
+        request.done.wait()
+        if request.lead:
+            # القائد السابق ترك طلبات معلّقة — هذا الطلب أقدمها فيقودها
+            request.lead = False
+            request.done.clear()
+            self._lead()
+            request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _lead(self):
+        with self._cond:
+            deadline = self._pending[0].enqueued_at + self.window
+            while self._pending_ids < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch, ids = self._take()
+            successor = self._pending[0] if self._pending else None
+            if successor is not None:
+                successor.lead = True
+                successor.done.set()
+            else:
+                self._leader = False
+
+        started = time.perf_counter()
+        rows: Dict[str, Any] = {}
+        sizes: List[int] = []
+        error = None
+        try:
+            # أكثر من max_batch فقط حين يتجاوزه طلب واحد وحده
+            for start in range(0, len(ids), self.max_batch):
+                chunk = ids[start:start + self.max_batch]
+                sizes.append(len(chunk))
+                rows.update(self.fetch_many(chunk))
+        except Exception as e:
+            error = e
+
+        with self._cond:
+            self.counters["batches"] += len(sizes)
+            self.counters["ids_fetched"] += len(ids)
+            if error is not None:
+                self.counters["errors"] += 1
+            self._batch_sizes.extend(sizes)
+            self._added_ms.extend((started - r.enqueued_at) * 1000 for r in batch)
+        for r in batch:
+            if error is not None:
+                r.error = error
+            else:
+                r.result = {i: rows[i] for i in r.ids if i in rows}
+            r.done.set()
+
+    def _take(self):
+        """الطلبات من الأقدم حتى max_batch معرف فريد (طلب واحد على الأقل) — تحت القفل"""
+        seen: Dict[str, None] = {}
+        taken = 0
+        for request in self._pending:
+            new = [i for i in request.ids if i not in seen]
+            if taken and len(seen) + len(new) > self.max_batch:
+                break
+            seen.update(dict.fromkeys(new))
+            taken += 1
+        batch, self._pending = self._pending[:taken], self._pending[taken:]
+        self._pending_ids -= sum(len(r.ids) for r in batch)
+        return batch, list(seen)
+
+    def metrics(self) -> Dict[str, Any]:
+        """أحجام الدفعات (معرفات/استعلام) والتأخير المضاف (انتظار النافذة) بالملّي ثانية"""
+        with self._cond:
+            sizes, added = list(self._batch_sizes), list(self._added_ms)
+            batches = self.counters["batches"]
+            return {
+                **self.counters,
+                "requests_per_batch": round(self.counters["requests"] / batches, 2) if batches else 0.0,
+                "batch_size_p50": _percentile(sizes, 50),
+                "batch_size_p99": _percentile(sizes, 99),
+                "added_ms_p50": round(_percentile(added, 50), 3),
+                "added_ms_p99": round(_percentile(added, 99), 3),
+            }
+
+
+class InsertBuffer:
+    """
+    write_rows(rows) → قائمة أخطاء (فارغة = نجاح)، مثل insert_rows_json.
+
+    add() لا يكتب: الصفوف تُكتب عند بلوغ flush_rows، أو كل flush_interval ثانية
+    (خيط خلفي)، أو عند flush()/close()/الخروج. الدفعة الفاشلة تُعاد إلى المخزن
+    ما لم يتجاوز max_buffered.
+    """
+
+    def __init__(
+        self,
+        write_rows: Callable[[List[dict]], List[Any]],
+        flush_rows: int = 500,
+        flush_interval: float = 2.0,
+        max_buffered: int = 50000,
+        latency_window: int = 10000,
+    ):
+        self.write_rows = write_rows
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.counters = {"rows_added": 0, "rows_written": 0, "flushes": 0, "errors": 0, "dropped": 0}
+        self._rows: List[dict] = []
+        self._added_at: List[float] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._batch_sizes: deque = deque(maxlen=latency_window)
+        self._added_ms: deque = deque(maxlen=latency_window)
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="insert-buffer-flush", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def add(self, row: dict) -> None:
+        with self._lock:
+            self._rows.append(row)
+            self._added_at.append(time.perf_counter())
+            self.counters["rows_added"] += 1
+            full = len(self._rows) >= self.flush_rows
+        if full:
+            self.flush()
+
+    def flush(self) -> int:
+        """كتابة كل المخزَّن الآن — يعيد عدد الصفوف المكتوبة"""
+        with self._flush_lock:
+            with self._lock:
+                rows, added_at = self._rows, self._added_at
+                self._rows, self._added_at = [], []
+            if not rows:
+                return 0
+            started = time.perf_counter()
+            try:
+                errors = self.write_rows(rows)
+            except Exception as e:
+                errors = [str(e)]
+            with self._lock:
+                self.counters["flushes"] += 1
+                if errors:
+                    self.counters["errors"] += 1
+                    logger.error("Insert flush failed (%d rows): %s", len(rows), errors)
+                    room = self.max_buffered - len(self._rows)
+                    if room < len(rows):
+                        self.counters["dropped"] += len(rows) - max(room, 0)
+                    keep = max(room, 0)
+                    self._rows[:0], self._added_at[:0] = rows[:keep], added_at[:keep]
+                    return 0
+                self.counters["rows_written"] += len(rows)
+                self._batch_sizes.append(len(rows))
+                self._added_ms.extend((started - t) * 1000 for t in added_at)
+            logger.debug("Insert flush: %d rows", len(rows))
+            return len(rows)
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:  # الكتابة الدورية لا تُسقط العملية
+                logger.warning("Insert flush: %s", e)
+
+    def metrics(self) -> Dict[str, Any]:
+        """أحجام الدفعات (صفوف/إدراج) وتأخير الكتابة بالملّي ثانية"""
+        with self._lock:
+            sizes, added = list(self._batch_sizes), list(self._added_ms)
+            return {
+                **self.counters,
+                "buffered": len(self._rows),
+                "batch_size_p50": _percentile(sizes, 50),
+                "batch_size_p99": _percentile(sizes, 99),
+                "added_ms_p50": round(_percentile(added, 50), 3),
+                "added_ms_p99": round(_percentile(added, 99), 3),
+            }
@@ -6,64 +6,10 @@ import json
 import asyncio
 import re
 from google.cloud import bigquery
-from pathlib import Path
+from budget_tracker import BudgetTracker
 from claude_client import ClaudeClient
 
 
-class BudgetTracker:
-    """متتبع الميزانية"""
-    
-    def __init__(self, budget_file: str, limit: float = 10000):
-        self.budget_file = Path(budget_file)
-        self.limit = limit
-        self.load()
-    
-    def load(self):
-        if self.budget_file.exists():
-            with open(self.budget_file) as f:
-                self.data = json.load(f)
-        else:
-            self.data = {
-                "budget_limit": self.limit,
-                "budget_used": 0,
-                "budget_remaining": self.limit,
-                "costs": {},
-                "texts_processed": 0,
-                "texts_failed": 0
-            }
-    
-    def save(self):
-        with open(self.budget_file, 'w') as f:
-            json.dump(self.data, f, indent=2)
-    
-    def add_cost(self, category: str, amount: float):
-        self.data["costs"][category] = self.data["costs"].get(category, 0) + amount
-        self.data["budget_used"] += amount
-        self.data["budget_remaining"] = self.limit - self.data["budget_used"]
-        self.save()
-        
-        if self.data["budget_used"] >= self.limit:
-            raise Exception(f"🚨 تجاوز الميزانية! ${self.data['budget_used']:.2f}")
-    
-    def increment_processed(self, count: int = 1):
-        self.data["texts_processed"] += count
-        self.save()
-    
-    def increment_failed(self, count: int = 1):
-        self.data["texts_failed"] += count
-        self.save()
-    
-    def get_status(self):
-        return {
-            "used": self.data["budget_used"],
-            "remaining": self.data["budget_remaining"],
-            "percentage": self.data["budget_used"] / self.limit * 100,
-            "texts_processed": self.data["texts_processed"],
-            "texts_failed": self.data["texts_failed"],
-            "success_rate": (self.data["texts_processed"] - self.data["texts_failed"]) / max(self.data["texts_processed"], 1) * 100
-        }
-
-
 class PremiumProcessor:
     """معالج متميز - مُحسّن"""
     
@@ -209,5 +155,6 @@ async def main():
     else:
         print(f"\n✅ ضمن الميزانية!")
 
-asyncio.run(main())
+if __name__ == "__main__":
+    asyncio.run(main())
 
@@ -0,0 +1,239 @@
+"""
+Result Cache - نتائج الاستعلامات على القرص (SQLite)
+يبقى بعد إعادة التشغيل: الاستعلام المتكرر يُخدم محلياً بلا رحلة إلى BigQuery
+
+• المفتاح: SQL مُطبَّع (المسافات) + المعاملات
+• TTL لكل جدول (النصوص لا تتغير، التصنيفات تتغير أكثر)
+• إبطال صريح: جدول واحد أو الكل
+• آمن بين الخيوط والعمليات (WAL + قفل)
+• الأنواع محفوظة: Decimal (NUMERIC) و datetime/date/time و bytes تعود بنفس نوعها
+• عطل الـ Cache (قفل، قرص ممتلئ) لا يُفشل الاستعلام — يُسجَّل ويُعاد الناتج الحي
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+from decimal import Decimal
+import base64
+import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.environ.get(
+    "DAL_CACHE_PATH", os.path.join(os.path.expanduser("~"), ".cache", "iqraa", "dal_results.sqlite")
+)
+
+DAY = 24 * 60 * 60
+
+# TTL بالثواني لكل جدول (مفاتيح DataAccessLayer.TABLES) — 0 = لا يُحفظ
+DEFAULT_TABLE_TTLS = {
+    "chunks": 30 * DAY,
+    "embeddings": 30 * DAY,
+    "gov_books": 7 * DAY,
+    "gov_topics": 7 * DAY,
+    "gov_balance": DAY,
+    "classifications": DAY,
+    "entities": DAY,
+    "knowledge": 0,
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key        TEXT PRIMARY KEY,
+    table_name TEXT NOT NULL,
+    sql        TEXT NOT NULL,
+    value      TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_results_table ON results(table_name);
+CREATE INDEX IF NOT EXISTS idx_results_expires ON results(expires_at);
+"""
+
+_MISSING = object()
+
+
+def normalize_sql(sql: str) -> str:
+    """توحيد المسافات والأسطر — نفس الاستعلام بتنسيق مختلف = نفس المفتاح"""
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+def make_key(sql: str, params: Optional[List[Tuple[str, str, Any]]] = None) -> str:
+    data = json.dumps(
+        {"sql": normalize_sql(sql), "params": sorted(params or [], key=lambda p: p[0])},
+        ensure_ascii=False, default=str,
+    )
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+# أنواع صفوف BigQuery التي لا يمثّلها JSON — تُحفظ {"__type__": اسم، "value": نص}
+_ENCODERS = {
+    Decimal: ("decimal", str),
+    datetime.datetime: ("datetime", datetime.datetime.isoformat),
+    datetime.date: ("date", datetime.date.isoformat),
+    datetime.time: ("time", datetime.time.isoformat),
+    bytes: ("bytes", lambda v: base64.b64encode(v).decode("ascii")),
+}
+_DECODERS = {
+    "decimal": Decimal,
+    "datetime": datetime.datetime.fromisoformat,
+    "date": datetime.date.fromisoformat,
+    "time": datetime.time.fromisoformat,
+    "bytes": base64.b64decode,
+}
+
+
+def _encode_value(value: Any) -> Dict[str, str]:
+    encoder = _ENCODERS.get(type(value))
+    if encoder is None:
+        # ما لا يُعرف نوعه يعود نصاً (كالسابق)
+        return str(value)
+    name, to_text = encoder
+    return {"__type__": name, "value": to_text(value)}
+
+
+def _decode_object(obj: Dict) -> Any:
+    if len(obj) == 2 and obj.get("__type__") in _DECODERS and "value" in obj:
+        return _DECODERS[obj["__type__"]](obj["value"])
+    return obj
+
+
+def dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, default=_encode_value)
+
+
+def loads(payload: str) -> Any:
+    return json.loads(payload, object_hook=_decode_object)
+
+
+class ResultCache:
+    """
+    Cache دائم لنتائج الاستعلامات — القيم تُحفظ JSON مع وسم الأنواع
+    (Decimal / datetime / date / time / bytes تعود بنفس نوعها؛ غيرها نصاً)
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        table_ttls: Optional[Dict[str, float]] = None,
+        default_ttl: float = DAY,
+    ):
+        self.path = path
+        self.table_ttls = {**DEFAULT_TABLE_TTLS, **(table_ttls or {})}
+        self.default_ttl = default_ttl
+        self.counters = {"hits": 0, "misses": 0, "expired": 0, "sets": 0, "invalidated": 0, "errors": 0}
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        logger.info("Result Cache: %s", path)
+
+    def ttl_for(self, table: str) -> float:
+        return self.table_ttls.get(table, self.default_ttl)
+
+    def get(self, sql: str, params=None, default: Any = None) -> Any:
+        """القيمة المحفوظة أو default (المنتهية تُحذف)"""
+        key = make_key(sql, params)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[1] <= time.time():
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._conn.commit()
+                self.counters["expired"] += 1
+                row = None
+            if row is None:
+                self.counters["misses"] += 1
+                return default
+            self.counters["hits"] += 1
+        return loads(row[0])
+
+    def set(self, sql: str, params, value: Any, table: str) -> bool:
+        """الحفظ بـ TTL الجدول — False إن كان الجدول لا يُحفظ"""
+        ttl = self.ttl_for(table)
+        if ttl <= 0:
+            return False
+        now = time.time()
+        payload = dumps(value)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, table_name, sql, value, created_at, expires_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (make_key(sql, params), table, normalize_sql(sql), payload, now, now + ttl),
+            )
+            self._conn.commit()
+            self.counters["sets"] += 1
+        return True
+
+    def get_or_query(self, sql: str, params, table: str, run):
+        """
+        من Cache، أو run() ثم الحفظ — استثناءات run() لا تُحفظ.
+        خطأ SQLite في القراءة أو الحفظ يُسجَّل فقط: الاستعلام يُنفَّذ/يُعاد حياً.
+        """
+        try:
+            value = self.get(sql, params, _MISSING)
+        except sqlite3.Error as e:
+            self._cache_error("قراءة", e)
+            value = _MISSING
+        if value is not _MISSING:
+            return value
+        value = run()
+        try:
+            self.set(sql, params, value, table)
+        except sqlite3.Error as e:
+            self._cache_error("حفظ", e)
+        return value
+
+    def _cache_error(self, operation: str, error: Exception) -> None:
+        with self._lock:
+            self.counters["errors"] += 1
+        logger.warning("Result Cache: فشل %s — تجاوز الـ Cache: %s", operation, error)
+
+    def invalidate(self, table: Optional[str] = None) -> int:
+        """إبطال نتائج جدول (أو الكل) — يعيد عدد المحذوف"""
+        with self._lock:
+            if table is None:
+                cur = self._conn.execute("DELETE FROM results")
+            else:
+                cur = self._conn.execute("DELETE FROM results WHERE table_name = ?", (table,))
+            self._conn.commit()
+            self.counters["invalidated"] += cur.rowcount
+        logger.info("Result Cache: إبطال %d (%s)", cur.rowcount, table or "الكل")
+        return cur.rowcount
+
+    def prune(self) -> int:
+        """حذف المنتهية"""
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),))
+            self._conn.commit()
+            self.counters["expired"] += cur.rowcount
+        return cur.rowcount
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            by_table = dict(self._conn.execute(
+                "SELECT table_name, COUNT(*) FROM results GROUP BY table_name"
+            ).fetchall())
+            return {
+                **self.counters,
+                "hit_rate": round(self.counters["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": sum(by_table.values()),
+                "entries_by_table": by_table,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
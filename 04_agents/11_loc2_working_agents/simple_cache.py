@@ -5,81 +5,231 @@ Simple Cache - In-Memory Caching
 المسار: /home/user/iqraa-12-platform/dashboard/backend/simple_cache.py
 """
 
-from typing import Any, Optional
-from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+from collections import OrderedDict
+import asyncio
 import hashlib
 import json
+import logging
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ("data", "expires_at", "size")
+
+    def __init__(self, data: Any, expires_at: float, size: int):
+        self.data = data
+        self.expires_at = expires_at
+        self.size = size
 
 
 class SimpleCache:
     """
-    Cache بسيط في الذاكرة
-    
+    Cache بسيط في الذاكرة — LRU محدود بعدد الإدخالات وبميزانية بايت تقريبية
+
     الفوائد:
     • لا يحتاج Redis
     • سريع جداً
     • يعمل فوراً
-    
+    • الذاكرة محدودة: يُطرد الأقدم استخداماً عند تجاوز max_entries أو max_bytes
+    • كنس دوري للمنتهية في الخلفية (لا ينتظر قراءة المفتاح)
+    • get_or_compute: الطلبات المتزامنة لنفس المفتاح تنتظر حساباً واحداً (single-flight)
+
     القيود:
     • يُمسح عند إعادة تشغيل Backend
-    • محدود بذاكرة السيرفر
+    • الحجم تقديري (طول JSON للقيمة)
     """
-    
-    def __init__(self, ttl_minutes: int = 60):
-        self.cache = {}
-        self.ttl = timedelta(minutes=ttl_minutes)
-        print(f"✅ Simple Cache initialized (TTL: {ttl_minutes} دقيقة)")
-    
+
+    def __init__(
+        self,
+        ttl_minutes: int = 60,
+        max_entries: int = 1000,
+        max_bytes: int = 256 * 1024 * 1024,
+        sweep_interval_seconds: float = 60.0,
+    ):
+        self.cache: "OrderedDict[str, _Entry]" = OrderedDict()
+        self.ttl_seconds = ttl_minutes * 60
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.counters = {
+            "hits": 0, "misses": 0, "sets": 0, "evictions": 0, "expired": 0, "rejected": 0,
+            "computed": 0, "coalesced": 0,
+        }
+        self._inflight: Dict[str, "asyncio.Future"] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sweeper = None
+        if sweep_interval_seconds > 0:
+            self._sweeper = threading.Thread(
+                target=self._sweep_loop, args=(sweep_interval_seconds,),
+                name="simple-cache-sweep", daemon=True,
+            )
+            self._sweeper.start()
+        logger.info(
+            "Simple Cache initialized (TTL: %s دقيقة، حد: %d إدخال / %.0f MB)",
+            ttl_minutes, max_entries, max_bytes / (1024 * 1024),
+        )
+
     def _make_key(self, query: str, filters: dict) -> str:
         """إنشاء مفتاح فريد"""
         data = json.dumps({"q": query, "f": filters}, sort_keys=True, ensure_ascii=False)
         return hashlib.md5(data.encode()).hexdigest()
-    
+
     def get(self, query: str, filters: dict = None) -> Optional[Any]:
         """الحصول من Cache"""
-        
+
         key = self._make_key(query, filters or {})
-        
-        if key in self.cache:
-            entry = self.cache[key]
-            
-            # تحقق من الصلاحية
-            if datetime.now() - entry["timestamp"] < self.ttl:
-                print(f"   ✅ Cache Hit: {query[:30]}...")
-                return entry["data"]
-            else:
+
+        with self._lock:
+            entry = self.cache.get(key)
+            if entry is not None:
+                # تحقق من الصلاحية
+                if time.monotonic() < entry.expires_at:
+                    self.cache.move_to_end(key)
+                    self.counters["hits"] += 1
+                    logger.debug("Cache Hit: %s...", query[:30])
+                    return entry.data
                 # منتهي الصلاحية
-                del self.cache[key]
-        
+                self._remove(key)
+                self.counters["expired"] += 1
+            self.counters["misses"] += 1
+
         return None
-    
+
     def set(self, query: str, data: Any, filters: dict = None):
-        """الحفظ في Cache"""
-        
+        """الحفظ في Cache — يُطرد الأقدم استخداماً حتى يعود الحجم تحت الحدود"""
+
         key = self._make_key(query, filters or {})
-        
-        self.cache[key] = {
-            "data": data,
-            "timestamp": datetime.now()
-        }
-        
-        print(f"   💾 Cache Set: {query[:30]}...")
-    
-    def clear_expired(self):
+        size = _estimate_size(data)
+
+        with self._lock:
+            if key in self.cache:
+                self._remove(key)
+            if size > self.max_bytes or self.max_entries <= 0:
+                self.counters["rejected"] += 1
+                logger.debug("Cache Reject (%d bytes): %s...", size, query[:30])
+                return
+            while self.cache and (
+                len(self.cache) >= self.max_entries or self.total_bytes + size > self.max_bytes
+            ):
+                self._remove(next(iter(self.cache)))
+                self.counters["evictions"] += 1
+            self.cache[key] = _Entry(data, time.monotonic() + self.ttl_seconds, size)
+            self.total_bytes += size
+            self.counters["sets"] += 1
+
+        logger.debug("Cache Set: %s...", query[:30])
+
+    async def get_or_compute(
+        self,
+        query: str,
+        compute: Callable[[], Awaitable[Any]],
+        filters: dict = None,
+        cache_if: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """
+        من Cache، أو حساب واحد مشترك: الطلبات المتزامنة لنفس المفتاح تنتظر
+        نفس الحساب الجاري وتستلم نتيجته (أو استثناءه) — counters["coalesced"]
+        = عدد الحسابات المكررة التي تم تجنّبها.
+
+        cache_if: شرط حفظ النتيجة (مثلاً: ليست نتيجة خطأ) — الافتراضي: تُحفظ دائماً
+        """
+        cached = self.get(query, filters)
+        if cached is not None:
+            return cached
+
+        key = self._make_key(query, filters or {})
+        task = self._inflight.get(key)
+        if task is not None:
+            self.counters["coalesced"] += 1
+            logger.debug("Cache Coalesced: %s...", query[:30])
+        else:
+            # الحساب مهمة مستقلة: إلغاء أي مستدعٍ (حتى الأول) لا يلغيه ولا يُلغي الآخرين
+            task = asyncio.ensure_future(self._compute(query, compute, filters, cache_if))
+            self._inflight[key] = task
+            self.counters["computed"] += 1
+            task.add_done_callback(lambda t: self._computed(key, t))
+        return await asyncio.shield(task)
+
+    async def _compute(self, query, compute, filters, cache_if) -> Any:
+        result = await compute()
+        if result is not None and (cache_if is None or cache_if(result)):
+            self.set(query, result, filters)
+        return result
+
+    def _computed(self, key: str, task: "asyncio.Future") -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # الاستثناء يُسلَّم للمنتظرين؛ لا تحذير "never retrieved" إن أُلغي كلهم
+        if not task.cancelled():
+            task.exception()
+
+    def clear_expired(self) -> int:
         """حذف المنتهية"""
-        now = datetime.now()
-        expired = [k for k, v in self.cache.items() if now - v["timestamp"] >= self.ttl]
-        
-        for k in expired:
-            del self.cache[k]
-        
+        now = time.monotonic()
+        with self._lock:
+            expired = [k for k, v in self.cache.items() if now >= v.expires_at]
+            for k in expired:
+                self._remove(k)
+            self.counters["expired"] += len(expired)
+
         if expired:
-            print(f"   🧹 تم حذف {len(expired)} إدخالات منتهية")
-    
+            logger.debug("تم حذف %d إدخالات منتهية", len(expired))
+        return len(expired)
+
+    def clear(self):
+        with self._lock:
+            self.cache.clear()
+            self.total_bytes = 0
+
+    def close(self):
+        """إيقاف الكنس الدوري"""
+        self._stop.set()
+        if self._sweeper is not None:
+            self._sweeper.join(timeout=1)
+
+    def metrics(self) -> Dict[str, Any]:
+        """عدّادات للمراقبة (hits/misses/evictions/...) + الحجم الحالي"""
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": round(self.counters["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": len(self.cache),
+                "bytes": self.total_bytes,
+                "in_flight": len(self._inflight),
+            }
+
     def stats(self) -> dict:
         """إحصائيات"""
         return {
             "total_entries": len(self.cache),
-            "ttl_minutes": self.ttl.total_seconds() / 60
+            "ttl_minutes": self.ttl_seconds / 60,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            **self.metrics(),
         }
 
+    def _remove(self, key: str):
+        entry = self.cache.pop(key)
+        self.total_bytes -= entry.size
+
+    def _sweep_loop(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.clear_expired()
+            except Exception as e:  # الكنس لا يُسقط العملية
+                logger.warning("Cache sweep: %s", e)
+
+
+def _estimate_size(data: Any) -> int:
+    """حجم تقديري بالبايت — طول JSON (UTF-8)، أو sys.getsizeof لما لا يُسلسَل"""
+    try:
+        return len(json.dumps(data, ensure_ascii=False, default=str).encode("utf-8"))
+    except (TypeError, ValueError):
+        return sys.getsizeof(data)
@@ -2,14 +2,18 @@
 Smart Distributor - يُوزّع فقط على الجداول الجاهزة
 """
 
+import argparse
 import asyncio
 import json
+import os
 from google.cloud import bigquery
-from transformers import AutoTokenizer, AutoModel
-import torch
 from datetime import datetime
 import logging
 
+from batched_encoder import BatchedEncoder
+from keyword_classifier import KeywordClassifier
+from work_watermark import DEFAULT_STATE_PATH, LeaseLost, ShardBusy, WorkWatermark, fetch_shard_batch
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
@@ -21,6 +25,11 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+KEYWORDS_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "keyword_categories.json")
+
+CHUNKS_TABLE = "iqraa-12.diwan_iqraa_v2.openiti_chunks"
+CLASSIFICATIONS_TABLE = "iqraa-12.diwan_iqraa_v2.classifications_unified"
+
 
 class SmartDistributor:
     """موزع ذكي - يتجنب الجداول المملوءة"""
@@ -66,13 +75,31 @@ class SmartDistributor:
         "غير محدد": "02_analysis_results"
     }
     
-    def __init__(self):
+    def __init__(
+        self,
+        inference_batch_size: int = 32,
+        threads: int = None,
+        quantize: bool = False,
+        shard: int = 0,
+        shards: int = 1,
+        state_path: str = DEFAULT_STATE_PATH,
+        keywords_config: str = KEYWORDS_CONFIG,
+    ):
         self.bq_client = bigquery.Client(project="iqraa-12")
         
+        # المجالات → الكلمات المفتاحية (الترتيب = الأولوية) — مطابقة في مرور واحد
+        self.classifier = KeywordClassifier.from_config(keywords_config)
+        
+        # اختيار العمل: علامة chunk_id محلية لكل شريحة بدل NOT IN على classifications_unified
+        self.watermark = WorkWatermark(state_path, job="smart_distributor", shard=shard, shards=shards)
+        if not self.watermark.claim():
+            raise ShardBusy(f"الشريحة {shard}/{shards} محجوزة لعامل آخر")
+        
         logger.info("📥 تحميل CAMeLBERT-CA...")
-        self.tokenizer = AutoTokenizer.from_pretrained("CAMeL-Lab/bert-base-arabic-camelbert-ca")
-        self.model = AutoModel.from_pretrained("CAMeL-Lab/bert-base-arabic-camelbert-ca")
-        self.model.eval()
+        # استدلال على دفعات (حشو ديناميكي + تجميع حسب الطول) بدل نص واحد في كل تمرير
+        self.encoder = BatchedEncoder.from_pretrained(
+            batch_size=inference_batch_size, threads=threads, quantize=quantize
+        )
         
         self.tracker = {
             "started_at": datetime.now().isoformat(),
@@ -96,83 +123,37 @@ class SmartDistributor:
         return "iqraa-12.diwan_iqraa_v2.02_analysis_results"
     
     def simple_classify(self, text: str) -> str:
-        """تصنيف بسيط"""
-        text_lower = text.lower()
-        
-        # تصنيف موسع
-        if any(w in text_lower for w in ["ضريبة", "مجاعة", "جباية", "خراج"]):
-            return "اقتصاد"
-        elif any(w in text_lower for w in ["مدينة", "شارع", "سوق", "حي"]):
-            return "حضري"
-        elif any(w in text_lower for w in ["بناء", "مسجد", "دار", "قصر"]):
-            return "عمارة"
-        elif any(w in text_lower for w in ["تاجر", "تجارة", "بيع", "شراء"]):
-            return "تجارة"
-        elif any(w in text_lower for w in ["قاضي", "حكم", "دعوى", "شهادة"]):
-            return "قضاء"
-        elif any(w in text_lower for w in ["حرب", "غزو", "جهاد", "قتال"]):
-            return "حرب"
-        elif any(w in text_lower for w in ["بحر", "سفينة", "ميناء"]):
-            return "بحري"
-        elif any(w in text_lower for w in ["عيد", "احتفال", "مولد"]):
-            return "احتفالات"
-        elif any(w in text_lower for w in ["طعام", "أكل", "طبخ"]):
-            return "طعام"
-        elif any(w in text_lower for w in ["ثوب", "نسيج", "حياكة"]):
-            return "نسيج"
-        elif any(w in text_lower for w in ["موسيقى", "غناء", "آلة"]):
-            return "موسيقى"
-        elif any(w in text_lower for w in ["عطر", "بخور", "طيب"]):
-            return "عطور"
-        elif any(w in text_lower for w in ["شرطة", "حراسة", "دورية"]):
-            return "شرطة"
-        elif any(w in text_lower for w in ["موت", "دفن", "جنازة"]):
-            return "موت"
-        elif any(w in text_lower for w in ["زواج", "نكاح", "عرس"]):
-            return "زواج"
-        elif any(w in text_lower for w in ["طفل", "صبي", "لعب"]):
-            return "طفولة"
-        elif any(w in text_lower for w in ["طب", "دواء", "مرض"]):
-            return "صحة"
-        elif any(w in text_lower for w in ["حمام", "غسل", "نظافة"]):
-            return "حمامات"
-        elif any(w in text_lower for w in ["سحر", "شعوذة", "تنجيم"]):
-            return "سحر"
-        elif any(w in text_lower for w in ["موسم", "فصل", "مناخ"]):
-            return "مواسم"
-        else:
-            return "غير محدد"
+        """تصنيف بسيط — أول مجال (بترتيب keyword_categories.json) فيه كلمة من النص"""
+        return self.classifier.first_match(text, default="غير محدد")
     
     async def process_and_distribute_batch(self, batch_size=1000):
         """معالجة وتوزيع ذكي"""
         
-        query = f"""
-        SELECT chunk_id, record_id, text
-        FROM `iqraa-12.diwan_iqraa_v2.openiti_chunks`
-        WHERE chunk_id NOT IN (
-            SELECT chunk_id FROM `iqraa-12.diwan_iqraa_v2.classifications_unified`
+        # الدفعة التالية بعد علامة الشريحة — done: صفوف لها تصنيف سابق (ترحيل من NOT IN)
+        rows, done = fetch_shard_batch(
+            self.bq_client, self.watermark, CHUNKS_TABLE, CLASSIFICATIONS_TABLE, batch_size
         )
-        LIMIT {batch_size}
-        """
-        
-        rows = list(self.bq_client.query(query).result())
         
         if not rows:
             logger.info("✅ كل النصوص مُعالجة!")
             return False
         
-        logger.info(f"�� معالجة وتوزيع {len(rows)} نص...")
+        if done:
+            logger.info(f"⏭️ {len(done)} نص مُصنَّف سابقاً — تخطٍّ")
+        pending = [row for row in rows if row.chunk_id not in done]
+        
+        logger.info(f"�� معالجة وتوزيع {len(pending)} نص...")
         
         processed_results = []
         distribution_map = {}
         
-        for row in rows:
+        # معالجة — الدفعة كلها في استدلال واحد مُجمَّع؛ النص غير الصالح (NULL) → None لصفه فقط
+        outputs = self.encoder.encode([row.text[:512] if isinstance(row.text, str) else None for row in pending])
+        
+        for row, output in zip(pending, outputs):
             try:
-                # معالجة
-                inputs = self.tokenizer(row.text[:512], return_tensors="pt", truncation=True, max_length=512)
-                
-                with torch.no_grad():
-                    outputs = self.model(**inputs)
+                if output is None:
+                    raise RuntimeError(f"CAMeLBERT فشل: {row.chunk_id}")
                 
                 # تصنيف
                 domain = self.simple_classify(row.text)
@@ -202,19 +183,26 @@ class SmartDistributor:
             except Exception as e:
                 logger.error(f"❌ خطأ: {e}")
         
-        # حفظ في classifications_unified
+        # حفظ في classifications_unified — row_ids: إعادة دفعة بعد انقطاع لا تُكرر الصفوف
         if processed_results:
-            self.bq_client.insert_rows_json(
-                "iqraa-12.diwan_iqraa_v2.classifications_unified",
-                processed_results
+            errors = self.bq_client.insert_rows_json(
+                CLASSIFICATIONS_TABLE,
+                processed_results,
+                row_ids=[r["chunk_id"] for r in processed_results],
             )
+            if errors:
+                # العلامة لا تتقدم: الدفعة تُعاد في الاستدعاء التالي
+                logger.error(f"❌ فشل الحفظ في classifications_unified: {errors[:1]}")
+                return True
         
         # التوزيع على الجداول الفارغة فقط
         for domain, results in distribution_map.items():
             target_table = self.get_target_table(domain)
             
             try:
-                errors = self.bq_client.insert_rows_json(target_table, results)
+                errors = self.bq_client.insert_rows_json(
+                    target_table, results, row_ids=[r["chunk_id"] for r in results]
+                )
                 
                 if not errors:
                     self.tracker["distributed"] += len(results)
@@ -225,9 +213,13 @@ class SmartDistributor:
             except Exception as e:
                 logger.error(f"   ❌ خطأ {domain}: {e}")
         
+        # تقدّم العلامة بعد الحفظ (المفتاح الأخير في الدفعة المرتبة)
+        self.watermark.advance(rows[-1].chunk_id, len(processed_results))
+        
         # تقرير
         if self.tracker["processed"] % 10000 == 0:
             logger.info(f"📊 معالج: {self.tracker['processed']:,} | موزع: {self.tracker['distributed']:,} | متخطى: {self.tracker['skipped']:,}")
+            logger.info(f"⚡ CAMeLBERT texts/s (حسب حجم الدفعة): {self.encoder.throughput()}")
         
         return True
     
@@ -236,16 +228,33 @@ class SmartDistributor:
         logger.info(f"   الهدف: 157,870,756 نص")
         logger.info(f"   التوزيع: على الجداول الفارغة (179) فقط")
         
-        while True:
-            has_more = await self.process_and_distribute_batch(1000)
-            
-            if not has_more:
-                break
+        logger.info(f"   الشريحة: {self.watermark.shard + 1}/{self.watermark.shards} — من بعد '{self.watermark.position}'")
+        
+        try:
+            while True:
+                has_more = await self.process_and_distribute_batch(1000)
+                
+                if not has_more:
+                    break
+        except LeaseLost as e:
+            logger.error(f"❌ {e}")
+            return
+        finally:
+            self.watermark.release()
         
         logger.info("✅ اكتمل!")
 
 
 if __name__ == "__main__":
-    distributor = SmartDistributor()
+    parser = argparse.ArgumentParser(description="Smart Distributor")
+    parser.add_argument("--shard", type=int, default=0, help="رقم شريحة هذا العامل")
+    parser.add_argument(
+        "--shards", type=int, default=1,
+        help="عدد الشرائح (العمّال) — تغييره يبدأ من أصغر علامة للتقسيم السابق (انظر work_watermark)",
+    )
+    parser.add_argument("--state", default=DEFAULT_STATE_PATH, help="ملف العلامات المحلي")
+    args = parser.parse_args()
+    
+    distributor = SmartDistributor(shard=args.shard, shards=args.shards, state_path=args.state)
     asyncio.run(distributor.run())
 
@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# الوحدات هنا تُستورد كوحدات مستقلة (from claude_client import ...) — المجلد الأب على sys.path
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
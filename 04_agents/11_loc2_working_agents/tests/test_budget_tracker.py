@@ -0,0 +1,55 @@
+import atexit
+
+from budget_tracker import BudgetTracker
+
+
+def _crash(tracker: BudgetTracker):
+    """kill -9 بعد آخر flush: لا close() ولا ضغط"""
+    tracker._stop.set()
+    tracker._flusher.join()
+    tracker.flush()
+    atexit.unregister(tracker.close)
+
+
+def _open(path) -> BudgetTracker:
+    return BudgetTracker(str(path), limit=1000, flush_interval=60)
+
+
+def test_torn_wal_tail_survives_crash_restart_crash(tmp_path):
+    budget = tmp_path / "budget.json"
+
+    first = _open(budget)
+    for _ in range(3):
+        first.add_cost("claude_opus", 0.5)
+        first.increment_processed()
+    _crash(first)
+    # انقطاع أثناء كتابة السطر الأخير
+    with open(first.wal_file, "a") as f:
+        f.write('{"kind": "cost", "categ')
+
+    second = _open(budget)
+    assert second.data["budget_used"] == 1.5
+    assert second.data["texts_processed"] == 3
+    second.add_cost("claude_opus", 0.5)
+    second.increment_failed()
+    _crash(second)
+
+    third = _open(budget)
+    assert third.data["budget_used"] == 2.0
+    assert third.data["costs"] == {"claude_opus": 2.0}
+    assert third.data["texts_processed"] == 3
+    assert third.data["texts_failed"] == 1
+    third.close()
+    atexit.unregister(third.close)
+
+
+def test_replay_compacts_wal(tmp_path):
+    tracker = _open(tmp_path / "budget.json")
+    tracker.add_cost("claude_opus", 0.5)
+    _crash(tracker)
+
+    reopened = _open(tmp_path / "budget.json")
+    assert reopened.wal_file.stat().st_size == 0
+    assert reopened.data["wal_seq"] == 1
+    reopened.close()
+    atexit.unregister(reopened.close)
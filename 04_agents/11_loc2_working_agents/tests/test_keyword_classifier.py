@@ -0,0 +1,33 @@
+import random
+from pathlib import Path
+
+from keyword_classifier import KeywordClassifier, _first_match_reference
+
+ROOT = Path(__file__).resolve().parents[1]
+REPO = ROOT.parents[1]
+VENDORED = (
+    REPO / "06_harvested_repos" / "iqraa-velvet-dashboard" / "pipeline" / "config" / "pipeline" / "config"
+    / "pipeline" / "config" / "pipeline" / "ingestion" / "pipeline" / "processing" / "pipeline"
+    / "classification" / "keyword_classifier.py"
+)
+
+
+def test_vendored_copy_in_sync():
+    """velvet-dashboard يحمل نسخة مطابقة — أي تعديل هنا يُنسخ هناك"""
+    assert VENDORED.read_bytes() == (ROOT / "keyword_classifier.py").read_bytes()
+
+
+def test_first_match_matches_if_elif_chain():
+    categories = {
+        "حديث": ["حدثنا", "رواه"],
+        "فقه": ["حكم", "فتوى"],
+        "قضاء": {"keywords": ["قاضي", "حكم"], "weight": 2.0},
+        "اقتصاد": ["سوق", "مال"],
+    }
+    classifier = KeywordClassifier(categories)
+    words = ["حدثنا", "حكم", "قاضي", "سوق", "مال", "كلام", "الحكمة", "أسواق"]
+    rng = random.Random(7)
+    for _ in range(500):
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(0, 6)))
+        assert classifier.first_match(text, "غير محدد") == _first_match_reference(text, categories, "غير محدد")
+    assert classifier.first_match("", "غير محدد") == "غير محدد"
@@ -0,0 +1,33 @@
+from work_watermark import WorkWatermark
+
+
+def _run(path, shard, shards, last_key):
+    watermark = WorkWatermark(path, job="j", shard=shard, shards=shards)
+    assert watermark.claim()
+    watermark.advance(last_key, 1)
+    watermark.release()
+    return watermark
+
+
+def test_revisited_sharding_checks_output_of_newer_sharding(tmp_path):
+    path = str(tmp_path / "state.sqlite")
+    _run(path, 0, 1, "k100").close()
+    for shard, key in enumerate(["k500", "k480", "k490"]):
+        _run(path, shard, 3, key).close()
+
+    # 1 → 3 → 1: يكمل من علامته القديمة، وما عالجه التقسيم الأحدث يُطابَق مع المخرجات
+    again = WorkWatermark(path, job="j", shard=0, shards=1)
+    assert again.position == "k100"
+    assert again.legacy_until == "k500"
+    assert again.needs_output_check("k200")
+    assert not again.needs_output_check("k501")
+
+
+def test_new_sharding_starts_from_lowest_previous_watermark(tmp_path):
+    path = str(tmp_path / "state.sqlite")
+    for shard, key in enumerate(["k500", "k480", "k490"]):
+        _run(path, shard, 3, key).close()
+
+    resharded = WorkWatermark(path, job="j", shard=1, shards=2)
+    assert resharded.position == "k480"
+    assert resharded.legacy_until == "k500"
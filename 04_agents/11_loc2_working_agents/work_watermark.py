@@ -0,0 +1,370 @@
+"""
+Work Watermark - اختيار العمل التزايدي (بدل NOT IN على جدول النتائج)
+
+كل دفعة تُجلب بـ: chunk_id > آخر مفتاح مُعالَج ORDER BY chunk_id LIMIT n
+→ تكلفة الدفعة ثابتة مهما تقدّم العمل (لا إعادة مسح لجدول المخرجات المتنامي).
+
+• العلامة (watermark) محفوظة محلياً في SQLite، وتتقدم فقط بعد نجاح الحفظ
+• عدة عمّال: كل عامل يحجز شريحة (shard) منفصلة — FARM_FINGERPRINT(chunk_id) mod shards
+  — بعقد إيجار (lease): لا يعمل عاملان على نفس الشريحة، والشريحة المتروكة
+  (انتهى الإيجار) يأخذها عامل آخر ويكمل من علامتها
+• عدّادات إضافية لكل شريحة (stats، تُجمع مع advance) وعلامة اكتمال (finish)
+  — progress() يعيدها لكل الشرائح لدمجها في تقدّم كلي
+
+الترحيل من NOT IN (ناتج موجود لم يُعالَج بترتيب chunk_id):
+• أول دفعة لكل شريحة تحفظ legacy_until = أكبر chunk_id للشريحة في جدول المخرجات
+  (استعلام واحد لمرة واحدة)؛ كل دفعة مفاتيحها ≤ legacy_until تُطابَق مع جدول
+  المخرجات وتُتخطّى صفوفها المُعالَجة مسبقاً (anti-join بمعرفات الدفعة فقط)
+  — بعد تجاوز legacy_until لا مطابقة: الدفعة = استعلام المصدر وحده
+• أوقف المهمة القديمة (NOT IN) قبل التشغيل: ما تكتبه بعد legacy_until لا يُرى
+
+إعادة التقسيم (--shards مختلف): الشرائح الجديدة تبدأ من أصغر علامة للتقسيم السابق
+لنفس المهمة (كل ما قبلها مُعالَج في كل الشرائح)، وما بينها وبين علاماته الأكبر
+يُطابَق مع جدول المخرجات كما سبق — لا إعادة من '' ولا تكرار. العودة لعدد شرائح
+سبق استخدامه (1 → 3 → 1) تكمل من علامة الشريحة القديمة، مع رفع legacy_until إلى
+أكبر علامة لتقسيم عمل بعدها — ما عالجه ذلك التقسيم يُطابَق ولا يُعاد.
+"""
+
+from typing import Any, Dict, List, Optional
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATE_PATH = os.environ.get(
+    "DISTRIBUTOR_STATE", os.path.join(os.path.expanduser("~"), ".cache", "iqraa", "distribution_state.sqlite")
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS watermarks (
+    job         TEXT NOT NULL,
+    shards      INTEGER NOT NULL,
+    shard       INTEGER NOT NULL,
+    last_key    TEXT NOT NULL DEFAULT '',
+    legacy_until TEXT NOT NULL DEFAULT '',
+    seeded      INTEGER NOT NULL DEFAULT 0,
+    processed   INTEGER NOT NULL DEFAULT 0,
+    stats       TEXT NOT NULL DEFAULT '{}',
+    finished    INTEGER NOT NULL DEFAULT 0,
+    owner       TEXT,
+    lease_until REAL NOT NULL DEFAULT 0,
+    updated_at  REAL NOT NULL,
+    PRIMARY KEY (job, shards, shard)
+);
+"""
+
+# أعمدة أُضيفت بعد أول إصدار — تُضاف لملفات الحالة القديمة
+_ADDED_COLUMNS = {
+    "legacy_until": "TEXT NOT NULL DEFAULT ''",
+    "seeded": "INTEGER NOT NULL DEFAULT 0",
+    "stats": "TEXT NOT NULL DEFAULT '{}'",
+    "finished": "INTEGER NOT NULL DEFAULT 0",
+}
+
+
+class LeaseLost(RuntimeError):
+    """الشريحة أخذها عامل آخر (انتهى الإيجار)"""
+
+
+class ShardBusy(RuntimeError):
+    """الشريحة محجوزة لعامل آخر بإيجار ساري"""
+
+
+def merge_counts(total: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """جمع عدّادات (أرقام، وقواميس متداخلة مثل by_domain) في total"""
+    for key, value in delta.items():
+        if isinstance(value, dict):
+            merge_counts(total.setdefault(key, {}), value)
+        else:
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+class WorkWatermark:
+    """
+    علامة تقدّم شريحة واحدة.
+
+    Args:
+        job: اسم المهمة (جدول واحد لعدة مهام)
+        shard / shards: هذه الشريحة من أصل shards
+        lease_seconds: مدة الحجز — تُجدَّد مع كل advance()
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_STATE_PATH,
+        job: str = "smart_distributor",
+        shard: int = 0,
+        shards: int = 1,
+        lease_seconds: float = 600,
+        owner: Optional[str] = None,
+    ):
+        if not 0 <= shard < shards:
+            raise ValueError(f"shard يجب أن يكون بين 0 و {shards - 1}: {shard}")
+        self.path = path
+        self.job = job
+        self.shard = shard
+        self.shards = shards
+        self.lease_seconds = lease_seconds
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(watermarks)")}
+        for column, definition in _ADDED_COLUMNS.items():
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE watermarks ADD COLUMN {column} {definition}")
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            created = self._conn.execute(
+                "INSERT OR IGNORE INTO watermarks (job, shards, shard, updated_at) VALUES (?, ?, ?, ?)",
+                (job, shards, shard, time.time()),
+            ).rowcount
+            if created:
+                self._seed_from_previous_sharding()
+            else:
+                self._cover_newer_shardings()
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _seed_from_previous_sharding(self) -> None:
+        """شريحة جديدة لمهمة سبق تشغيلها بعدد شرائح آخر: البدء من أصغر علامة سابقة"""
+        previous = self._conn.execute(
+            "SELECT shards, COUNT(*), MIN(last_key), MAX(MAX(last_key), MAX(legacy_until))"
+            " FROM watermarks WHERE job = ? AND shards != ? GROUP BY shards",
+            (self.job, self.shards),
+        ).fetchall()
+        # تقسيم سابق مكتمل الشرائح فقط (شريحة لم تبدأ = علامتها '')
+        complete = [(low, high) for shards, count, low, high in previous if count == shards]
+        if not complete:
+            return
+        low = max(low for low, _ in complete)
+        high = max(high for _, high in complete)
+        self._conn.execute(
+            f"UPDATE watermarks SET last_key = ?, legacy_until = ? WHERE {self._where}",
+            (low, high, *self._key),
+        )
+        logger.info(
+            "شريحة %d/%d: من تقسيم سابق — بدء بعد '%s'، مطابقة المخرجات حتى '%s'",
+            self.shard, self.shards, low, high,
+        )
+
+    def _cover_newer_shardings(self) -> None:
+        """
+        عودة لعدد شرائح سبق استخدامه (1 → 3 → 1): ما عالجه تقسيم آخر بعد آخر تحديث لهذه
+        الشريحة قد يقع بعد علامتها — رفع legacy_until لأكبر علاماته فيُطابَق مع المخرجات
+        """
+        newer = self._conn.execute(
+            "SELECT MAX(MAX(last_key), MAX(legacy_until)) FROM watermarks"
+            " WHERE job = ? AND shards != ? AND updated_at > ("
+            f"SELECT updated_at FROM watermarks WHERE {self._where})",
+            (self.job, self.shards, *self._key),
+        ).fetchone()[0]
+        if not newer:
+            return
+        raised = self._conn.execute(
+            f"UPDATE watermarks SET legacy_until = ?, updated_at = ? WHERE {self._where} AND legacy_until < ?",
+            (newer, time.time(), *self._key, newer),
+        ).rowcount
+        if raised:
+            logger.info(
+                "شريحة %d/%d: تقسيم آخر عمل بعدها — مطابقة المخرجات حتى '%s'", self.shard, self.shards, newer
+            )
+
+    @property
+    def _where(self) -> str:
+        return "job = ? AND shards = ? AND shard = ?"
+
+    @property
+    def _key(self) -> tuple:
+        return (self.job, self.shards, self.shard)
+
+    def claim(self) -> bool:
+        """حجز الشريحة — False إن كان يحجزها عامل آخر بإيجار ساري"""
+        now = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            owner, lease_until = self._conn.execute(
+                f"SELECT owner, lease_until FROM watermarks WHERE {self._where}", self._key
+            ).fetchone()
+            if owner not in (None, self.owner) and lease_until > now:
+                self._conn.execute("ROLLBACK")
+                return False
+            self._conn.execute(
+                f"UPDATE watermarks SET owner = ?, lease_until = ?, updated_at = ? WHERE {self._where}",
+                (self.owner, now + self.lease_seconds, now, *self._key),
+            )
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        if owner not in (None, self.owner):
+            logger.warning("شريحة %d/%d: استلام من %s (انتهى الإيجار)", self.shard, self.shards, owner)
+        return True
+
+    @property
+    def position(self) -> str:
+        """آخر chunk_id مُعالَج ('' = من البداية)"""
+        return self._conn.execute(
+            f"SELECT last_key FROM watermarks WHERE {self._where}", self._key
+        ).fetchone()[0]
+
+    @property
+    def seeded(self) -> bool:
+        """هل حُسب legacy_until من جدول المخرجات (مرة واحدة لكل شريحة)"""
+        return bool(self._conn.execute(
+            f"SELECT seeded FROM watermarks WHERE {self._where}", self._key
+        ).fetchone()[0])
+
+    @property
+    def legacy_until(self) -> str:
+        """المفاتيح ≤ هذا قد يكون لها ناتج سابق ('' = لا شيء)"""
+        return self._conn.execute(
+            f"SELECT legacy_until FROM watermarks WHERE {self._where}", self._key
+        ).fetchone()[0]
+
+    def seed(self, legacy_until: Optional[str]) -> None:
+        """تسجيل أكبر مفتاح له ناتج سابق في هذه الشريحة"""
+        self._conn.execute(
+            f"UPDATE watermarks SET legacy_until = MAX(legacy_until, ?), seeded = 1 WHERE {self._where}",
+            (legacy_until or "", *self._key),
+        )
+        logger.info("شريحة %d/%d: مطابقة المخرجات السابقة حتى '%s'", self.shard, self.shards, self.legacy_until)
+
+    def needs_output_check(self, first_key: str) -> bool:
+        """هل قد يكون لمفاتيح دفعة تبدأ بـ first_key ناتج سابق"""
+        return first_key <= self.legacy_until
+
+    def advance(self, last_key: str, count: int, stats: Optional[Dict[str, Any]] = None) -> None:
+        """
+        تقديم العلامة بعد نجاح حفظ الدفعة — يجدد الإيجار؛ LeaseLost إن فُقد الحجز.
+        stats: عدّادات الدفعة تُضاف لعدّادات الشريحة (merge_counts)
+        """
+        now = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._conn.execute(
+                f"SELECT stats FROM watermarks WHERE {self._where} AND owner = ?", (*self._key, self.owner)
+            ).fetchone()
+            if row is None:
+                raise LeaseLost(f"شريحة {self.shard}/{self.shards} لم تعد محجوزة لـ {self.owner}")
+            merged = merge_counts(json.loads(row[0]), stats) if stats else json.loads(row[0])
+            self._conn.execute(
+                f"UPDATE watermarks SET last_key = MAX(last_key, ?), processed = processed + ?, stats = ?,"
+                f" lease_until = ?, updated_at = ? WHERE {self._where}",
+                (last_key, count, json.dumps(merged, ensure_ascii=False),
+                 now + self.lease_seconds, now, *self._key),
+            )
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def finish(self) -> None:
+        """الشريحة اكتملت (لا صفوف بعد العلامة)"""
+        self._conn.execute(
+            f"UPDATE watermarks SET finished = 1, updated_at = ? WHERE {self._where} AND owner = ?",
+            (time.time(), *self._key, self.owner),
+        )
+
+    @property
+    def finished(self) -> bool:
+        return bool(self._conn.execute(
+            f"SELECT finished FROM watermarks WHERE {self._where}", self._key
+        ).fetchone()[0])
+
+    def release(self) -> None:
+        self._conn.execute(
+            f"UPDATE watermarks SET owner = NULL, lease_until = 0 WHERE {self._where} AND owner = ?",
+            (*self._key, self.owner),
+        )
+
+    def progress(self) -> List[Dict[str, Any]]:
+        """تقدّم كل شرائح المهمة"""
+        rows = self._conn.execute(
+            "SELECT shard, last_key, legacy_until, processed, stats, finished, owner, lease_until, updated_at"
+            " FROM watermarks WHERE job = ? AND shards = ? ORDER BY shard",
+            (self.job, self.shards),
+        ).fetchall()
+        now = time.time()
+        return [
+            {"shard": shard, "last_key": last_key, "legacy_until": legacy_until, "processed": processed,
+             "stats": json.loads(stats), "finished": bool(finished),
+             "owner": owner if lease_until > now else None, "updated_at": updated_at}
+            for shard, last_key, legacy_until, processed, stats, finished, owner, lease_until, updated_at in rows
+        ]
+
+    def close(self):
+        self._conn.close()
+
+
+# ─────────────────────────────────────────────
+# BigQuery: الدفعة التالية للشريحة
+# ─────────────────────────────────────────────
+
+SHARD_FILTER = "MOD(ABS(FARM_FINGERPRINT(chunk_id)), @shards) = @shard"
+
+
+def fetch_shard_batch(
+    client,
+    watermark: WorkWatermark,
+    source_table: str,
+    output_table: str,
+    batch_size: int,
+    columns: str = "chunk_id, record_id, text",
+):
+    """
+    الدفعة التالية بعد علامة الشريحة: (rows, done)
+    done = معرفات الدفعة التي لها صف في output_table (ناتج سابق) — تُتخطّى،
+    والعلامة تتقدم فوقها كالمعتاد (rows[-1].chunk_id).
+    """
+    from google.cloud import bigquery
+
+    shard_params = [
+        bigquery.ScalarQueryParameter("shards", "INT64", watermark.shards),
+        bigquery.ScalarQueryParameter("shard", "INT64", watermark.shard),
+    ]
+    if not watermark.seeded:
+        # مرة واحدة لكل شريحة: أكبر مفتاح مُعالَج قبل العلامات (مثلاً بـ NOT IN)
+        seed_sql = f"SELECT MAX(chunk_id) AS last_key FROM `{output_table}` WHERE {SHARD_FILTER}"
+        result = client.query(seed_sql, job_config=bigquery.QueryJobConfig(query_parameters=shard_params)).result()
+        watermark.seed(next(iter(result)).last_key)
+
+    query = f"""
+        SELECT {columns}
+        FROM `{source_table}`
+        WHERE chunk_id > @after
+          AND {SHARD_FILTER}
+        ORDER BY chunk_id
+        LIMIT {int(batch_size)}
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter("after", "STRING", watermark.position), *shard_params,
+    ])
+    rows = list(client.query(query, job_config=job_config).result())
+    if not rows or not watermark.needs_output_check(rows[0].chunk_id):
+        return rows, set()
+
+    # anti-join على معرفات الدفعة فقط (النطاق يقلّص المسح إن كان الجدول مُجمَّعاً بـ chunk_id)
+    check_sql = f"""
+        SELECT DISTINCT chunk_id
+        FROM `{output_table}`
+        WHERE chunk_id BETWEEN @first AND @last
+          AND chunk_id IN UNNEST(@ids)
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter("first", "STRING", rows[0].chunk_id),
+        bigquery.ScalarQueryParameter("last", "STRING", rows[-1].chunk_id),
+        bigquery.ArrayQueryParameter("ids", "STRING", [row.chunk_id for row in rows]),
+    ])
+    done = {row.chunk_id for row in client.query(check_sql, job_config=job_config).result()}
+    return rows, done
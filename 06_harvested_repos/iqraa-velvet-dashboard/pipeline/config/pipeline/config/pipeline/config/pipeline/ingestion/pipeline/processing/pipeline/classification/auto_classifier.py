@@ -5,12 +5,13 @@
 """
 import os
 import json
-import re
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Tuple, Union
 from collections import defaultdict
 from datetime import datetime
 
+from keyword_classifier import KeywordClassifier
+
 # المسارات
 CONFIG_PATH = Path("./pipeline/config/tables_schema.json")
 INPUT_PATH = Path(os.getenv("DATA_PROCESSED_PATH", "./data/processed/chunked"))
@@ -24,35 +25,16 @@ def load_categories() -> Dict:
         return schema.get("categories", {})
     return {}
 
-def classify_text(text: str, metadata: Dict, categories: Dict) -> List[Tuple[str, float]]:
-    """تصنيف النص بناءً على الكلمات المفتاحية"""
-    scores = defaultdict(float)
-    text_lower = text.lower()
+def classify_text(text: str, metadata: Dict, categories: Union[Dict, KeywordClassifier]) -> List[Tuple[str, float]]:
+    """تصنيف النص بناءً على الكلمات المفتاحية (مرور واحد: كل كلمة ×1، في العنوان +5، في المؤلف +3)"""
+    classifier = categories if isinstance(categories, KeywordClassifier) else KeywordClassifier(categories)
     
     title = metadata.get("book_id", "").lower()
     author = metadata.get("author_id", "").lower()
     
-    for cat_id, cat_info in categories.items():
-        keywords = cat_info.get("keywords", [])
-        
-        for keyword in keywords:
-            count = len(re.findall(keyword, text_lower))
-            scores[cat_id] += count * 1.0
-            
-            if keyword in title:
-                scores[cat_id] += 5.0
-            
-            if keyword in author:
-                scores[cat_id] += 3.0
-    
-    sorted_scores = sorted(scores.items(), key=lambda x: x[1], reverse=True)
-    
-    max_score = sorted_scores[0][1] if sorted_scores and sorted_scores[0][1] > 0 else 1
-    normalized = [(cat, score/max_score) for cat, score in sorted_scores if score > 0]
-    
-    return normalized[:3]
+    return classifier.top(text, n=3, fields=[(title, 5.0), (author, 3.0)])
 
-def classify_chunk(chunk: Dict, metadata: Dict, categories: Dict) -> Dict:
+def classify_chunk(chunk: Dict, metadata: Dict, categories: Union[Dict, KeywordClassifier]) -> Dict:
     """تصنيف جزء واحد"""
     classifications = classify_text(chunk["text"], metadata, categories)
     
@@ -65,7 +47,7 @@ def classify_chunk(chunk: Dict, metadata: Dict, categories: Dict) -> Dict:
         "primary_category": classifications[0][0] if classifications else "15_indexes"
     }
 
-def process_chunked_file(file_path: Path, categories: Dict, output_dir: Path) -> Dict:
+def process_chunked_file(file_path: Path, categories: Union[Dict, KeywordClassifier], output_dir: Path) -> Dict:
     """معالجة ملف مقطع"""
     with open(file_path, 'r', encoding='utf-8') as f:
         data = json.load(f)
@@ -108,7 +90,8 @@ def process_chunked_file(file_path: Path, categories: Dict, output_dir: Path) ->
 
 def classify_all(input_dir: Path = INPUT_PATH, output_dir: Path = OUTPUT_PATH):
     """تصنيف جميع الملفات"""
-    categories = load_categories()
+    # الكلمات المفتاحية تُجمَّع مرة واحدة لكل الملفات
+    categories = KeywordClassifier(load_categories())
     output_dir.mkdir(parents=True, exist_ok=True)
     
     files = list(input_dir.glob("*_chunks.json"))